@@ -22,7 +22,7 @@ setup(
         'geopandas >= 0.10.0',
         'numpy >= 1.21.2',
         'pandas >= 1.3.3',
-        'shapely >= 1.7.1',
+        'shapely >= 2.0',
         'rasterio >= 1.2',
         ],
     classifiers=[
@@ -56,6 +56,13 @@ levels_specs = {0: {"refine_ratio": 4,
 
 ease_crs = 6933
 geo_crs = 4326
+
+# EASE Grid v2 (EPSG:6933) projection parameters: Lambert cylindrical equal area on the
+#   WGS84 ellipsoid, with a standard parallel of 30N and central meridian of 0
+ease_proj_spec = {'a': 6378137.0,
+                  'f': 1.0 / 298.257223563,
+                  'lat_ts': 30.0,
+                  'lon_0': 0.0}
 mult_fac = [1, 4, 12, 36, 360, 3600, 36000]
 cell_scale_factors = np.array([1.0 / mf for mf in mult_fac])
 
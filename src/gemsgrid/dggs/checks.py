@@ -7,7 +7,11 @@ This software is released under an Apache 2.0 license. Further details about the
 
 from gemsgrid.logConfig import logger #, debug_logger
 import re
+
+import numpy as np
+
 from gemsgrid.constants import grid_spec, levels_specs
+from gemsgrid.dggs.packing import is_packed, _valid_packed_mask
 
 # compile re in advance, to make grid_id_to_geo more flexible
 # so that you don't have to have all gids of same levelo
@@ -78,6 +82,27 @@ def check_level(level, valid_levels = list(levels_specs.keys())):
     else:
         return True
 
+def check_memory_budget(n_bytes, memory_budget = None):
+    '''
+    Test if an (estimated) output size is within a memory budget
+
+    Parameters
+    ----------
+    n_bytes : int
+        The size of the output, such as returned by estimate.estimate_output_bytes.
+    memory_budget : int, optional
+        The memory budget in bytes. Default is None, no budget.
+
+    Returns
+    -------
+    results : boolean
+        Is the output within the memory budget?
+    '''
+    if memory_budget is None:
+        return True
+
+    return n_bytes <= memory_budget
+
 def check_gid_format(gid, gid_regexs = gid_regexs):
     '''
     Test if format of supplied gid is valid.
@@ -201,6 +226,33 @@ def check_gid_start_with(grid_id):
 ####
 #start of plural tests
 ####
+def check_lon_lat_range(lon, lat, grid_spec=grid_spec):
+    '''
+    Check that all values in lon, lat arrays are within specified ranges.
+
+    lon : numpy array
+        Array of longitude values to test.
+    lat : numpy array
+        Array of latitude values to test. Must be the same shape as lon.
+    grid_spec : dict
+        The dictionary specifiying the min/max lon, lat values.
+
+    Returns:
+    result : boolean
+        Are all lon, lat values within specified ranges?
+    '''
+    lon = np.asarray(lon)
+    lat = np.asarray(lat)
+
+    if lon.shape != lat.shape:
+        return False
+
+    # comparisons with NaN are False, so NaN coordinates fail the check as well
+    valid = ((lon >= grid_spec['geo']['min_x']) & (lon <= grid_spec['geo']['max_x']) &
+             (lat >= grid_spec['geo']['min_y']) & (lat <= grid_spec['geo']['max_y']))
+
+    return bool(valid.all())
+
 def check_coords_range(coords_lon_lat, grid_spec = grid_spec):
     '''
     Check that all lon, lat coordinate pair are within specified ranges.
@@ -215,6 +267,19 @@ def check_coords_range(coords_lon_lat, grid_spec = grid_spec):
     if not isinstance(coords_lon_lat, list):
         return False
 
+    if not all(isinstance(coord, (tuple, list)) for coord in coords_lon_lat):
+        return False
+
+    # check the whole set at once when the pairs form a regular (n, 2) array;
+    #   anything else falls back to checking coordinates one at a time
+    try:
+        coords = np.asarray(coords_lon_lat, dtype=float)
+    except (TypeError, ValueError):
+        coords = None
+
+    if coords is not None and coords.ndim == 2 and coords.shape[1] >= 2:
+        return check_lon_lat_range(coords[:, 0], coords[:, 1], grid_spec=grid_spec)
+
     valid = [check_coord_range(coord) for coord in coords_lon_lat]
 
     if not all(valid):
@@ -307,6 +372,22 @@ def check_grid_ids_starts_with(grid_ids):
     else:
         return True
 
+def check_packed_ids(grid_ids):
+    '''
+    Check that all packed integer grid IDs are valid.
+
+    grid_ids : numpy array
+        The array of packed grid IDs to test.
+
+    Returns:
+    result : boolean
+        Are all the packed grid IDs valid?
+    '''
+    if not is_packed(grid_ids):
+        return False
+
+    return bool(_valid_packed_mask(grid_ids).all())
+
 def validate_coords_lon_lat(coords_lon_lat):
     '''
     Run all the steps to check that lon, lat coordinate pairs.
@@ -341,14 +422,23 @@ def validate_grid_ids(grid_ids):
     '''
     Run all the steps to check that grid IDs are valid.
 
-    grid_ids : list
-        The list of grid IDs to test.
+    grid_ids : list or numpy array
+        The list of grid IDs to test, or a numpy array of packed integer grid IDs.
 
     Returns:
     boolean, data
         Did all the grid IDs in the list pass all the validation checks?
         data = error message
     '''
+    if is_packed(grid_ids):
+        if not check_packed_ids(grid_ids):
+            success = False
+            data = ['Grid IDs contain invalid indices']
+
+            return success, data
+
+        return True, None
+
     if not check_grid_ids_starts_with(grid_ids):
         success = False
         data = ['Grid IDs must start with \'L\'']
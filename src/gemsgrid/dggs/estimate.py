@@ -0,0 +1,147 @@
+'''
+Estimates of the number of cells, and the memory, of grid outputs.
+
+EASE Grid v2 is an equal area projection, so every cell of a level has the same area,
+and the cells of a polygon are about its area divided by the cell area. The estimates
+take milliseconds, and let a request that would exhaust memory be refused, or streamed,
+before any cell is generated.
+
+© Regents of the University of Minnesota. All rights reserved.
+This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
+'''
+import sys
+
+import numpy as np
+import shapely
+import geopandas as gpd
+
+from gemsgrid.constants import levels_specs, ease_crs
+from gemsgrid.dggs.polyfill import polygon_to_rowcol_runs
+from gemsgrid.dggs.transforms import project_geometry
+from gemsgrid.dggs.utils import shift_range_ease, load_geometry
+
+# the 'runs' method counts the cells at the finest level where a polygon spans at most
+#   this many rows, and scales the count to the target level
+max_sample_rows = 4096
+
+def _as_ease_geometries(geometry, source_crs=ease_crs):
+    '''
+    Array of shapely geometries in EASE Grid v2 coordinates, from WKT, WKB, a shapely
+    geometry, or a GeoSeries or GeoDataFrame (in its own CRS).
+    '''
+    if isinstance(geometry, (gpd.GeoSeries, gpd.GeoDataFrame)):
+        source_crs = ease_crs if geometry.crs is None else geometry.crs
+        geometry = geometry.geometry.values.to_numpy()
+    else:
+        geometry = np.array([load_geometry(geometry)], dtype=object)
+
+    if source_crs != ease_crs:
+        geometry = project_geometry(geometry, source_crs=source_crs, target_crs=ease_crs)
+
+    return geometry
+
+def _count_runs(polygon_ease, level):
+    '''
+    Number of cells of a level whose center is within a polygon, counted at a coarser
+    level when the polygon spans more than max_sample_rows rows.
+    '''
+    min_y, max_y = shapely.bounds(polygon_ease)[[1, 3]]
+    n_rows = (shift_range_ease(min_y, 'y') - shift_range_ease(max_y, 'y')) * \
+        levels_specs[0]['y_length'] / np.array([levels_specs[lv]['y_length'] for lv in range(level + 1)])
+
+    sample_level = max([lv for lv in range(level + 1) if n_rows[lv] <= max_sample_rows] or [0])
+    ratio = levels_specs[level]['n_col'] // levels_specs[sample_level]['n_col']
+
+    _, col_start, col_end = polygon_to_rowcol_runs(polygon_ease, level=sample_level)
+
+    return int((col_end - col_start).sum()) * ratio * ratio
+
+def estimate_cells(geometry=None, level=0, source_crs=ease_crs, predicate='centroid', method='area'):
+    '''
+    Estimate the number of cells of a polygon fill, or of the whole grid.
+
+    Parameters
+    ----------
+    geometry : WKT, WKB, shapely geometry, GeoSeries or GeoDataFrame, optional
+        Polygon(s) to estimate the fill of; the sum is returned for several polygons.
+        Default is None, the whole grid.
+    level : int
+        GEMS grid level of the cells.
+    source_crs : int
+        EPSG code of a WKT, WKB or shapely geometry. Default is 6933 (EASE Grid v2).
+    predicate : str
+        'centroid', 'intersects', 'contains' or 'fraction', as in ease_polygon_to_grid_ids.
+        Default is 'centroid'.
+    method : str
+        'area' for the polygon area divided by the cell area, or 'runs' for the exact
+        number of cells with their center within the polygon, counted at the finest level
+        where the polygon spans at most max_sample_rows rows. Both add the cells crossed by
+        the polygon boundary, half of them for 'intersects' and 'fraction', and remove half
+        of them for 'contains'. Default is 'area'.
+
+    Returns
+    -------
+    n_cells : int
+        Estimated number of cells.
+    '''
+    n_grid = levels_specs[level]['n_row'] * levels_specs[level]['n_col']
+    if geometry is None:
+        return n_grid
+
+    geometries = _as_ease_geometries(geometry, source_crs=source_crs)
+    geometries = geometries[~(shapely.is_missing(geometries) | shapely.is_empty(geometries))]
+
+    x_length = levels_specs[level]['x_length']
+    y_length = levels_specs[level]['y_length']
+
+    if method == 'runs':
+        n_cells = np.array([_count_runs(polygon, level) for polygon in geometries], dtype=np.float64)
+    else:
+        n_cells = shapely.area(geometries) / (x_length * y_length)
+
+    # a line of random direction crosses 4 / pi cells per cell length, on average
+    n_boundary = shapely.length(geometries) / x_length * 4 / np.pi
+    if predicate in ('intersects', 'fraction'):
+        n_cells = n_cells + n_boundary / 2
+    elif predicate == 'contains':
+        n_cells = n_cells - n_boundary / 2
+
+    return int(np.clip(np.ceil(n_cells), 0, n_grid).sum())
+
+def estimate_output_bytes(n_cells, level=0, packed=False, fraction=False, dtype=None):
+    '''
+    Estimate the memory of the output of n_cells cells.
+
+    Parameters
+    ----------
+    n_cells : int
+        Number of cells, such as returned by estimate_cells.
+    level : int
+        GEMS grid level of the cells, for the length of the grid ID strings.
+    packed : boolean
+        Grid IDs as a numpy array of packed 64-bit integers, rather than a list of strings.
+        Default is False.
+    fraction : boolean
+        A float64 fraction for each cell too. Default is False.
+    dtype : numpy dtype, optional
+        Raster cell values of this type instead of grid IDs, as written by
+        warp_raster_to_gems or disaggregate. Default is None.
+
+    Returns
+    -------
+    n_bytes : int
+        Estimated number of bytes.
+    '''
+    if dtype is not None:
+        return int(n_cells) * np.dtype(dtype).itemsize
+
+    if packed:
+        per_cell = np.dtype(np.int64).itemsize
+    else:
+        # a string object of 9 + 3 * level characters, and its pointer in the list
+        per_cell = sys.getsizeof('L' * (9 + 3 * level)) + np.dtype(np.intp).itemsize
+
+    if fraction:
+        per_cell += np.dtype(np.float64).itemsize
+
+    return int(n_cells) * per_cell
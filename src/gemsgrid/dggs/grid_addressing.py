@@ -6,24 +6,33 @@ This software is released under an Apache 2.0 license. Further details about the
 '''
 # import re
 
-from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 
 import numpy as np
+import pandas as pd
 
 # from geopandas import GeoSeries, GeoDataFrame
 import geopandas as gpd
-from shapely import wkt
+import shapely
 from shapely.geometry import Point#, Polygon
 
-from gemsgrid.constants import grid_spec, levels_specs, ease_crs, geo_crs, cell_scale_factors
+from gemsgrid.constants import grid_spec, levels_specs, ease_crs, geo_crs, cell_scale_factors, mult_fac
 
 from gemsgrid.dggs.utils import pairwise_circle, flatten
-from gemsgrid.dggs.utils import format_response, gen_point_grid, get_polygon_corners
+from gemsgrid.dggs.utils import format_response, get_polygon_corners, \
+    shift_range_ease, shift_range_grid_xy, bounds_to_polygons, load_geometry
 
 from gemsgrid.dggs.checks import check_level, validate_coords_lon_lat, validate_grid_ids, \
-    check_coords_range
+    check_coords_range, check_lon_lat_range, check_memory_budget
 from gemsgrid.dggs.transforms import coords_lon_lat_to_coords_ease, coords_ease_to_coords_grid,\
-    grid_xy_coord_to_ease_coord
+    grid_xy_coord_to_ease_coord, project_coords, project_geometry, rowcol_to_centroids, rowcol_to_bounds
+from gemsgrid.dggs.polyfill import polygon_to_rowcol_runs, runs_to_rowcol, polygon_to_compact_rowcol, \
+    polygon_to_rowcol_coverage, polygon_to_rowcol_tiles, coverage_predicates, line_to_rowcol
+from gemsgrid.dggs.estimate import estimate_cells, estimate_output_bytes
+from gemsgrid.dggs.packing import _digits_to_grid_ids, _digits_to_ints, _valid_digits_mask, _ints_to_digits, \
+    _rowcol_to_digits, _grid_ids_to_rowcol, _rowcol_to_grid_ids, is_packed, \
+    _compact_packed, _as_grid_id_list
 from gemsgrid.logConfig import logger
 
 ######
@@ -32,7 +41,8 @@ from gemsgrid.logConfig import logger
 #
 ######
 
-def geos_to_grid_ids(coords_lon_lat, level=0, levels_specs=levels_specs, source_crs = 4326, target_crs=ease_crs):
+def geos_to_grid_ids(coords_lon_lat, level=0, levels_specs=levels_specs, source_crs = 4326, target_crs=ease_crs,
+                     packed=False, use_proj=False, workers=None):
     '''
     Return the GEMS grid ID for the cell correpsonding with lon, lat pair.
 
@@ -40,10 +50,18 @@ def geos_to_grid_ids(coords_lon_lat, level=0, levels_specs=levels_specs, source_
     ----------
     coords_lon_lat : list
        List of longitude,latitude cooridnate pairs (lon, lat).
-    level _ int
+    level _ int or list
         The specific resolution in the heiararch for the corresponding grid cell. Default is 0, the coarsest resolution.
+        When a list of levels, the grid IDs of every level are returned in one pass, as a
+        dictionary of {level: grid IDs}.
     levels_specs : dictonary
         The dictionary with paratmer and config options. Default is 'levels_specs'
+    packed : boolean
+        Return the grid IDs as a numpy array of packed 64-bit integers. Default is False.
+    use_proj : boolean
+        Reproject with PROJ instead of the closed form EASE Grid v2 projection. Default is False.
+    workers : int, optional
+        Number of processes to split the coordinates across. Default is None, a single process.
 
     Returns
     -------
@@ -51,7 +69,8 @@ def geos_to_grid_ids(coords_lon_lat, level=0, levels_specs=levels_specs, source_
         The grid IDs of the cells for the cooridnates, at the specified resolution that correspond with (lon, lat)
     '''
 
-    if not check_level(level):
+    levels = level if isinstance(level, (list, tuple)) else [level]
+    if (len(levels) == 0) or not all(check_level(lv) for lv in levels):
         success = False
         data = ['The specified level is invalid.']
 
@@ -61,74 +80,391 @@ def geos_to_grid_ids(coords_lon_lat, level=0, levels_specs=levels_specs, source_
     if not success:
         return format_response(data, success)
 
-    coords_ease = coords_lon_lat_to_coords_ease(coords_lon_lat)
+    if len(coords_lon_lat) == 0:
+        data = np.empty(0, dtype=np.int64) if packed else []
+        if isinstance(level, (list, tuple)):
+            data = {lv: data.copy() for lv in levels}
+        return format_response(data, success)
+
+    coords_lon_lat = np.asarray(coords_lon_lat, dtype=float)
 
-    coords_grid = coords_ease_to_coords_grid(coords_ease)
+    response = lon_lat_to_grid_ids(lon=coords_lon_lat[:, 0], lat=coords_lon_lat[:, 1],
+                                   level=level, levels_specs=levels_specs,
+                                   source_crs=source_crs, target_crs=target_crs, packed=packed,
+                                   use_proj=use_proj, workers=workers)
+    if not response['success'] or packed:
+        return response
 
-    grid_ids = coords_grid.apply(lambda coord: _grid_xy_to_grid_id(coord, level = level))
+    data = response['result']['data']
+    if isinstance(data, dict):
+        return format_response({lv: grid_ids.tolist() for lv, grid_ids in data.items()}, success)
 
-    return format_response(grid_ids.tolist(), success)
+    return format_response(data.tolist(), success)
 
-def _gid_to_coord_ease(gid, cell_scale_factors  = cell_scale_factors, centroid_offset = 0.5):
+def lon_lat_to_grid_ids(lon, lat, level=0, levels_specs=levels_specs, source_crs=geo_crs,
+                        target_crs=ease_crs, dedupe=True, packed=False, use_proj=False, workers=None):
     '''
-    Convert GEMS grid cell ID to ease_x, ease_y cooridnates.
+    Return the GEMS grid IDs for arrays of longitude, latitude values.
+
+    This is the array-in/array-out counterpart of geos_to_grid_ids. All the coordinates are
+    reprojected at once, and the row/column index of every level is determined on the whole
+    array at once, rather than point by point. The IDs of several levels come from the same
+    projection and row/column indices, since a cell's ID contains the IDs of its ancestors.
 
     Parameters
     ----------
-    grid_id : String
-       GEMS grid cell ID.
+    lon : numpy array
+       Longitude values of the coordinates.
+    lat : numpy array
+       Latitude values of the coordinates. Must be the same shape as lon.
+    level : int or list
+        The specific resolution in the heiararch for the corresponding grid cell. Default is 0, the coarsest resolution.
+        When a list of levels, the grid IDs of every level are returned.
+    levels_specs : dictonary
+        The dictionary with paratmer and config options. Default is 'levels_specs'
+    dedupe : boolean
+        Identical coordinates are only projected and encoded once. Default is True.
+    packed : boolean
+        Return packed 64-bit integer grid IDs instead of strings. Default is False.
+    use_proj : boolean
+        Reproject with PROJ instead of the closed form EASE Grid v2 projection. Default is False.
+    workers : int, optional
+        Number of processes to split the coordinates across. The coordinates and grid IDs are
+        exchanged with the processes through shared memory. Default is None, a single process.
 
-    cell_scale_factors : numpy array
-       Array with the level scaling factors .
+    Returns
+    -------
+    grid_ids : dict
+        Numpy array with the grid IDs of the cells for the cooridnates, in the same order as lon, lat.
+        For a list of levels, a dictionary of {level: numpy array of grid IDs}.
+    '''
+    levels = level if isinstance(level, (list, tuple)) else [level]
+    if (len(levels) == 0) or not all(check_level(lv) for lv in levels):
+        success = False
+        data = ['The specified level is invalid.']
+
+        return format_response(data, success)
+
+    lon = np.asarray(lon, dtype=float).ravel()
+    lat = np.asarray(lat, dtype=float).ravel()
+
+    if not check_lon_lat_range(lon, lat):
+        success = False
+        data = f"""Lon range is {grid_spec['geo']['min_x']} :
+                {grid_spec['geo']['max_x']} ; lat range is {grid_spec['geo']['max_y']} :
+                {grid_spec['geo']['min_y']}"""
+
+        return format_response([data], success)
+
+    if (workers is not None) and (workers > 1) and (lon.shape[0] >= 2 * workers):
+        success, packed_ids = _parallel_lon_lat_to_ints(lon, lat, levels, workers, source_crs=source_crs,
+                                                        target_crs=target_crs, dedupe=dedupe,
+                                                        use_proj=use_proj)
+        if not success:
+            return format_response(packed_ids, success)
+
+        grid_ids = {}
+        for lv, ids in zip(levels, packed_ids):
+            if packed:
+                grid_ids[lv] = ids
+            else:
+                _, row_digits, col_digits = _ints_to_digits(ids, depth=lv)
+                grid_ids[lv] = _digits_to_grid_ids(row_digits, col_digits)
+
+        if not isinstance(level, (list, tuple)):
+            grid_ids = grid_ids[level]
+
+        return format_response(grid_ids, True)
+
+    # large batches of points (e.g. GPS fixes) often repeat coordinates. only the
+    #   unique pairs are projected and encoded, then mapped back to the input order
+    inverse = None
+    if dedupe and lon.shape[0] > 1:
+        unique_coords, inverse = np.unique(lon + 1j * lat, return_inverse=True)
+        lon = unique_coords.real
+        lat = unique_coords.imag
+
+    x_ease, y_ease = project_coords(lon, lat, source_crs, target_crs, use_proj=use_proj)
+
+    x_grid = shift_range_ease(np.asarray(x_ease), 'x')
+    y_grid = shift_range_ease(np.asarray(y_ease), 'y')
+
+    # the digits of the finest level hold the digits of all the coarser levels
+    row_digits, col_digits = _grid_xy_to_digits(x_grid, y_grid, level=max(levels))
+
+    if not _valid_digits_mask(row_digits, col_digits).all():
+        success = False
+        data = ['Coordinates map to cells outside of the grid.']
+
+        return format_response(data, success)
+
+    grid_ids = {}
+    for lv in levels:
+        if packed:
+            grid_ids[lv] = _digits_to_ints(row_digits[:lv + 1], col_digits[:lv + 1])
+        else:
+            grid_ids[lv] = _digits_to_grid_ids(row_digits[:lv + 1], col_digits[:lv + 1])
+
+        if inverse is not None:
+            grid_ids[lv] = grid_ids[lv][inverse.ravel()]
+
+    if not isinstance(level, (list, tuple)):
+        grid_ids = grid_ids[level]
+
+    return format_response(grid_ids, True)
+
+def _index_shared_slice(shm_in_name, shm_out_name, n, start, stop, levels, source_crs, target_crs,
+                        dedupe, use_proj):
+    '''
+    Index the coordinates start:stop of the shared lon, lat buffer into the shared grid ID buffer.
+
+    Runs in a worker process of _parallel_lon_lat_to_ints.
+
+    Returns
+    ----------
+    error_message : list
+        None if successful, otherwise the error message of lon_lat_to_grid_ids.
+    '''
+    shm_in = shared_memory.SharedMemory(name=shm_in_name)
+    shm_out = shared_memory.SharedMemory(name=shm_out_name)
+    try:
+        coords = np.ndarray((2, n), dtype=np.float64, buffer=shm_in.buf)
+        out = np.ndarray((len(levels), n), dtype=np.int64, buffer=shm_out.buf)
+
+        response = lon_lat_to_grid_ids(coords[0, start:stop], coords[1, start:stop], level=list(levels),
+                                       source_crs=source_crs, target_crs=target_crs, dedupe=dedupe,
+                                       packed=True, use_proj=use_proj)
+        if not response['success']:
+            return response['result']['error_message']
+
+        for i, lv in enumerate(levels):
+            out[i, start:stop] = response['result']['data'][lv]
+
+        del coords, out
+    finally:
+        shm_in.close()
+        shm_out.close()
+
+    return None
+
+def _parallel_lon_lat_to_ints(lon, lat, levels, workers, source_crs=geo_crs, target_crs=ease_crs,
+                              dedupe=True, use_proj=False):
+    '''
+    Determine packed grid IDs for lon, lat arrays with a pool of worker processes.
+
+    The coordinates are copied once into shared memory, and every worker indexes a
+    contiguous slice of them, writing its packed IDs into a shared output buffer at
+    the same positions. No arrays are pickled, and the output is in the input order
+    regardless of which worker finishes first.
+
+    Parameters
+    ----------
+    lon, lat : numpy arrays
+        Longitude, latitude values of the coordinates, already checked to be in range.
+    levels : list
+        Levels of the grid IDs.
+    workers : int
+        Number of worker processes.
+
+    Returns
+    ----------
+    success, packed : boolean, numpy array
+        Whether all the workers succeeded, and an int64 array (len(levels), n) of packed
+        grid IDs, one row per level; or the error message of the first failed worker.
+    '''
+    n = lon.shape[0]
+    levels = tuple(levels)
+
+    shm_in = shared_memory.SharedMemory(create=True, size=2 * n * np.dtype(np.float64).itemsize)
+    shm_out = shared_memory.SharedMemory(create=True, size=len(levels) * n * np.dtype(np.int64).itemsize)
+    try:
+        coords = np.ndarray((2, n), dtype=np.float64, buffer=shm_in.buf)
+        coords[0] = lon
+        coords[1] = lat
+
+        # a few slices per worker evens out the load when some slices have more duplicates
+        bounds = np.linspace(0, n, min(4 * workers, n) + 1).astype(np.int64)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_index_shared_slice, shm_in.name, shm_out.name, n, int(start), int(stop),
+                                   levels, source_crs, target_crs, dedupe, use_proj)
+                       for start, stop in zip(bounds[:-1], bounds[1:])]
+            errors = [future.result() for future in futures]
+
+        errors = [error for error in errors if error is not None]
+        packed = np.ndarray((len(levels), n), dtype=np.int64, buffer=shm_out.buf).copy()
+        del coords
+    finally:
+        shm_in.close()
+        shm_in.unlink()
+        shm_out.close()
+        shm_out.unlink()
+
+    if errors:
+        return False, errors[0]
+
+    return True, packed
+
+def grid_ids_to_rowcol(grid_ids, level=None):
+    '''
+    Convert GEMS grid IDs to global row, column indices.
+
+    The global row, column index of a cell is its pixel location in a global
+    raster at the cell's level (origin at the upper left corner of the grid).
+
+    Parameters
+    ----------
+    grid_ids : list or numpy array
+       GEMS grid IDs, as strings or packed integers. Cells may be from different levels.
+    level : int, optional
+        Level of the returned indices. For cells finer than level, the index of the
+        ancestor at level is returned; for coarser cells, the index of the upper left
+        descendant at level. Default is the level of each cell.
 
     Returns
     -------
-    ease_x, ease_y : tuple
-        ease_x, ease_y cooridnates of the specified cell.
+    rowcol : dict
+        Dictionary with numpy arrays 'level', 'row' and 'col', in the same order as grid_ids.
     '''
-    if not isinstance(gid, str):
-        return False
-    # centroid are half of the grid cell x,y
-    # centroid_offset = 0.5
+    if not isinstance(grid_ids, (list, np.ndarray)):
+        return format_response(['Input grid IDs should be list or numpy array'], False)
+
+    if level is not None and not check_level(level):
+        return format_response(['The specified level is invalid.'], False)
+
+    levels, row, col, valid = _grid_ids_to_rowcol(grid_ids, level=level)
+
+    if not valid.all():
+        return format_response(['Grid IDs contain improperly formatted IDs'], False)
+
+    return format_response({'level': levels, 'row': row, 'col': col}, True)
+
+def rowcol_to_grid_ids(row, col, level=0, packed=False):
+    '''
+    Convert global row, column indices at a level to GEMS grid IDs.
+
+    Parameters
+    ----------
+    row : numpy array
+       Global row indices of the cells, from 0 to levels_specs[level]['n_row'] - 1.
+    col : numpy array
+       Global column indices of the cells, from 0 to levels_specs[level]['n_col'] - 1.
+    level : int
+        The level of the cells. Default is 0.
+    packed : boolean
+        Return packed 64-bit integer grid IDs instead of strings. Default is False.
+
+    Returns
+    -------
+    grid_ids : dict
+        Numpy array of grid IDs, in the same order as row, col.
+    '''
+    if not check_level(level):
+        return format_response(['The specified level is invalid.'], False)
+
+    row = np.asarray(row).ravel()
+    col = np.asarray(col).ravel()
+
+    if (row.shape != col.shape or not np.issubdtype(row.dtype, np.integer) or
+            not np.issubdtype(col.dtype, np.integer)):
+        return format_response(['Row, column indices should be integer arrays of equal length'], False)
+
+    if not ((row >= 0).all() and (row < levels_specs[level]['n_row']).all() and
+            (col >= 0).all() and (col < levels_specs[level]['n_col']).all()):
+        data = [f"""Row range is 0 : {levels_specs[level]['n_row'] - 1} ; column range is
+                0 : {levels_specs[level]['n_col'] - 1} for level {level}"""]
+        return format_response(data, False)
+
+    return format_response(_rowcol_to_grid_ids(row, col, level=level, packed=packed), True)
+
+def _mixed_rowcol_to_grid_ids(levels, row, col, packed=False):
+    '''
+    Convert global row, column indices of cells of different levels into grid IDs.
+
+    Parameters
+    ----------
+    levels, row, col : numpy arrays
+        Level of each cell, and its global row, column index at that level.
+    packed : boolean
+        Return packed 64-bit integer grid IDs instead of strings. Default is False.
+
+    Returns
+    -------
+    grid_ids : numpy array
+        Grid IDs of the cells, in hierarchical order (sorted by packed grid ID).
+    '''
+    levels = np.asarray(levels, dtype=np.int64)
+    depth = int(levels.max()) if levels.shape[0] else 0
 
-    id_elements = gid.split('.')
+    # digits past the level of each cell are zero
+    row_digits = np.zeros((depth + 1, levels.shape[0]), dtype=np.int64)
+    col_digits = np.zeros((depth + 1, levels.shape[0]), dtype=np.int64)
+    for lv in np.unique(levels):
+        sel = levels == lv
+        row_digits[:lv + 1, sel], col_digits[:lv + 1, sel] = _rowcol_to_digits(row[sel], col[sel], level=lv)
 
-    # level is used in indexing the  pixel_scale_factors array
-    #   add one to get the indexing right
-    index_max = int(id_elements[0][1]) + 1
+    ints = _digits_to_ints(row_digits, col_digits, levels=levels)
+    order = np.argsort(ints, kind='stable')
 
-    id_elements.pop(0)
+    if packed:
+        return ints[order]
 
-    # Level 0 has 3 digits for rows, columns. all other levels have 1 each
-    #   deal with Level 0, then remove it from elements. then append the list
-    y_row_elements = [float(id_elements[0][0:3])]
-    x_col_elements = [float(id_elements[0][3:])]
+    return _digits_to_grid_ids(row_digits[:, order], col_digits[:, order], levels=levels[order])
 
-    id_elements.pop(0)
+def _rowcol_to_coords_ease(row, col, level, cell_scale_factors = cell_scale_factors, centroid_offset = 0.5):
+    '''
+    Convert global row, column indices to EASE Grid v2 coordinates.
 
-    for id in id_elements:
-        y_row_elements.append(float(id[0]))
-        x_col_elements.append(float(id[1]))
+    Parameters
+    ----------
+    row, col : numpy arrays
+       Global row, column indices of the cells.
+    level : int or numpy array
+        Level of the cells.
+    centroid_offset : float
+        Position within the cell; 0.5 is the centroid, 0 the upper left corner.
 
-    y_row_elements = np.array(y_row_elements)
-    x_col_elements = np.array(x_col_elements)
+    Returns
+    -------
+    ease_x, ease_y : numpy arrays
+        EASE Grid v2 coordinates.
+    '''
+    scale = np.asarray(cell_scale_factors)[level]
 
-    # remove unused levels from the arrays; makes book keeing easier
-    cell_scale_factors = cell_scale_factors[0:index_max]
+    x_grid = (col + centroid_offset) * scale
+    y_grid = (row + centroid_offset) * scale
 
-    y_row_scaled = y_row_elements * cell_scale_factors
-    x_col_scaled = x_col_elements * cell_scale_factors
+    return shift_range_grid_xy(x_grid, 'x'), shift_range_grid_xy(y_grid, 'y')
 
-    grid_offset = (cell_scale_factors[-1] * centroid_offset)
+def _gid_to_coord_ease(gid, cell_scale_factors  = cell_scale_factors, centroid_offset = 0.5):
+    '''
+    Convert GEMS grid cell ID to ease_x, ease_y cooridnates.
 
-    x_grid = np.cumsum(x_col_scaled)[-1] + grid_offset
-    y_grid = np.cumsum(y_row_scaled)[-1] + grid_offset
-#     print('x_grid: {}; y_grid: {}'.format(x_grid, y_grid))
-    logger.debug('x_grid: {}; y_grid: {}'.format(x_grid, y_grid))
+    Parameters
+    ----------
+    grid_id : String
+       GEMS grid cell ID.
 
-    ease_x, ease_y = grid_xy_coord_to_ease_coord(x_grid = x_grid, y_grid = y_grid )
+    cell_scale_factors : numpy array
+       Array with the level scaling factors .
 
-    return Point(ease_x, ease_y)#, grid_offset
+    Returns
+    -------
+    ease_x, ease_y : tuple
+        ease_x, ease_y cooridnates of the specified cell.
+    '''
+    if not isinstance(gid, str):
+        return False
+
+    levels, row, col, valid = _grid_ids_to_rowcol([gid])
+    if not valid[0]:
+        return False
+
+    ease_x, ease_y = _rowcol_to_coords_ease(row, col, levels, cell_scale_factors = cell_scale_factors,
+                                            centroid_offset = centroid_offset)
+    logger.debug('ease_x: {}; ease_y: {}'.format(ease_x[0], ease_y[0]))
+
+    return Point(ease_x[0], ease_y[0])
 
 def grid_ids_to_ease(grid_ids, cell_scale_factors  = cell_scale_factors, target_crs = ease_crs):
     '''
@@ -137,7 +473,8 @@ def grid_ids_to_ease(grid_ids, cell_scale_factors  = cell_scale_factors, target_
     Parameters
     ----------
     grid_ids : List
-       List of GEMS grid cell IDs to convert to Point(ease_x, ease_y).
+       List of GEMS grid cell IDs to convert to Point(ease_x, ease_y), or numpy array of
+       packed integer grid IDs.
 
     cell_scale_factors : numpy array
        Array with the level scaling factors for each level.
@@ -147,27 +484,34 @@ def grid_ids_to_ease(grid_ids, cell_scale_factors  = cell_scale_factors, target_
     coords_ease : GeoSeries
         GeoSeies of coordinates (ease_x, ease_y) for corresponding grid IDs.
     '''
+    if not isinstance(grid_ids, list) and not is_packed(grid_ids):
+        return False
 
-    if not isinstance(grid_ids, list):
+    levels, row, col, valid = _grid_ids_to_rowcol(grid_ids)
+    if not valid.all():
         return False
 
-    coords_ease = [_gid_to_coord_ease(gid) for gid in grid_ids]
+    ease_x, ease_y = _rowcol_to_coords_ease(row, col, levels, cell_scale_factors = cell_scale_factors)
 
-    coords_ease = gpd.GeoSeries(coords_ease, crs = target_crs)
+    coords_ease = gpd.GeoSeries(gpd.points_from_xy(ease_x, ease_y), crs = target_crs)
 
     return coords_ease
 
-def grid_ids_to_geos(grid_ids, cell_scale_factors  = cell_scale_factors, source_crs=ease_crs, target_crs=geo_crs):
+def grid_ids_to_geos(grid_ids, cell_scale_factors  = cell_scale_factors, source_crs=ease_crs, target_crs=geo_crs,
+                     use_proj=False):
     '''
     Convert GEMS grid cell ID to ease_x, ease_y cooridnates.
 
     Parameters
     ----------
     grid_ids : List
-       List of GEMS grid cell IDs to convert to (lon, lat).
+       List of GEMS grid cell IDs to convert to (lon, lat), or numpy array of packed
+       integer grid IDs.
 
     cell_scale_factors : numpy array
        Array with the level scaling factors for each level.
+    use_proj : boolean
+        Reproject with PROJ instead of the closed form EASE Grid v2 projection. Default is False.
 
     Returns
     -------
@@ -179,14 +523,137 @@ def grid_ids_to_geos(grid_ids, cell_scale_factors  = cell_scale_factors, source_
     if not success:
         return format_response(data, success)
 
-    coords_ease = grid_ids_to_ease(grid_ids)
+    levels, row, col, _ = _grid_ids_to_rowcol(grid_ids)
 
-    coords_lon_lat = coords_ease.to_crs(target_crs)
-    coords_lon_lat = coords_lon_lat.apply(lambda coord: (coord.x, coord.y))
-    data = coords_lon_lat.to_list()
+    # the latitude of a cell comes from its row, and the longitude from its column
+    if (not use_proj) and (source_crs == ease_crs) and (target_crs == geo_crs):
+        lon, lat = rowcol_to_centroids(row, col, levels, crs = geo_crs)
+    else:
+        ease_x, ease_y = _rowcol_to_coords_ease(row, col, levels, cell_scale_factors = cell_scale_factors)
+        lon, lat = project_coords(ease_x, ease_y, source_crs, target_crs, use_proj=use_proj)
+    data = list(zip(lon.tolist(), lat.tolist()))
 
     return format_response(data, success)
 
+def _rowcol_to_bounds(row, col, level, crs = ease_crs):
+    '''
+    Bounding box of cells from their global row, column index, in EASE Grid v2 or geographic coordinates.
+    '''
+    if crs == ease_crs:
+        min_x, max_y = _rowcol_to_coords_ease(row, col, level, centroid_offset = 0)
+        max_x, min_y = _rowcol_to_coords_ease(row, col, level, centroid_offset = 1)
+        return min_x, min_y, max_x, max_y
+
+    return rowcol_to_bounds(row, col, level, crs = crs)
+
+def _rowcol_to_table(row, col, level, packed = False, crs = ease_crs, geometry = True):
+    '''
+    Build the grid table (row, col, grid_id, centroid, geometry) of cells from their global row, column index.
+    '''
+    x, y = rowcol_to_centroids(row, col, level, crs = crs) if crs == geo_crs else \
+        _rowcol_to_coords_ease(row, col, level)
+
+    table = {'row': row, 'col': col,
+             'grid_id': _rowcol_to_grid_ids(row, col, level = level, packed = packed),
+             'x': x, 'y': y}
+
+    if not geometry:
+        return pd.DataFrame(table)
+
+    min_x, min_y, max_x, max_y = _rowcol_to_bounds(row, col, level, crs = crs)
+
+    return gpd.GeoDataFrame(table, geometry = bounds_to_polygons(min_x, min_y, max_x, max_y), crs = crs)
+
+def grid_ids_to_polygons(grid_ids, crs = ease_crs, coords = False):
+    '''
+    Generate the cell polygons of GEMS grid IDs.
+
+    The polygons are built at once from the global row, column index of the cells,
+    without a per-cell Python loop or WKT step.
+
+    Parameters
+    ----------
+    grid_ids : list or numpy array
+       GEMS grid IDs, as strings or packed integers. Cells may be from different levels.
+    crs : int
+        ease_crs for EASE Grid v2 polygons, or geo_crs for longitude, latitude. Default is ease_crs.
+    coords : boolean
+        Return the bounding box coordinate arrays ('min_x', 'min_y', 'max_x', 'max_y')
+        instead of polygons. Default is False.
+
+    Returns
+    -------
+    polygons : dict
+        GeoSeries of the cell polygons, in the same order as grid_ids.
+    '''
+    success, data = validate_grid_ids(grid_ids)
+    if not success:
+        return format_response(data, success)
+
+    if crs not in (ease_crs, geo_crs):
+        return format_response([f'The crs should be {ease_crs} or {geo_crs}.'], False)
+
+    levels, row, col, _ = _grid_ids_to_rowcol(grid_ids)
+    min_x, min_y, max_x, max_y = _rowcol_to_bounds(row, col, levels, crs = crs)
+
+    if coords:
+        return format_response({'min_x': min_x, 'min_y': min_y, 'max_x': max_x, 'max_y': max_y}, success)
+
+    return format_response(gpd.GeoSeries(bounds_to_polygons(min_x, min_y, max_x, max_y), crs = crs), success)
+
+def grid_table(level = 0, bounds = None, packed = False, crs = ease_crs, geometry = True):
+    '''
+    Build a table of all the cells of a level that intersect a bounding box.
+
+    Parameters
+    ----------
+    level : int
+        The level of the cells. Default is 0.
+    bounds : tuple, optional
+        (min_x, min_y, max_x, max_y) in EASE Grid v2 coordinates. Default is the whole grid.
+    packed : boolean
+        Packed 64-bit integer grid IDs instead of strings. Default is False.
+    crs : int
+        ease_crs or geo_crs, for the centroid and polygon coordinates. Default is ease_crs.
+    geometry : boolean
+        Include the cell polygons. Default is True.
+
+    Returns
+    -------
+    table : dict
+        GeoDataFrame with the global row, column index, grid ID, centroid (x, y) and
+        polygon of every cell, in row major order. Without geometry, a DataFrame.
+    '''
+    if not check_level(level):
+        return format_response(['The specified level is invalid.'], False)
+
+    if crs not in (ease_crs, geo_crs):
+        return format_response([f'The crs should be {ease_crs} or {geo_crs}.'], False)
+
+    if bounds is None:
+        bounds = (grid_spec['ease']['min_x'], grid_spec['ease']['min_y'],
+                  grid_spec['ease']['max_x'], grid_spec['ease']['max_y'])
+
+    min_x, min_y, max_x, max_y = bounds
+    if not ((min_x <= max_x) and (min_y <= max_y)):
+        return format_response(['Bounds should be (min_x, min_y, max_x, max_y)'], False)
+
+    # the upper left and lower right cells, clipped to the grid
+    row_0, col_0 = _grid_xy_to_rowcol(shift_range_ease(np.array([min_x]), 'x'),
+                                      shift_range_ease(np.array([max_y]), 'y'), level = level)
+    row_1, col_1 = _grid_xy_to_rowcol(shift_range_ease(np.array([max_x]), 'x'),
+                                      shift_range_ease(np.array([min_y]), 'y'), level = level, ceil = True)
+
+    n_row = levels_specs[level]['n_row']
+    n_col = levels_specs[level]['n_col']
+    rows = np.arange(min(row_0[0], n_row - 1), min(max(row_1[0], row_0[0] + 1), n_row), dtype = np.int64)
+    cols = np.arange(min(col_0[0], n_col - 1), min(max(col_1[0], col_0[0] + 1), n_col), dtype = np.int64)
+
+    row, col = np.meshgrid(rows, cols, indexing = 'ij')
+
+    return format_response(_rowcol_to_table(row.ravel(), col.ravel(), level, packed = packed, crs = crs,
+                                            geometry = geometry), True)
+
 def _grid_xy_to_grid_id(grid_xy, level=0):
     '''
     Convert a GEMS grid coordinate (x, y) into corresponding Grid ID for specified level;
@@ -207,95 +674,133 @@ def _grid_xy_to_grid_id(grid_xy, level=0):
     if not isinstance(grid_xy, Point):
         return False
 
+    row_digits, col_digits = _grid_xy_to_digits(np.array([grid_xy.x]), np.array([grid_xy.y]), level=level)
+
+    return str(_digits_to_grid_ids(row_digits, col_digits)[0])
+
+def _grid_xy_to_rowcol(x_grid, y_grid, level=0, ceil=False, tol=1e-6):
+    '''
+    Determine the global row, column index at the specified level for GEMS grid coordinates.
+
+    Parameters
+    ----------
+    x_grid : numpy array
+        GEMS grid x coordinates.
+    y_grid : numpy array
+        GEMS grid y coordinates.
+    level : int, optional
+        GEMS grid level/resolution. Defaults to 0.
+    ceil : boolean, optional
+        Return the index of the first cell edge at, or after, the coordinates rather than
+        the cell containing them. Useful for the right/bottom edge of bounds. Defaults to False.
+    tol : float, optional
+        Coordinates within tol of a cell edge, in Level 6 cells, are taken to be on the edge.
+        Defaults to 1e-6 (~1e-6 m), the noise of forward projected coordinates.
+
+    Returns
+    ----------
+    row, col : numpy arrays
+        int64 arrays of the global row, column index of the cells at the level.
+    '''
     # small number problem. This is section comes from a discussion
-    #   with David Porter & other GEMS devs. Basically, it is  way
-    #   of arriving at a calculated way of determing where to round
-    #
-    # the calculation below effectively determins that 8 decimal places
-    #   is a reasonable place to round. The assumption is the EASE grid
-    #   values will be anywhere between min/max, which is the space for values
-    #   with the precision we're working with from pyproj etc, the 10e15 term
-    #   is used to get a sense of what a small number in EASE v2 is
+    #   with David Porter & other GEMS devs. Coordinates from pyproj are not
+    #   exact, forward projected coordinates carry noise of ~1e-6 m, so a coordinate
+    #   on a cell edge can land on either side of it. Rather than rounding at every
+    #   level, grid coordinates are floored once, in Level 6 cells, after adding a
+    #   tolerance (by default 1e-6 of a Level 6 cell). Only coordinates within the
+    #   tolerance of the next edge move to the next cell; any other point stays in its cell.
     #
-    # in pract, rounding to 8 decimals in the grid_xy space (basically, index space)
-    #   means we can detect differences in coordinates on the order of milimeters.
-    #   so far, simmple testing has meant that this should be good enough enough for
-    #   determining multiples in grid_xy space using np.divmod
+    # once floored, the coordinates are integers, and the index at any level is an
+    #   exact integer floor division: col = x * mult_fac[level] // mult_fac[-1].
+    #   All levels come from the same integer, so a cell's index always nests within
+    #   its parent's. Values stay below ~3.5e7, well inside int64.
     #
-    r_digit = 6 # 6 works; 8 causes problems with y dims
-    x = np.around(grid_xy.x, decimals=r_digit)
-    y = np.around(grid_xy.y, decimals=r_digit)
-    np.set_printoptions(precision=6)
-
-    # small rounding differences around 0 were causing problems.
-    #   in particualr, along the left hand edge of the grid,
-    #   some of the x values were negative, and slightly less
-    #   than 0. because np.divmod (used for dividing the cell)
-    #   uses a floor operation, those numbers that were < 0, the floor
-    #   results in them being -1,not 0. This can be corrected with rounding
-    #   or other solutions, but since the grid is only defined for positive x,y
-    #   values, the simplist solution is for
-    if x < 0.0:
-        x = 0.
-
-    if y < 0.0:
-        y = 0.
-
-    grid_cell_id = ['L{}'.format(level)]
-
-    # for every level between 0 and supplied level, inclusive
-    #   want to figure our the row/column index. see documentation
-    #   on the actual scheme
-    for lv in range(0, level + 1, 1):
-#         lv = lv
-        lv = int(lv)
-
-        # because coordinate were transformed above, nothing needed here.
-        #   both x,y integer-parts represent the major Level 0 grid cell
-        #       in grid cooridnate space
-        #
-        #   the float-part indicate the sub-location in that pixel. later, the
-        #      the mod will be multipled by the refine_ratio, which will give the
-        #      location in the finer mesh grids
-        x_div, x_mod = np.divmod(x, 1)
-        y_div, y_mod = np.divmod(y, 1)
-
-        if lv == 0:
-            # the first Level has a 3 digit space for row, columns
-            #    RRRCCC format
-            rc = '{:03d}{:03d}'.format(int(y_div),int(x_div))
-
-        else:
-            # everything Level after L0 uses a single integer for row, column index
-            #   RC format
-            rc = '{:d}{:d}'.format(int(y_div), int(x_div))
-
-        grid_cell_id.append('{}'.format(str(rc)))
+    # the grid is only defined within its edges; values slightly past the left/top or
+    #   right/bottom edge (and infinite values) are clamped to the edge, and a point on
+    #   the right/bottom edge is in the last column|row rather than past it.
+    x_grid = np.asarray(x_grid, dtype=float)
+    y_grid = np.asarray(y_grid, dtype=float)
+    if np.isnan(x_grid).any() or np.isnan(y_grid).any():
+        raise ValueError('GEMS grid coordinates must not be NaN.')
+
+    scale = mult_fac[-1]
+    n_x, n_y = levels_specs[0]['n_col'] * scale, levels_specs[0]['n_row'] * scale
+
+    if ceil:
+        # the index of an edge, at most the right/bottom edge of the grid
+        x = np.clip(np.ceil(x_grid * scale - tol), 0, n_x).astype(np.int64)
+        y = np.clip(np.ceil(y_grid * scale - tol), 0, n_y).astype(np.int64)
+        col = -(-x * mult_fac[level] // scale)
+        row = -(-y * mult_fac[level] // scale)
+    else:
+        x = np.clip(np.floor(x_grid * scale + tol), 0, n_x).astype(np.int64)
+        y = np.clip(np.floor(y_grid * scale + tol), 0, n_y).astype(np.int64)
+        col = np.minimum(x * mult_fac[level] // scale, levels_specs[level]['n_col'] - 1)
+        row = np.minimum(y * mult_fac[level] // scale, levels_specs[level]['n_row'] - 1)
+
+    return row, col
+
+def _grid_xy_to_digits(x_grid, y_grid, level=0):
+    '''
+    Determine the row, column index of every level for arrays of GEMS grid coordinates.
 
-        # each time after first, we need to multiple the mod by refine_ratio value
-        x = np.around(x_mod * levels_specs[lv]['refine_ratio'], decimals=r_digit)
-        y = np.around(y_mod * levels_specs[lv]['refine_ratio'], decimals=r_digit)
+    Parameters
+    ----------
+    x_grid : numpy array
+        GEMS grid x coordinates.
+    y_grid : numpy array
+        GEMS grid y coordinates.
+    level : int, optional
+        GEMS grid level/resolution. Defaults to 0.
 
-    seperator = '.'
+    Returns
+    ----------
+    row_digits, col_digits : numpy arrays
+        Integer arrays with shape (level + 1, n). Row 0 holds the L0 row, column
+        index; subsequent rows hold the index within the parent cell for that level.
+    '''
+    row, col = _grid_xy_to_rowcol(x_grid, y_grid, level=level)
 
-    return seperator.join(grid_cell_id)
+    return _rowcol_to_digits(row, col, level=level)
 
-def ease_polygon_to_grid_ids(polygon_ease, level=0, source_crs = ease_crs,  levels_specs = levels_specs, wkt_geom = True):
+def ease_polygon_to_grid_ids(polygon_ease, level=0, source_crs = ease_crs,  levels_specs = levels_specs, wkt_geom = True,
+                             packed = False, compact = False, predicate = 'centroid', memory_budget = None):
     '''
     Identify all grid cell IDs that correspond with supplied polygon
 
     Parameters
     ----------
-    polygon : WKT
-       WKT the polygon to convert to grid cell IDs.
+    polygon : WKT, WKB or shapely geometry
+       The Polygon or MultiPolygon to convert to grid cell IDs. A shapely geometry is
+       used as is, without any serialization.
 
     level _ int
         The grid level of constituent cell IDs to return
 
+    packed : boolean
+        Return the grid IDs as a numpy array of packed 64-bit integers. Default is False.
+
+    compact : boolean
+        Return the areas fully covered by the polygon as the coarsest cells that cover them
+        (see hierarchy.compact_cells); only the cells on the boundary are at the specified
+        level. The cells are in hierarchical order. Default is False.
+
+    predicate : str
+        The cells to return: 'centroid' for the cells whose center is within the polygon,
+        'intersects' for the cells that intersect the polygon, 'contains' for the cells
+        completely within the polygon, and 'fraction' for the cells that overlap the
+        polygon, with the share of the cell area within the polygon. Default is 'centroid'.
+
+    memory_budget : int, optional
+        Refuse polygons whose grid IDs are estimated to take more than memory_budget bytes
+        (see estimate.estimate_cells), rather than running out of memory; gen_polygon_grid_ids
+        streams the grid IDs of such polygons. Not applied to compact fills. Default is None.
+
     Returns
     -------
     Grid IDs: dict
-        Grid cell IDs for all constituent cells at the specified level.
+        Grid cell IDs for all constituent cells at the specified level. With 'fraction', a
+        dictionary of 'grid_ids' and the corresponding 'fraction' numpy array.
     '''
     if not check_level(level):
         success = False
@@ -303,14 +808,13 @@ def ease_polygon_to_grid_ids(polygon_ease, level=0, source_crs = ease_crs,  leve
 
         return success, data
 
-    if not wkt_geom:
+    polygon_ease = load_geometry(polygon_ease)
+
+    if polygon_ease is None:
         success = False
-        data = ['Expected the polygon in Well Known Text (WKT) format.']
+        data = ['Expected the polygon as WKT, WKB or a shapely geometry.']
 
         return format_response(data, success)
-    # convert to EASE Grid
-    if wkt_geom:
-        polygon_ease = wkt.loads(polygon_ease)
 
     if not ((polygon_ease.geom_type == 'MultiPolygon') or
         (polygon_ease.geom_type == 'Polygon')):
@@ -326,68 +830,79 @@ def ease_polygon_to_grid_ids(polygon_ease, level=0, source_crs = ease_crs,  leve
 
         return format_response(data, success)
 
-    success = True
+    if predicate not in ('centroid', ) + coverage_predicates:
+        success = False
+        data = ['Invalid predicate; options are: centroid, intersects, contains, fraction']
+
+        return format_response(data, success)
 
-    # having issues where corner coords are not quite behaving
-    #   as might be expected. cell L0.202482 is causing difficulties
-    #   when trying to map the locations of conrers, I am going to add
-    #   small buffer to the polygon, to try and fix the problem
-    #   will add 1/2 the smallest grid cell size. cap_type = 3 is
-    #   square buffer
-    fin_lev = list(levels_specs)[-1]
-    buff_dist = levels_specs[fin_lev]['x_length'] * 0.5
-    polygon_ease_in = polygon_ease
-    polygon_ease = polygon_ease.buffer(buff_dist, cap_style=3)
+    if compact and predicate == 'fraction':
+        success = False
+        data = ['Cell fractions can not be compacted.']
 
-    # poly = poly.to_crs(target_crs)
+        return format_response(data, success)
 
-    # get corner coordiantes in EASE
-    corner_coords_ease = get_polygon_corners(polygon_ease)
+    if memory_budget is not None and not compact:
+        n_cells = estimate_cells(polygon_ease, level = level, predicate = predicate)
+        n_bytes = estimate_output_bytes(n_cells, level = level, packed = packed, fraction = predicate == 'fraction')
 
-    corner_coords_ease = gpd.GeoSeries(corner_coords_ease, crs = source_crs)
+        if not check_memory_budget(n_bytes, memory_budget):
+            success = False
+            data = [f'The polygon has about {n_cells} cells ({n_bytes} bytes), over the memory budget of '
+                    f'{memory_budget} bytes; use gen_polygon_grid_ids to stream them.']
 
-    corner_coords_grid = coords_ease_to_coords_grid(corner_coords_ease)
-    corner_grid_ids = corner_coords_grid.apply(lambda coord: _grid_xy_to_grid_id(coord, level = level))
+            return format_response(data, success)
 
-    corner_centroids = grid_ids_to_ease(corner_grid_ids.to_list())
+    success = True
 
-    # get x, y deltas for grid points; these are the distances between ceintroids
-    delta_x = levels_specs[level]['x_length']
-    delta_y = levels_specs[level]['y_length']
+    grid_ids, fraction = _ease_polygon_to_ints(polygon_ease, level = level, predicate = predicate,
+                                               compact = compact)
+    if not packed:
+        grid_ids = _as_grid_id_list(grid_ids)[0]
 
-    point_grid = gen_point_grid(upper_left = corner_centroids[0],
-                                upper_right = corner_centroids[1],
-                                lower_right = corner_centroids[2],
-                                lower_left = corner_centroids[3],
-                                delta_x = delta_x , delta_y = delta_y)
+    if predicate == 'fraction':
+        return format_response({'grid_ids': grid_ids, 'fraction': fraction}, success)
 
+    return format_response(grid_ids, success)
 
-    # ok, below presumes dtaframes, but the shapes input is not
-    # RETHING df use, and just use the shapely options?
-    polygon_ease_in = gpd.GeoDataFrame({'name':['test_shape'], 'geometry': polygon_ease_in}, crs=source_crs)
+def _ease_polygon_to_ints(polygon_ease, level = 0, predicate = 'centroid', compact = False):
+    '''
+    Determine the packed grid IDs of the cells of a polygon in EASE Grid v2 coordinates.
 
+    Returns
+    -------
+    grid_ids, fraction : numpy arrays
+        Packed grid IDs, and the fraction of each cell within the polygon (None unless
+        predicate is 'fraction').
+    '''
+    if predicate in coverage_predicates:
+        row, col, fraction = polygon_to_rowcol_coverage(polygon_ease, level = level, predicate = predicate)
+        grid_ids = _rowcol_to_grid_ids(row, col, level = level, packed = True)
 
-    #points_in_poly = gpd.sjoin(point_grid, polygon_ease_in, how='left', op='within')
-    points_in_poly = gpd.sjoin(point_grid, polygon_ease_in, how='left', predicate='within')
-    points_in_poly = points_in_poly.dropna().reset_index()
+        return (_compact_packed(grid_ids) if compact else grid_ids), fraction
 
-    # once the sjoin is done, there is not a lot of point carting around the df framework.
-    #   may not make much difference on the ultimate performance, but no need to cart it around
-    points_in_poly = points_in_poly.geometry
+    if compact:
+        # a coarse cell on the boundary may still hold only complete sets of children
+        levels, row, col = polygon_to_compact_rowcol(polygon_ease, level = level)
+        return _compact_packed(_mixed_rowcol_to_grid_ids(levels, row, col, packed = True)), None
 
-    coords_grid = coords_ease_to_coords_grid(points_in_poly)
-    grid_ids = coords_grid.apply(lambda coord: _grid_xy_to_grid_id(coord, level = level))
+    # cells are filled row by row, from the crossings of the polygon edges with the
+    #   scanline through the cell centers of each row. a cell is in the polygon when
+    #   its center is within the polygon
+    row, col = runs_to_rowcol(*polygon_to_rowcol_runs(polygon_ease, level = level))
 
-    return format_response(grid_ids.to_list(), success)
+    return _rowcol_to_grid_ids(row, col, level = level, packed = True), None
 
-def geo_polygon_to_grid_ids(polygon_lon_lat, level=0, source_crs = geo_crs, target_crs = ease_crs, levels_specs = levels_specs, return_centroids = True, wkt_geom=True):
+def geo_polygon_to_grid_ids(polygon_lon_lat, level=0, source_crs = geo_crs, target_crs = ease_crs, levels_specs = levels_specs, return_centroids = True, wkt_geom=True,
+                            packed = False, compact = False, predicate = 'centroid', memory_budget = None,
+                            use_proj = False):
     '''
     Identify all grid cell IDs that correspond with the supplied polygon (lon, lat).
 
     Parameters
     ----------
-    polygon : WKT
-       WKT the polygon to convert to grid cell IDs.
+    polygon : WKT, WKB or shapely geometry
+       The Polygon or MultiPolygon to convert to grid cell IDs.
 
     level _ int
         The grid level of constituent cell IDs to return
@@ -398,21 +913,36 @@ def geo_polygon_to_grid_ids(polygon_lon_lat, level=0, source_crs = geo_crs, targ
     target_crs : int
         The targest EPSG code for the polygon. Default is 6933 (EASE Grid v2)
 
+    packed : boolean
+        Return the grid IDs as a numpy array of packed 64-bit integers. Default is False.
+
+    compact : boolean
+        Return fully covered areas as the coarsest cells that cover them. Default is False.
+
+    predicate : str
+        'centroid', 'intersects', 'contains' or 'fraction'; see ease_polygon_to_grid_ids.
+        Default is 'centroid'.
+
+    memory_budget : int, optional
+        Maximum estimated size of the grid IDs in bytes; see ease_polygon_to_grid_ids.
+
+    use_proj : boolean
+        Reproject the polygon with PROJ rather than the closed form EASE Grid v2
+        projection. Default is False.
+
     Returns
     -------
     Grid IDs : dict
         Grid cell IDs for all constituent cells at the specified level.
     '''
-# convert to EASE Grid
-    if not wkt_geom:
+    polygon_lon_lat = load_geometry(polygon_lon_lat)
+
+    if polygon_lon_lat is None:
         success = False
-        data = ['Expected the polygon in Well Known Text (WKT) format.']
+        data = ['Expected the polygon as WKT, WKB or a shapely geometry.']
 
         return format_response(data, success)
 
-    if wkt_geom:
-       polygon_lon_lat = wkt.loads(polygon_lon_lat)
-
     if source_crs != 4326:
         success = False
         data = ['The expected source crs is 4326.']
@@ -428,11 +958,345 @@ def geo_polygon_to_grid_ids(polygon_lon_lat, level=0, source_crs = geo_crs, targ
         data = f"""Lon range is {grid_spec['geo']['min_x']} : {grid_spec['geo']['max_x']} ; lat range is {grid_spec['geo']['max_y']} : {grid_spec['geo']['min_y']}"""
         data =[data]
 
-    polygon_lon_lat = gpd.GeoSeries(polygon_lon_lat, crs = source_crs)
-
-    polygon_ease = polygon_lon_lat.to_crs(target_crs)
-    polygon_ease = polygon_ease.geometry.values[0].wkt
+    # convert to EASE Grid; all the vertices at once, and no WKT in between
+    polygon_ease = project_geometry(polygon_lon_lat, source_crs = source_crs, target_crs = target_crs,
+                                    use_proj = use_proj)
 
-    response = ease_polygon_to_grid_ids(polygon_ease, level = level)
+    response = ease_polygon_to_grid_ids(polygon_ease, level = level, packed = packed, compact = compact,
+                                        predicate = predicate, memory_budget = memory_budget)
 
     return response
+
+def ease_line_to_grid_ids(line_ease, level = 0, source_crs = ease_crs, wkt_geom = True, packed = False):
+    '''
+    Identify all grid cell IDs crossed by the supplied line
+
+    Parameters
+    ----------
+    line : WKT, WKB or shapely geometry
+       The LineString or MultiLineString to convert to grid cell IDs.
+
+    level : int
+        The grid level of constituent cell IDs to return
+
+    packed : boolean
+        Return the grid IDs as a numpy array of packed 64-bit integers. Default is False.
+
+    Returns
+    -------
+    Grid IDs: dict
+        Grid cell IDs of all the cells crossed by the line at the specified level, each
+        once, in the order the line crosses them.
+    '''
+    if not check_level(level):
+        success = False
+        data = ['The specified level is invalid.']
+
+        return format_response(data, success)
+
+    line_ease = load_geometry(line_ease)
+
+    if line_ease is None:
+        success = False
+        data = ['Expected the line as WKT, WKB or a shapely geometry.']
+
+        return format_response(data, success)
+
+    if line_ease.geom_type not in ('LineString', 'MultiLineString'):
+        success = False
+        data = ['The input geometry should be a LineString or MultiLineString.']
+
+        return format_response(data, success)
+
+    if source_crs != 6933:
+        success = False
+        data = ['The expected source crs is 6933.']
+
+        return format_response(data, success)
+
+    row, col = line_to_rowcol(line_ease, level = level)
+    grid_ids = _rowcol_to_grid_ids(row, col, level = level, packed = packed)
+
+    return format_response(grid_ids if packed else grid_ids.tolist(), True)
+
+def geo_line_to_grid_ids(line_lon_lat, level = 0, source_crs = geo_crs, target_crs = ease_crs, wkt_geom = True,
+                         packed = False, use_proj = False):
+    '''
+    Identify all grid cell IDs crossed by the supplied line (lon, lat).
+
+    The vertices of the line are projected to EASE Grid v2, and the line is straight
+    between them in EASE Grid v2 coordinates, as for geo_polygon_to_grid_ids.
+
+    Parameters
+    ----------
+    line : WKT, WKB or shapely geometry
+       The LineString or MultiLineString to convert to grid cell IDs.
+
+    level : int
+        The grid level of constituent cell IDs to return
+
+    source_crs : int
+        The source EPSG code for the line. Default is 4326 (lon, lat).
+
+    packed : boolean
+        Return the grid IDs as a numpy array of packed 64-bit integers. Default is False.
+
+    use_proj : boolean
+        Reproject the line with PROJ rather than the closed form EASE Grid v2 projection.
+        Default is False.
+
+    Returns
+    -------
+    Grid IDs : dict
+        Grid cell IDs of all the cells crossed by the line; see ease_line_to_grid_ids.
+    '''
+    if source_crs != 4326:
+        success = False
+        data = ['The expected source crs is 4326.']
+
+        return format_response(data, success)
+
+    line_lon_lat = load_geometry(line_lon_lat)
+
+    if line_lon_lat is None:
+        success = False
+        data = ['Expected the line as WKT, WKB or a shapely geometry.']
+
+        return format_response(data, success)
+
+    coords_lon_lat = shapely.get_coordinates(line_lon_lat)
+    if not check_lon_lat_range(coords_lon_lat[:, 0], coords_lon_lat[:, 1]):
+        success = False
+        data = [f"""Lon range is {grid_spec['geo']['min_x']} : {grid_spec['geo']['max_x']} ; lat range is {grid_spec['geo']['max_y']} : {grid_spec['geo']['min_y']}"""]
+
+        return format_response(data, success)
+
+    line_ease = project_geometry(line_lon_lat, source_crs = source_crs, target_crs = target_crs, use_proj = use_proj)
+
+    return ease_line_to_grid_ids(line_ease, level = level, packed = packed)
+
+def gen_polygon_grid_ids(polygon, level = 0, source_crs = ease_crs, predicate = 'centroid', packed = False,
+                         tile_level = 0, chunk_size = 1000000):
+    '''
+    Generate the grid cell IDs of a polygon in chunks, one tile at a time.
+
+    The tiles are the cells of tile_level overlapping the polygon, in row major order, and
+    the cells of a tile are in row major order too. Memory is bounded by one chunk (or one
+    tile on the polygon boundary, with the coverage predicates), rather than the whole
+    fill, so the cells of continent scale polygons can be written out as they come, and
+    the generator can be closed early.
+
+    Parameters
+    ----------
+    polygon : WKT, WKB or shapely geometry
+        The Polygon or MultiPolygon to convert to grid cell IDs.
+
+    level : int
+        The grid level of constituent cell IDs to return
+
+    source_crs : int
+        The EPSG code of the polygon. Default is 6933 (EASE Grid v2).
+
+    predicate : str
+        'centroid', 'intersects', 'contains' or 'fraction'; see ease_polygon_to_grid_ids.
+        Default is 'centroid'.
+
+    packed : boolean
+        Return the grid IDs as numpy arrays of packed 64-bit integers. Default is False.
+
+    tile_level : int
+        The grid level of the tiles, 0 or 1 for fine levels. Default is 0.
+
+    chunk_size : int
+        Maximum number of grid IDs per chunk. Default is 1000000.
+
+    Yields
+    -------
+    Grid IDs : list or numpy array
+        Grid cell IDs of a chunk. With 'fraction', a dictionary of 'grid_ids' and the
+        corresponding 'fraction' numpy array.
+    '''
+    if not check_level(level) or not check_level(tile_level) or tile_level > level:
+        raise ValueError('The specified level or tile level is invalid.')
+
+    if predicate not in ('centroid', ) + coverage_predicates:
+        raise ValueError('Invalid predicate; options are: centroid, intersects, contains, fraction')
+
+    polygon = load_geometry(polygon)
+
+    if polygon is None or polygon.geom_type not in ('Polygon', 'MultiPolygon'):
+        raise ValueError('The input geometry should be a Polygon or MultiPolygon.')
+
+    if source_crs != ease_crs:
+        polygon = project_geometry(polygon, source_crs = source_crs, target_crs = ease_crs)
+
+    for row, col, fraction in polygon_to_rowcol_tiles(polygon, level = level, tile_level = tile_level,
+                                                      predicate = predicate, chunk_size = chunk_size):
+        grid_ids = _rowcol_to_grid_ids(row, col, level = level, packed = packed)
+        if not packed:
+            grid_ids = grid_ids.tolist()
+
+        yield {'grid_ids': grid_ids, 'fraction': fraction} if predicate == 'fraction' else grid_ids
+
+def _polygons_to_ints(polygons_ease, level, predicate, compact):
+    '''
+    Determine the packed grid IDs of the cells of several polygons in EASE Grid v2 coordinates.
+
+    Returns
+    ----------
+    results : list
+        (grid_ids, fraction) of each polygon, as returned by _ease_polygon_to_ints.
+    '''
+    return [_ease_polygon_to_ints(polygon, level = level, predicate = predicate, compact = compact)
+            for polygon in polygons_ease]
+
+def _shard_polygons(polygons_ease, level, n_shards):
+    '''
+    Group polygons into shards of about the same number of cells, for a pool of worker processes.
+
+    Polygons are sorted by the Level 0 cell of their bounding box center, so that small
+    polygons close to each other share a shard, and split into runs of about the same
+    estimated cost: the number of cells within the polygon plus the number of cells on
+    its boundary. A polygon costing more than a shard is a shard on its own.
+
+    Returns
+    ----------
+    shards : list
+        Arrays of the positions of the polygons in each shard.
+    '''
+    cell_side = levels_specs[level]['x_length']
+    cost = 1 + shapely.area(polygons_ease) / cell_side**2 + shapely.length(polygons_ease) / cell_side
+
+    bounds = shapely.bounds(polygons_ease)
+    center_x = np.nan_to_num((bounds[:, 0] + bounds[:, 2]) / 2)
+    center_y = np.nan_to_num((bounds[:, 1] + bounds[:, 3]) / 2)
+    row_0 = np.clip(np.floor(shift_range_ease(center_y, 'y')), 0, levels_specs[0]['n_row'] - 1)
+    col_0 = np.clip(np.floor(shift_range_ease(center_x, 'x')), 0, levels_specs[0]['n_col'] - 1)
+
+    order = np.argsort(row_0 * levels_specs[0]['n_col'] + col_0, kind = 'stable')
+    cost = cost[order]
+
+    shard = np.floor((np.cumsum(cost) - cost) / (cost.sum() / n_shards)).astype(np.int64)
+    splits = np.flatnonzero(np.diff(shard)) + 1
+
+    return np.split(order, splits)
+
+def geodataframe_to_grid_ids(gdf, level = 0, predicate = 'centroid', packed = False, compact = False, workers = None,
+                             memory_budget = None):
+    '''
+    Identify the grid cell IDs of every polygon of a GeoDataFrame.
+
+    All the geometries are reprojected to EASE Grid v2 in a single call, and filled
+    without going through WKT. With workers, the polygons are sharded by their Level 0
+    cell into groups of about the same number of cells, and filled by a pool of processes.
+
+    Parameters
+    ----------
+    gdf : GeoDataFrame or GeoSeries
+        Polygons or MultiPolygons, in any CRS. Missing and empty geometries have no cells.
+
+    level : int
+        The grid level of constituent cell IDs to return
+
+    predicate : str
+        'centroid', 'intersects', 'contains' or 'fraction'; see ease_polygon_to_grid_ids.
+        Default is 'centroid'.
+
+    packed : boolean
+        Return the grid IDs as packed 64-bit integers. Default is False.
+
+    compact : boolean
+        Return fully covered areas as the coarsest cells that cover them. Default is False.
+
+    workers : int, optional
+        Number of processes to split the polygons across. Default is None, a single process.
+
+    memory_budget : int, optional
+        Maximum estimated size of the grid IDs of all the polygons in bytes; see
+        ease_polygon_to_grid_ids.
+
+    Returns
+    -------
+    Grid IDs : dict
+        A long table as a dictionary of numpy arrays: 'feature', the index label of the
+        polygon of each cell, and 'grid_ids'; with 'fraction', the share of each cell's
+        area within the polygon. The cells of each polygon are in the order returned by
+        ease_polygon_to_grid_ids, and the polygons in the order of the GeoDataFrame.
+    '''
+    if not check_level(level):
+        success = False
+        data = ['The specified level is invalid.']
+
+        return format_response(data, success)
+
+    if predicate not in ('centroid', ) + coverage_predicates:
+        success = False
+        data = ['Invalid predicate; options are: centroid, intersects, contains, fraction']
+
+        return format_response(data, success)
+
+    if compact and predicate == 'fraction':
+        success = False
+        data = ['Cell fractions can not be compacted.']
+
+        return format_response(data, success)
+
+    if gdf.crs is None:
+        success = False
+        data = ['The GeoDataFrame has no CRS.']
+
+        return format_response(data, success)
+
+    polygons_ease = gdf.geometry.values.to_numpy()
+    if gdf.crs != ease_crs:
+        polygons_ease = project_geometry(polygons_ease, source_crs = gdf.crs, target_crs = ease_crs)
+
+    valid = ~(shapely.is_missing(polygons_ease) | shapely.is_empty(polygons_ease))
+    type_ids = shapely.get_type_id(polygons_ease[valid])
+    if not np.isin(type_ids, [3, 6]).all():
+        success = False
+        data = ['The input geometries should be Polygons or MultiPolygons.']
+
+        return format_response(data, success)
+
+    position = np.flatnonzero(valid)
+    polygons_ease = polygons_ease[valid]
+
+    if memory_budget is not None and not compact:
+        n_cells = estimate_cells(gpd.GeoSeries(polygons_ease, crs = ease_crs), level = level, predicate = predicate)
+        n_bytes = estimate_output_bytes(n_cells, level = level, packed = packed, fraction = predicate == 'fraction')
+
+        if not check_memory_budget(n_bytes, memory_budget):
+            success = False
+            data = [f'The polygons have about {n_cells} cells ({n_bytes} bytes), over the memory budget of '
+                    f'{memory_budget} bytes; use gen_polygon_grid_ids to stream them.']
+
+            return format_response(data, success)
+
+    if workers is None or workers <= 1 or position.shape[0] < 2:
+        results = _polygons_to_ints(polygons_ease, level, predicate, compact)
+    else:
+        # a few shards per worker evens out the load left by the cost estimate
+        shards = _shard_polygons(polygons_ease, level, min(4 * workers, position.shape[0]))
+
+        results = [None] * position.shape[0]
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            futures = [(shard, pool.submit(_polygons_to_ints, polygons_ease[shard], level, predicate, compact))
+                       for shard in shards]
+            for shard, future in futures:
+                for i, result in zip(shard.tolist(), future.result()):
+                    results[i] = result
+
+    counts = np.array([result[0].shape[0] for result in results], dtype = np.int64)
+    grid_ids = np.concatenate([np.empty(0, dtype = np.int64)] + [result[0] for result in results])
+    feature = gdf.index.to_numpy()[np.repeat(position, counts)]
+
+    if not packed:
+        levels, row_digits, col_digits = _ints_to_digits(grid_ids)
+        grid_ids = _digits_to_grid_ids(row_digits, col_digits, levels = levels)
+
+    data = {'feature': feature, 'grid_ids': grid_ids}
+    if predicate == 'fraction':
+        data['fraction'] = np.concatenate([np.empty(0, dtype = np.float64)] + [result[1] for result in results])
+
+    return format_response(data, True)
@@ -0,0 +1,436 @@
+'''
+Group by aggregation of grid cell values on integer keys, such as packed parent IDs.
+
+The keys are sorted once, and every statistic is a reduction over the runs of equal keys
+(np.ufunc.reduceat, np.bincount), so no Python code runs per group. Missing (NaN) values
+are skipped, as in pandas. For more values than fit in memory, external_aggregate merges
+statistics of chunks of the values, spilled to temporary files.
+
+© Regents of the University of Minnesota. All rights reserved.
+This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
+'''
+import os
+import tempfile
+import contextlib
+
+import numpy as np
+
+aggregation_methods = ('count', 'first', 'last', 'mean', 'median', 'min', 'max', 'std', 'sum',
+                       'var', 'mad', 'prod', 'mode')
+
+# the mode of integer values counts every (group, value) pair in a dense table when the
+#   table has at most this many entries, and sorts the pairs otherwise
+max_mode_table = 1 << 24
+
+def _run_starts(group):
+    '''
+    Index of the first element of each run of equal values of a sorted array.
+    '''
+    if not group.shape[0]:
+        return np.empty(0, dtype=np.int64)
+
+    return np.flatnonzero(np.concatenate(([True], group[1:] != group[:-1])))
+
+def _scatter(reduced, present, n_groups, fill=np.nan):
+    '''
+    Values of all the groups, from the values of the groups present; the others are fill.
+    '''
+    if present.shape[0] == n_groups:
+        return reduced
+
+    out = np.full(n_groups, fill, dtype=np.result_type(reduced, np.float64))
+    out[present] = reduced
+
+    return out
+
+def _argsort_keys(keys):
+    '''
+    Stable sort order of integer keys.
+
+    Sorting values is much faster than argsort, so when the range of the keys and the
+    positions fit in 63 bits, each key is packed with its position and the packed values
+    sorted.
+    '''
+    n = keys.shape[0]
+    low = int(keys.min())
+    key_bits = (int(keys.max()) - low).bit_length()
+    position_bits = max(n - 1, 1).bit_length()
+
+    if key_bits + position_bits > 63:
+        return np.argsort(keys, kind='stable')
+
+    packed = np.sort(((keys - low).astype(np.int64) << position_bits) | np.arange(n, dtype=np.int64))
+
+    return packed & ((1 << position_bits) - 1)
+
+def _sort_within_groups(values, group):
+    '''
+    Values sorted by group, then by value, for values sorted by group.
+    '''
+    n = values.shape[0]
+    bits = max(n - 1, 1).bit_length()
+    if 2 * bits > 63:
+        return values[np.lexsort((values, group))]
+
+    # the rank of each value, packed with its group like the keys in _argsort_keys
+    by_value = np.argsort(values)
+    rank = np.empty(n, dtype=np.int64)
+    rank[by_value] = np.arange(n, dtype=np.int64)
+
+    rank = np.sort((group << bits) | rank) & ((1 << bits) - 1)
+
+    return values[by_value[rank]]
+
+def _mode(values, group, n_groups):
+    '''
+    Most frequent value of each group, the smallest one on ties, as pandas mode()[0].
+    '''
+    if not values.shape[0]:
+        return np.full(n_groups, np.nan)
+
+    low, high = values.min(), values.max()
+    integer = values.dtype.kind in 'iu' or (np.isfinite(high - low) and (values == np.floor(values)).all())
+
+    # categorical values are their own codes, others are coded by their rank among the unique values
+    if integer and float(high) - float(low) < values.shape[0]:
+        unique = None
+        n_values = int(high - low) + 1
+        codes = (values - low).astype(np.int64)
+    else:
+        unique, codes = np.unique(values, return_inverse=True)
+        n_values = unique.shape[0]
+
+    pairs = group * n_values + codes
+
+    if n_groups * n_values <= max_mode_table:
+        # count the values of every group at once
+        table = np.bincount(pairs, minlength=n_groups * n_values).reshape(n_groups, n_values)
+
+        code = np.argmax(table, axis=1)
+        present = np.flatnonzero(table.any(axis=1))
+        code = code[present]
+    else:
+        # runs of equal (group, value) pairs, then the first longest run of each group
+        pairs = np.sort(pairs)
+        starts = _run_starts(pairs)
+        counts = np.diff(np.append(starts, pairs.shape[0]))
+        run_group, run_code = np.divmod(pairs[starts], n_values)
+
+        group_starts = _run_starts(run_group)
+        longest = np.maximum.reduceat(counts, group_starts)
+        best = np.flatnonzero(counts == np.repeat(longest, np.diff(np.append(group_starts, counts.shape[0]))))
+        best = best[_run_starts(run_group[best])]
+
+        present, code = run_group[best], run_code[best]
+
+    mode = (code + low).astype(values.dtype) if unique is None else unique[code]
+
+    return _scatter(mode, present, n_groups)
+
+def _median(values, group, count):
+    '''
+    Median of each group, from the two middle values of the values sorted within the group.
+    '''
+    if not values.shape[0]:
+        return np.full(count.shape[0], np.nan)
+
+    ordered = _sort_within_groups(values, group)
+    lower = np.where(count > 0, np.cumsum(count) - count + (count - 1) // 2, 0)
+    upper = lower + (count % 2 == 0) * (count > 0)
+
+    return np.where(count > 0, (ordered[lower] + ordered[upper]) / 2, np.nan)
+
+def _aggregate_column(values, group, n_groups, methods):
+    '''
+    Statistics of one column of values sorted by group, for each group.
+    '''
+    if values.dtype.kind == 'f':
+        valid = ~np.isnan(values)
+        if not valid.all():
+            values, group = values[valid], group[valid]
+
+    starts = _run_starts(group)
+    ends = np.append(starts[1:], values.shape[0]) - 1
+    present = group[starts]
+
+    count = np.bincount(group, minlength=n_groups)
+    mean = np.bincount(group, weights=values, minlength=n_groups) / count
+
+    stats = {}
+    for method in methods:
+        if method == 'count':
+            stats[method] = count
+        elif method == 'mean':
+            stats[method] = mean
+        elif method in ('sum', 'prod', 'min', 'max'):
+            ufunc, fill = {'sum': (np.add, 0), 'prod': (np.multiply, 1),
+                           'min': (np.minimum, np.nan), 'max': (np.maximum, np.nan)}[method]
+            reduced = ufunc.reduceat(values, starts) if starts.shape[0] else values[:0]
+            stats[method] = _scatter(reduced, present, n_groups, fill=fill)
+        elif method == 'first':
+            stats[method] = _scatter(values[starts], present, n_groups)
+        elif method == 'last':
+            stats[method] = _scatter(values[ends], present, n_groups)
+        elif method in ('var', 'std'):
+            # the deviations from the mean of the group, rather than the sum of squares, for precision
+            squares = np.bincount(group, weights=(values - mean[group]) ** 2, minlength=n_groups)
+            var = np.where(count > 1, squares / np.maximum(count - 1, 1), np.nan)
+            stats[method] = var if method == 'var' else np.sqrt(var)
+        elif method == 'mad':
+            stats[method] = np.bincount(group, weights=np.abs(values - mean[group]), minlength=n_groups) / count
+        elif method == 'median':
+            stats[method] = _median(values, group, count)
+        elif method == 'mode':
+            stats[method] = _mode(values, group, n_groups)
+
+    return stats
+
+def group_aggregate(keys, values, methods=('mean', )):
+    '''
+    Aggregate values by integer keys.
+
+    Parameters
+    ----------
+    keys : numpy array
+        Integer key of the group of each value, such as packed parent grid IDs.
+    values : numpy array
+        Values to aggregate; one column per variable for two dimensional values.
+    methods : list
+        Statistics to compute, from aggregation_methods. Default is the mean.
+
+    Returns
+    -------
+    group_keys, stats : numpy array, dict
+        Sorted unique keys, and for each method the statistic of every group, with one
+        column per variable for two dimensional values.
+    '''
+    keys = np.asarray(keys)
+    values = np.asarray(values)
+    if values.dtype.kind == 'b':
+        values = values.astype(np.int64)
+
+    # sorted stably, as first and last are in the order of the values
+    if keys.shape[0] and (keys[1:] < keys[:-1]).any():
+        order = _argsort_keys(keys)
+        keys, values = keys[order], values[order]
+
+    boundary = np.ones(keys.shape[0], dtype=bool)
+    boundary[1:] = keys[1:] != keys[:-1]
+    starts = np.flatnonzero(boundary)
+    group = np.cumsum(boundary) - 1
+
+    columns = values.reshape(values.shape[0], -1).T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = [_aggregate_column(column, group, starts.shape[0], methods) for column in columns]
+
+    if values.ndim == 1:
+        return keys[starts], stats[0]
+
+    return keys[starts], {method: np.column_stack([stat[method] for stat in stats]) for method in methods}
+
+# statistics of a group that can be merged from the statistics of parts of the group
+mergeable_methods = ('count', 'sum', 'min', 'max', 'mean', 'var', 'std')
+
+# runs are merged at most max_merge_runs at a time, so the number of open files, and the
+#   number of blocks read, stay bounded; each run is read at least min_block_size keys at a time
+max_merge_runs = 64
+min_block_size = 256
+
+def _partial_dtype(n_columns):
+    '''
+    Structured dtype of the partial statistics of n_columns columns of values.
+    '''
+    return np.dtype([('key', np.int64), ('count', np.int64, (n_columns, )), ('sum', np.float64, (n_columns, )),
+                     ('min', np.float64, (n_columns, )), ('max', np.float64, (n_columns, )),
+                     ('m2', np.float64, (n_columns, ))])
+
+def _partial_stats(keys, values):
+    '''
+    Mergeable statistics of values by key: count, sum, min, max and the sum of squared
+    deviations from the mean (m2), in a structured array sorted by key.
+    '''
+    values = values.reshape(values.shape[0], -1)
+    keys, stats = group_aggregate(keys, values, ['count', 'sum', 'min', 'max', 'var'])
+
+    partial = np.empty(keys.shape[0], dtype=_partial_dtype(values.shape[1]))
+    partial['key'] = keys
+    for field in ('count', 'sum', 'min', 'max'):
+        partial[field] = stats[field]
+    partial['m2'] = np.where(stats['count'] > 1, stats['var'] * (stats['count'] - 1), 0)
+
+    return partial
+
+def _merge_partials(partial):
+    '''
+    Merge the partial statistics of equal keys, e.g. from different runs.
+    '''
+    partial = partial[np.argsort(partial['key'], kind='stable')]
+    boundary = np.ones(partial.shape[0], dtype=bool)
+    boundary[1:] = partial['key'][1:] != partial['key'][:-1]
+    starts = np.flatnonzero(boundary)
+    group = np.cumsum(boundary) - 1
+
+    merged = np.empty(starts.shape[0], dtype=partial.dtype)
+    merged['key'] = partial['key'][starts]
+    merged['count'] = np.add.reduceat(partial['count'], starts, axis=0)
+    merged['sum'] = np.add.reduceat(partial['sum'], starts, axis=0)
+    # parts without values have NaN min and max
+    merged['min'] = np.fmin.reduceat(partial['min'], starts, axis=0)
+    merged['max'] = np.fmax.reduceat(partial['max'], starts, axis=0)
+
+    # the deviations of the means of the parts from the mean of the group (Chan et al.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = merged['sum'] / merged['count']
+        deviation = np.where(partial['count'] > 0, partial['sum'] / partial['count'] - mean[group], 0)
+    merged['m2'] = np.add.reduceat(partial['m2'] + partial['count'] * deviation ** 2, starts, axis=0)
+
+    return merged
+
+def _finish_partials(partial, methods):
+    '''
+    Statistics of each key from its merged partial statistics.
+    '''
+    count = partial['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = np.where(count > 1, partial['m2'] / np.maximum(count - 1, 1), np.nan)
+        stats = {'count': count, 'sum': partial['sum'], 'min': partial['min'], 'max': partial['max'],
+                 'mean': partial['sum'] / count, 'var': var, 'std': np.sqrt(var)}
+
+    return {method: stats[method] for method in methods}
+
+def _spill_run(pending, path):
+    '''
+    Write the merged partial statistics of the pending chunks to a file, as a run sorted by key.
+    '''
+    _merge_partials(np.concatenate(pending)).tofile(path)
+
+    return path
+
+def _merge_runs(paths, dtype, block_size):
+    '''
+    k-way merge of runs of partial statistics sorted by key, read from their files a
+    block at a time.
+
+    Yields
+    ----------
+    partial : numpy array
+        Merged partial statistics of the next keys, which are complete.
+    '''
+    remaining = [os.path.getsize(path) // dtype.itemsize for path in paths]
+    blocks = [np.empty(0, dtype=dtype) for path in paths]
+
+    with contextlib.ExitStack() as stack:
+        files = [stack.enter_context(open(path, 'rb')) for path in paths]
+
+        while True:
+            for i, run_file in enumerate(files):
+                if not blocks[i].shape[0] and remaining[i]:
+                    blocks[i] = np.fromfile(run_file, dtype=dtype, count=min(block_size, remaining[i]))
+                    remaining[i] -= blocks[i].shape[0]
+
+            if not any(block.shape[0] for block in blocks):
+                return
+
+            # every key up to the smallest last key of the blocks of unfinished runs is complete
+            limits = [block['key'][-1] for block, left in zip(blocks, remaining) if left]
+            cuts = [np.searchsorted(block['key'], min(limits), side='right') if limits else block.shape[0]
+                    for block in blocks]
+
+            taken = np.concatenate([block[:cut] for block, cut in zip(blocks, cuts)])
+            blocks = [block[cut:] for block, cut in zip(blocks, cuts)]
+
+            yield _merge_partials(taken)
+
+def _block_size(buffer_size, n_runs):
+    '''
+    Number of keys read from each of n_runs runs at a time, to hold buffer_size keys in all.
+    '''
+    return max(buffer_size // n_runs, min_block_size)
+
+def _merge_passes(paths, dtype, buffer_size, run_dir):
+    '''
+    Merge runs max_merge_runs at a time into longer runs, until at most max_merge_runs
+    runs are left. The merged runs are removed.
+    '''
+    n_pass = 0
+    while len(paths) > max_merge_runs:
+        merged = []
+        for start in range(0, len(paths), max_merge_runs):
+            group = paths[start:start + max_merge_runs]
+            if len(group) == 1:
+                merged.extend(group)
+                continue
+
+            path = os.path.join(run_dir, 'pass_{}_run_{}.bin'.format(n_pass, len(merged)))
+            with open(path, 'wb') as run_file:
+                for partial in _merge_runs(group, dtype, _block_size(buffer_size, len(group))):
+                    partial.tofile(run_file)
+
+            for run_path in group:
+                os.remove(run_path)
+            merged.append(path)
+
+        paths = merged
+        n_pass += 1
+
+    return paths
+
+def external_aggregate(chunks, methods=('mean', ), scratch_dir=None, buffer_size=1000000):
+    '''
+    Aggregate values by integer keys, for more values than fit in memory.
+
+    Each chunk of values is reduced to mergeable statistics per key, which are buffered,
+    and spilled to a temporary file as a run sorted by key when the buffer is full. The
+    runs are then merged, a block of each at a time, so memory is bounded by the buffer
+    and one chunk of values. More than max_merge_runs runs are first merged in passes of
+    max_merge_runs runs, into longer runs.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Chunks of (keys, values) numpy arrays, as in group_aggregate. Every chunk has the
+        same number of value columns.
+    methods : list
+        Statistics to compute, from mergeable_methods. Default is the mean.
+    scratch_dir : str, optional
+        Directory of the temporary files of the runs. Defaults to the system temporary
+        directory.
+    buffer_size : int
+        Number of keys of statistics held in memory, before a run is spilled, and during
+        the merge. Default is 1,000,000.
+
+    Yields
+    ------
+    group_keys, stats : numpy array, dict
+        Next sorted unique keys, and for each method the statistic of every key.
+    '''
+    if any(method not in mergeable_methods for method in methods):
+        raise ValueError('Invalid aggregation method; options are: {}'.format(', '.join(mergeable_methods)))
+
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as run_dir:
+        paths, pending = [], []
+        one_column = False
+
+        for keys, values in chunks:
+            values = np.asarray(values)
+            one_column = values.ndim == 1
+            pending.append(_partial_stats(np.asarray(keys), values))
+
+            if sum(partial.shape[0] for partial in pending) >= buffer_size:
+                paths.append(_spill_run(pending, os.path.join(run_dir, 'run_{}.bin'.format(len(paths)))))
+                pending = []
+
+        if pending:
+            paths.append(_spill_run(pending, os.path.join(run_dir, 'run_{}.bin'.format(len(paths)))))
+
+        if not paths:
+            return
+
+        dtype = _partial_dtype(1 if one_column else values.shape[1])
+        paths = _merge_passes(paths, dtype, buffer_size, run_dir)
+        for partial in _merge_runs(paths, dtype, _block_size(buffer_size, len(paths))):
+            stats = _finish_partials(partial, methods)
+            if one_column:
+                stats = {method: stat[:, 0] for method, stat in stats.items()}
+
+            yield partial['key'], stats
@@ -9,12 +9,17 @@ import json
 from itertools import product
 
 import numpy as  np
-import pandas as pd
 
 from shapely import wkt
 
-from gemsgrid.constants import levels_specs
+from gemsgrid.constants import levels_specs, ease_crs
 from gemsgrid.dggs.checks import validate_grid_ids, check_level
+from gemsgrid.dggs.packing import is_packed, level_bits, level_mask, level_span, \
+    _as_grid_id_list, grid_ids_to_ints, ints_to_grid_ids, _grid_ids_to_rowcol, _level_ratio, _compact_packed, \
+    _uncompact_packed, _grid_ids_to_digits
+from gemsgrid.dggs.grid_addressing import _rowcol_to_table, _rowcol_to_grid_ids
+from gemsgrid.dggs.polyfill import chunk_runs
+from gemsgrid.dggs.groupby import group_aggregate, external_aggregate, aggregation_methods
 
 from gemsgrid.dggs.utils import format_response, enumerate_id_elements
 from gemsgrid.dggs.utils import enumerate_grid_table_rows
@@ -53,6 +58,101 @@ def _child_to_parent(gid, level=0):
 
     return ('.'.join(parent_id))
 
+def _packed_to_parents(packed, level=0):
+    '''
+    Determines the parent cells (coarser) of packed integer grid IDs at the specified level.
+
+    Parameters
+    ----------
+    packed : numpy array
+        Packed grid IDs of the child cells.
+    level : int
+        The specified level (resolution) of the parents to return.
+
+    Returns
+    -------
+    parent_ids : numpy array
+        Packed parent IDs of the cells.
+    '''
+    # the parent is the child index, with the digits of levels finer than
+    #   the parent level set to zero
+    span = level_span[level]
+    index = (np.asarray(packed, dtype=np.int64) >> level_bits) // span * span
+
+    return (index << level_bits) | level
+
+def _strings_to_parents(encoded, level=0):
+    '''
+    Determines the parent cells (coarser) of grid ID byte strings at the specified level.
+
+    A parent ID is the prefix of the child ID up to the parent level, with the level
+    digit replaced, so the parents are sliced out of the fixed width buffer of the IDs.
+
+    Parameters
+    ----------
+    encoded : numpy array
+        Fixed width byte string ('S' dtype) grid IDs of the child cells, all at the
+        specified level or finer.
+    level : int
+        The specified level (resolution) of the parents to return.
+
+    Returns
+    -------
+    parent_ids : numpy array
+        Byte string ('S' dtype) parent IDs of the cells.
+    '''
+    n = encoded.shape[0]
+    id_length = 9 + 3 * level
+
+    buffer = np.zeros((n, max(encoded.dtype.itemsize, id_length)), dtype=np.uint8)
+    if n:
+        buffer[:, :encoded.dtype.itemsize] = encoded.view(np.uint8).reshape(n, encoded.dtype.itemsize)
+
+    parents = np.ascontiguousarray(buffer[:, :id_length])
+    parents[:, 1] = ord('0') + level
+
+    return parents.view(f'S{id_length}').ravel()
+
+def _encode_grid_id_strings(grid_ids):
+    '''
+    Fixed width byte strings ('S' dtype) of grid IDs, or None when they are not ASCII strings.
+
+    Unicode arrays are narrowed from their UCS4 code points, rather than encoded one ID at a time.
+    '''
+    grid_ids = np.asarray(grid_ids)
+    if grid_ids.dtype.kind == 'S':
+        return grid_ids.ravel()
+
+    if grid_ids.dtype.kind != 'U':
+        return None
+
+    width = grid_ids.dtype.itemsize // 4
+    codes = grid_ids.reshape(-1).view(np.uint32).reshape(-1, width)
+    if (codes > 127).any():
+        return None
+
+    return codes.astype(np.uint8).view(f'S{width}').ravel()
+
+def _check_grid_id_strings(encoded, chunk_size=1000000):
+    '''
+    Validate grid ID byte strings, a chunk at a time to bound the memory of the parse.
+
+    Returns
+    -------
+    valid, min_level : boolean, int
+        Are all the grid IDs valid, and the coarsest level among them.
+    '''
+    min_level = max(levels_specs.keys())
+
+    for start in range(0, encoded.shape[0], chunk_size):
+        levels, _, _, valid = _grid_ids_to_digits(encoded[start:start + chunk_size])
+        if not valid.all():
+            return False, None
+
+        min_level = min(min_level, int(levels.min()))
+
+    return True, min_level
+
 def children_to_parents(children, level=0):
     '''
     Determines the parent cells (coarser) of all children at the specified level.
@@ -60,32 +160,60 @@ def children_to_parents(children, level=0):
     Parameters
     ----------
     children : List
-        Children whose parent cells you want to identify.
+        Children whose parent cells you want to identify, or numpy array of packed
+        integer grid IDs, or of fixed width ('S' or 'U' dtype) grid ID strings.
     level : str
         The level of the parent cells.
 
     Returns
     -------
     parent_ids : list
-        Parent IDs of of the cells.
+        Parent IDs of of the cells. Numpy array children return a numpy array of parent
+        IDs, of the same kind (packed integers, 'S' or 'U' strings).
     '''
-    if not isinstance(children, list):
-        return False
+    if is_packed(children):
+        success, data = validate_grid_ids(children)
+        if not success:
+            return format_response(data, success)
 
-    success, data = validate_grid_ids(children)
+        if not check_level(level) or ((children & level_mask) <= level).any():
+            data = ['Parent level must be coarser than the level of the children.']
+            return format_response(data, False)
 
-    if not success:
-        return format_response(data, success)
+        return format_response(_packed_to_parents(children, level = level), success)
+
+    is_array = isinstance(children, np.ndarray) and children.dtype.kind in 'SU'
+    if not isinstance(children, list) and not is_array:
+        return format_response(['Input grid IDs should be list or numpy array'], False)
+
+    encoded = _encode_grid_id_strings(children)
+
+    valid, min_level = _check_grid_id_strings(encoded) if encoded is not None else (False, None)
 
-    data = [_child_to_parent(gid, level = level) for gid in children]
+    if not valid:
+        # the full validation, for the error message
+        success, data = validate_grid_ids(list(children))
+        if success:
+            data = ['Grid IDs contain invalid IDs']
 
-    if (not any(data)):
-        data = ['Invalid grid ID passed to _child_to_parent ']
         return format_response(data, False)
 
-    return format_response(data, success)
+    if encoded.shape[0] and (not check_level(level) or min_level <= level):
+        data = ['Parent level must be coarser than the level of the children.']
+        return format_response(data, False)
+
+    parent_ids = _strings_to_parents(encoded, level = level)
+
+    if is_array and children.dtype.kind == 'S':
+        return format_response(parent_ids, True)
+
+    # widen the ASCII bytes back to unicode code points
+    width = parent_ids.dtype.itemsize
+    parent_ids = parent_ids.view(np.uint8).reshape(-1, width).astype(np.uint32).view(f'U{width}').ravel()
+
+    return format_response(parent_ids if is_array else parent_ids.tolist(), True)
 
-def gen_child_geometries(parent_geometry, parent_id, child_level, wkt_geom = True):
+def gen_child_geometries(parent_geometry, parent_id, child_level, wkt_geom = True, wkt_out = True):
     '''
     Generate child cell characterisitcs from parent cells.
 
@@ -93,12 +221,16 @@ def gen_child_geometries(parent_geometry, parent_id, child_level, wkt_geom = Tru
     ----------
     parent_geometry : polygon
        WKT with parent polygone.
-    parent_id : float
-        The cell id of the parent cell.
+    parent_id : str or int
+        The cell id of the parent cell. When supplied as a packed integer, the
+        child grid IDs are returned as a numpy array of packed integers.
     child_level _ int
         The grid level of the child to create
     wkt_geom : boolean
         Denotes that partent_geometry is wkt
+    wkt_out : boolean
+        Return the child geometries and centroids as WKT. Otherwise, as numpy arrays of
+        shapely geometries. Default is True.
 
     Returns
     -------
@@ -108,6 +240,11 @@ def gen_child_geometries(parent_geometry, parent_id, child_level, wkt_geom = Tru
     if wkt_geom:
         parent_geometry = wkt.loads(parent_geometry)
 
+    packed = isinstance(parent_id, (int, np.integer))
+    if packed:
+        parent_id, _ = _as_grid_id_list(np.array([parent_id], dtype=np.int64))
+        parent_id = parent_id[0]
+
     min_x, min_y, max_x, max_y = parent_geometry.bounds
 
     x_coords, y_coords = calc_grid_coord_vectors(min_x = min_x,
@@ -122,10 +259,71 @@ def gen_child_geometries(parent_geometry, parent_id, child_level, wkt_geom = Tru
         enumerate_grid_table_rows(x_coords = x_coords,
                                     y_coords = y_coords,
                                     level = child_level,
-                                    parent_id = parent_id)
+                                    parent_id = parent_id,
+                                    wkt_out = wkt_out)
+
+    if packed:
+        grid_id = grid_ids_to_ints(grid_id)['result']['data']
 
     return(r_ind, c_ind, grid_id, geoms, centroid)
 
+def gen_children_table(parent_ids, child_level, crs = ease_crs, geometry = True):
+    '''
+    Generate the child cells of many parent cells at once.
+
+    The children come from the global row, column index of the parents, so no parent
+    geometry is needed. The children of a parent are in row major order, as in
+    gen_child_geometries.
+
+    Parameters
+    ----------
+    parent_ids : list or numpy array
+        GEMS grid IDs of the parent cells, or numpy array of packed integer grid IDs.
+        The parents may be from different levels. Packed parents return packed child IDs.
+    child_level : int
+        The grid level of the children to create. Must be finer than every parent.
+    crs : int
+        ease_crs or geo_crs, for the centroid and polygon coordinates. Default is ease_crs.
+    geometry : boolean
+        Include the child polygons. Default is True.
+
+    Returns
+    -------
+    children : dict
+        GeoDataFrame with one row per child: the parent ID, the row, column index within
+        the parent (r_ind, c_ind), the global row, column index, the grid ID, the centroid
+        (x, y) and polygon of the child.
+    '''
+    if not isinstance(parent_ids, (list, np.ndarray)):
+        return format_response(['Input grid IDs should be list or numpy array'], False)
+
+    success, data = validate_grid_ids(parent_ids)
+    if not success:
+        return format_response(data, success)
+
+    parent_levels, _, _, _ = _grid_ids_to_rowcol(parent_ids)
+    if not check_level(child_level) or (parent_levels >= child_level).any():
+        return format_response(['Children level must be finer than the level of the parents.'], False)
+
+    # row, column index of the upper left child of every parent
+    _, p_row, p_col, _ = _grid_ids_to_rowcol(parent_ids, level = child_level)
+
+    ratio = np.array([_level_ratio(lv, child_level) for lv in range(child_level)],
+                     dtype = np.int64)[parent_levels]
+    counts = ratio * ratio
+    starts = np.cumsum(counts) - counts
+
+    parent = np.repeat(np.arange(len(parent_levels)), counts)
+    r_ind, c_ind = np.divmod(np.arange(counts.sum(), dtype = np.int64) - starts[parent], ratio[parent])
+
+    table = _rowcol_to_table(p_row[parent] + r_ind, p_col[parent] + c_ind, child_level,
+                             packed = is_packed(parent_ids), crs = crs, geometry = geometry)
+    table.insert(0, 'parent_id', np.asarray(parent_ids)[parent])
+    table.insert(1, 'r_ind', r_ind)
+    table.insert(2, 'c_ind', c_ind)
+
+    return format_response(table, True)
+
 def _parent_to_children(gid, level=1):
     '''
     Determines all the children of a single parent the specified level.
@@ -172,18 +370,41 @@ def parents_to_children(grid_ids, level = 1):
     '''
     Determines all of the children cells of the parent cell for the specified level.
 
+    All the children are built at once; for many children, see children_window and
+    gen_children.
+
     Parameters
     ----------
     grid_id : list
-        List of GEMS grid IDs for all the parent cells.
+        List of GEMS grid IDs for all the parent cells, or numpy array of packed integer grid IDs.
     level : str
         Level (resolution) of the children cells to return.
 
     Returns
     -------
     children : list
-        List of GEMS grid IDs for children of the parent cells.
+        List of GEMS grid IDs for children of the parent cells. Packed parents return a
+        numpy array of packed children IDs per parent.
     '''
+    if is_packed(grid_ids):
+        success, data = validate_grid_ids(grid_ids)
+        if not success:
+            return format_response(data, success)
+
+        parent_levels = grid_ids & level_mask
+        if not check_level(level) or (parent_levels >= level).any():
+            data = ['Children level must be finer than the level of the parents.']
+            return format_response(data, False)
+
+        # children of a cell are a contiguous run of indices at the child level
+        data = []
+        for gid, parent_level in zip(grid_ids.tolist(), parent_levels.tolist()):
+            n_children = level_span[parent_level] // level_span[level]
+            index = (gid >> level_bits) + np.arange(n_children, dtype=np.int64) * level_span[level]
+            data.append((index << level_bits) | level)
+
+        return format_response(data, success)
+
     if not isinstance(grid_ids, list):
         data = ['Input grid IDs should be list']
         return format_response(data, False)
@@ -196,31 +417,226 @@ def parents_to_children(grid_ids, level = 1):
 
     return format_response(data, success)
 
+def children_window(grid_ids, level = 1):
+    '''
+    Determine the block of global rows and columns covered by the children of each cell.
+
+    The children of a cell at a level are a rectangular block in global row, column space,
+    so they can be described by two ranges instead of being enumerated. The window can be
+    used to read the children directly from a raster at the level, e.g. with
+    rasterio.windows.Window.from_slices((row_start, row_stop), (col_start, col_stop)).
+
+    Parameters
+    ----------
+    grid_ids : list or numpy array
+        GEMS grid IDs of the parent cells, or numpy array of packed integer grid IDs.
+        The parents may be from different levels.
+    level : int
+        Level of the children. Must be finer than every parent.
+
+    Returns
+    -------
+    window : dict
+        Numpy arrays row_start, row_stop, col_start, col_stop of the global row, column
+        indices of the children at level, one per parent. The stops are exclusive.
+    '''
+    if not isinstance(grid_ids, (list, np.ndarray)):
+        return format_response(['Input grid IDs should be list or numpy array'], False)
+
+    success, data = validate_grid_ids(grid_ids)
+    if not success:
+        return format_response(data, success)
+
+    parent_levels, _, _, _ = _grid_ids_to_rowcol(grid_ids)
+    if not check_level(level) or (parent_levels >= level).any():
+        return format_response(['Children level must be finer than the level of the parents.'], False)
+
+    # row, column index of the upper left child of every parent
+    _, row, col, _ = _grid_ids_to_rowcol(grid_ids, level = level)
+    ratio = np.array([_level_ratio(lv, level) for lv in range(level)], dtype = np.int64)[parent_levels]
+
+    data = {'row_start': row, 'row_stop': row + ratio, 'col_start': col, 'col_stop': col + ratio}
+
+    return format_response(data, success)
+
+def gen_children(grid_id, level = 1, packed = False, chunk_size = 1000000):
+    '''
+    Generate the children of a cell at a level, in chunks, without building them all at once.
+
+    An L0 cell has about 1.3 billion children at L6, too many to hold in memory. The
+    children are generated in row major order from the window of the cell (see
+    children_window), so each chunk is a set of whole or partial rows of the window.
+
+    Parameters
+    ----------
+    grid_id : str or int
+        GEMS grid ID of the parent cell, or packed integer grid ID.
+    level : int
+        Level of the children. Must be finer than the parent.
+    packed : boolean
+        Yield packed 64-bit integer grid IDs rather than strings. Default is False.
+    chunk_size : int
+        Maximum number of children per chunk. Default is 1,000,000.
+
+    Yields
+    ------
+    grid_ids : list or numpy array
+        Grid IDs of the next chunk of children; packed grid IDs are a numpy array.
+    '''
+    grid_ids = [grid_id] if isinstance(grid_id, str) else np.array([grid_id], dtype = np.int64)
+
+    response = children_window(grid_ids, level = level)
+    if not response['success']:
+        raise ValueError(response['result']['error_message'][0])
+
+    window = {key: int(value[0]) for key, value in response['result']['data'].items()}
+
+    # one run of columns per row of the window
+    rows = np.arange(window['row_start'], window['row_stop'], dtype = np.int64)
+    col_start = np.full(rows.shape[0], window['col_start'], dtype = np.int64)
+    col_end = np.full(rows.shape[0], window['col_stop'], dtype = np.int64)
+
+    for row, col in chunk_runs(rows, col_start, col_end, chunk_size = chunk_size):
+        grid_ids = _rowcol_to_grid_ids(row, col, level = level, packed = packed)
+
+        yield grid_ids if packed else grid_ids.tolist()
+
+def compact_cells(grid_ids):
+    '''
+    Compact a set of cells: replace every complete set of siblings with their parent, repeatedly.
+
+    Parameters
+    ----------
+    grid_ids : list or numpy array
+        GEMS grid IDs of the cells, or numpy array of packed integer grid IDs. Cells may be
+        from different levels. Duplicate cells, and cells within another cell of the set,
+        are dropped.
+
+    Returns
+    -------
+    grid_ids : dict
+        Grid IDs of the compacted cells, in hierarchical order. Packed grid IDs return a
+        numpy array of packed grid IDs.
+    '''
+    if not isinstance(grid_ids, (list, np.ndarray)):
+        return format_response(['Input grid IDs should be list or numpy array'], False)
+
+    success, data = validate_grid_ids(grid_ids)
+    if not success:
+        return format_response(data, success)
+
+    packed = is_packed(grid_ids)
+    ints = grid_ids if packed else grid_ids_to_ints(grid_ids)['result']['data']
+
+    compacted = _compact_packed(ints)
+    if packed:
+        return format_response(compacted, success)
+
+    return format_response(_as_grid_id_list(compacted)[0], success)
+
+def uncompact_cells(grid_ids, level, lazy = False, chunk_size = 1000000):
+    '''
+    Expand a set of cells to all their descendants at a level.
+
+    Parameters
+    ----------
+    grid_ids : list or numpy array
+        GEMS grid IDs of the cells, or numpy array of packed integer grid IDs. Cells may be
+        from different levels, but none finer than level.
+    level : int
+        Level of the cells to return.
+    lazy : boolean
+        Return a generator of the cells, in chunks of at most chunk_size cells, rather than
+        all of them at once. Default is False.
+    chunk_size : int
+        Maximum number of cells per chunk when lazy. Default is 1,000,000.
+
+    Returns
+    -------
+    grid_ids : dict
+        Grid IDs of the cells at level, in the order of grid_ids. Packed grid IDs return a
+        numpy array of packed grid IDs; lazy returns a generator of chunks.
+    '''
+    if not isinstance(grid_ids, (list, np.ndarray)):
+        return format_response(['Input grid IDs should be list or numpy array'], False)
+
+    success, data = validate_grid_ids(grid_ids)
+    if not success:
+        return format_response(data, success)
+
+    packed = is_packed(grid_ids)
+    ints = grid_ids if packed else grid_ids_to_ints(grid_ids)['result']['data']
+
+    if not check_level(level) or ((ints & level_mask) > level).any():
+        return format_response(['Level must not be finer than the level of the cells.'], False)
+
+    chunks = _uncompact_packed(ints, level, chunk_size = chunk_size if lazy else None)
+    if not packed:
+        chunks = (_as_grid_id_list(chunk)[0] for chunk in chunks)
+
+    if lazy:
+        return format_response(chunks, success)
+
+    chunks = list(chunks)
+    if not chunks:
+        return format_response(np.empty(0, dtype=np.int64) if packed else [], success)
+
+    return format_response(chunks[0], success)
+
+def _parent_keys(grid_ids, level = 0):
+    '''
+    Integer keys of the parents of grid IDs at a level, for grouping: the index of the
+    parent among the cells of the level, which is dense, for a narrower sort.
+    '''
+    response = children_to_parents(grid_ids, level = level)
+    if not response['success']:
+        return response
+
+    parent_ids = response['result']['data']
+    if not is_packed(grid_ids):
+        parent_ids = grid_ids_to_ints(parent_ids)['result']['data']
+
+    return format_response((parent_ids >> level_bits) // level_span[level], True)
+
+def _keys_to_parents(keys, level = 0):
+    '''
+    Packed grid IDs of the parents from their keys (see _parent_keys).
+    '''
+    return ((keys * level_span[level]) << level_bits) | level
 
 def grid_aggregate(grid_ids, grid_vals, level = 0, method = 'mean', levels_specs = levels_specs):
     '''
     Aggregate GEMS grid ID to coarser spatial resolution.
 
+    The values are grouped on the packed integer IDs of the parents, and aggregated with
+    numpy reductions (see gemsgrid.dggs.groupby), so several value columns and several
+    statistics share one sort of the parents.
+
     Parameters
     ----------
     grid_ids : list
-       List of the GEMS grid IDs to aggregate.
+       List of the GEMS grid IDs to aggregate, or numpy array of packed integer grid IDs
+       or of fixed width grid ID strings.
 
     grid_vals : list
-       List of the corresponding GEMS grid cell values to aggregate.
+       List of the corresponding GEMS grid cell values to aggregate, or numpy array with
+       one value, or one row of values (one column per variable), per grid ID.
 
     level : str
         Target resolution grid level to aggregate to.
 
-    method : str
-        The aggregation method to employ.
+    method : str or list
+        The aggregation method to employ, or a list of them: count, first, last, mean,
+        median, min, max, std, sum, var, mad, prod or mode. Missing (NaN) values are skipped.
 
     Returns
     -------
-    Lists with grid_ids and aggregated values lists.
+    Lists with grid_ids and aggregated values lists. Packed grid_ids return a numpy
+    array of packed parent IDs, and numpy array grid_vals return numpy arrays of values.
+    For a list of methods, the values are a dictionary of the values of each method.
     '''
 
-    if not isinstance(grid_ids, list) and not isinstance(grid_vals, list):
+    if not isinstance(grid_ids, (list, np.ndarray)) or not isinstance(grid_vals, (list, np.ndarray)):
         success = False
         data = 'Lists expected for grid_ids and grid_vals.'
         return format_response(data, success)
@@ -231,39 +647,101 @@ def grid_aggregate(grid_ids, grid_vals, level = 0, method = 'mean', levels_specs
 
         return format_response(data, success)
 
-    if not all(isinstance(x, (int, float)) for x in grid_vals):
+    values = np.asarray(grid_vals)
+    if values.dtype.kind not in 'biuf' or values.ndim not in (1, 2):
         success = False
         data = 'grid_vals must be ints or floats'
 
         return format_response(data, success)
 
-    allow_methods = ['count', 'first', 'last', 'mean', 'median', 'min',
-                    'max', 'std', 'sum', 'var', 'mad', 'prod', 'mode']
+    if values.shape[0] != len(grid_ids):
+        success = False
+        data = 'grid_ids and grid_vals must be the same length.'
 
-    if method not in allow_methods:
+        return format_response(data, success)
+
+    methods = [method] if isinstance(method, str) else list(method)
+
+    if not methods or any(m not in aggregation_methods for m in methods):
         success = False
         data = 'Invalid aggregation method supplied.'
         return format_response(data, success)
 
-    parent_ids = children_to_parents(grid_ids, level = level)
-    parent_ids = parent_ids['result']['data']
-
-    df = pd.DataFrame({'children': grid_ids,
-                        'grid_vals': grid_vals,
-                        'parents' : parent_ids})
-
-    if method not in ['mode', 'count']:
-        agg = df.groupby('parents').aggregate(method, numeric_only=True)
-        out_ids = agg.index.to_list()
-        out_vals = agg.grid_vals.to_list()
-    elif method in ['count']:
-        agg = df.groupby('parents').aggregate(method)
-        out_ids = agg.index.to_list()
-        out_vals = agg.grid_vals.to_list()
-    else:
-        agg = df.groupby('parents').grid_vals.apply(lambda x: x.mode()[0])
-        out_ids = agg.index.to_list()
-        out_vals = list(agg.values)
+    response = _parent_keys(grid_ids, level = level)
+    if not response['success']:
+        return response
+
+    keys, stats = group_aggregate(response['result']['data'], values, methods)
+
+    out_ids = _keys_to_parents(keys, level)
+    if not is_packed(grid_ids):
+        out_ids = ints_to_grid_ids(out_ids)['result']['data']
+        out_ids = out_ids.tolist() if isinstance(grid_ids, list) else out_ids.astype(grid_ids.dtype.kind)
+
+    if isinstance(grid_vals, list):
+        stats = {m: stat.tolist() for m, stat in stats.items()}
+
+    out_vals = stats[method] if isinstance(method, str) else stats
 
     return format_response({'grid_ids' : out_ids, 'values' : out_vals}, True)
 
+def _gen_parent_keys(chunks, level = 0):
+    '''
+    Chunks of (grid_ids, grid_vals) as chunks of (parent keys, grid_vals); see _parent_keys.
+    '''
+    for grid_ids, grid_vals in chunks:
+        response = _parent_keys(grid_ids, level = level)
+        if not response['success']:
+            raise ValueError(response['result']['error_message'][0])
+
+        yield response['result']['data'], grid_vals
+
+def gen_grid_aggregate(chunks, level = 0, method = 'mean', packed = False, scratch_dir = None,
+                       buffer_size = 1000000):
+    '''
+    Aggregate GEMS grid IDs to coarser spatial resolution, for more cells than fit in memory.
+
+    The chunks are read one at a time and reduced to statistics per parent that can be
+    merged (count, sum, min, max and the sum of squared deviations). These are spilled to
+    temporary files as runs sorted by parent, and the runs are merged, so memory is bounded
+    by buffer_size parents and one chunk. See gemsgrid.dggs.groupby.external_aggregate.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Chunks of (grid_ids, grid_vals), as in grid_aggregate, e.g. read from a file.
+
+    level : int
+        Target resolution grid level to aggregate to.
+
+    method : str or list
+        The aggregation method to employ, or a list of them: count, sum, min, max, mean,
+        var or std. Missing (NaN) values are skipped.
+
+    packed : boolean
+        Yield packed 64-bit integer grid IDs rather than strings. Default is False.
+
+    scratch_dir : str, optional
+        Directory of the temporary files. Defaults to the system temporary directory.
+
+    buffer_size : int
+        Number of parents of statistics held in memory. Default is 1,000,000.
+
+    Yields
+    ------
+    Dictionary with the grid_ids and the aggregated values of the next parents, in order
+    of the packed parent IDs. For a list of methods, the values are a dictionary of the
+    values of each method.
+    '''
+    if not check_level(level):
+        raise ValueError('The specified level is invalid.')
+
+    methods = [method] if isinstance(method, str) else list(method)
+
+    for keys, stats in external_aggregate(_gen_parent_keys(chunks, level), methods, scratch_dir = scratch_dir,
+                                          buffer_size = buffer_size):
+        grid_ids = _keys_to_parents(keys, level)
+        if not packed:
+            grid_ids = ints_to_grid_ids(grid_ids)['result']['data'].tolist()
+
+        yield {'grid_ids': grid_ids, 'values': stats[method] if isinstance(method, str) else stats}
@@ -0,0 +1,597 @@
+'''
+Packed 64-bit integer encoding of GEMS grid IDs.
+
+A GEMS grid ID (LX.RRRCCC.RC.RC...) is a mixed-radix number: the L0 cell
+(406 x 964 cells), followed by one digit per level whose radix is the square
+of the parent's refine_ratio (16, 9, 9, 100, 100, 100). The digit combines the
+row, column index within the parent cell: digit = row * refine_ratio + col.
+
+The packed form stores that number, padded with zero digits out to Level 6,
+above a 3 bit level field:
+
+    packed = (index_L6_padded << 3) | level
+
+Sorting packed IDs orders cells hierarchically; a parent sorts immediately
+before all of its descendants, and the children of a cell are a contiguous
+range of integers.
+
+© Regents of the University of Minnesota. All rights reserved.
+This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
+'''
+import numpy as np
+
+from gemsgrid.constants import levels_specs
+from gemsgrid.dggs.response import format_response
+
+max_level = max(levels_specs.keys())
+level_bits = 3
+level_mask = (1 << level_bits) - 1
+
+# radix of the digit of each level. L0 is the whole 406 x 964 grid, every level
+#   after that is refine_ratio x refine_ratio of the parent (refine_ratio of
+#   a level is stored with the parent in levels_specs)
+level_radix = [levels_specs[0]['n_row'] * levels_specs[0]['n_col']] + \
+    [levels_specs[lv - 1]['refine_ratio'] ** 2 for lv in range(1, max_level + 1)]
+
+# number of Level 6 positions covered by a single cell of each level
+level_span = [int(np.prod(level_radix[lv + 1:], dtype=np.int64)) for lv in range(max_level + 1)]
+
+def is_packed(grid_ids):
+    '''
+    Test if grid IDs are supplied as a numpy array of packed integers.
+
+    Parameters
+    ----------
+    grid_ids : list or numpy array
+        The grid IDs to test.
+
+    Returns
+    -------
+    result : boolean
+        Are the grid IDs a numpy integer array?
+    '''
+    return isinstance(grid_ids, np.ndarray) and np.issubdtype(grid_ids.dtype, np.integer)
+
+def _valid_packed_mask(packed):
+    '''
+    Determine which packed grid IDs hold a valid level and index.
+
+    Parameters
+    ----------
+    packed : numpy array
+        Integer array of packed grid IDs.
+
+    Returns
+    ----------
+    valid : numpy array
+        Boolean array; True where the packed grid ID is valid.
+    '''
+    packed = np.asarray(packed, dtype=np.int64).ravel()
+    levels = packed & level_mask
+    index = packed >> level_bits
+
+    valid = (packed >= 0) & (levels <= max_level) & (index < level_radix[0] * level_span[0])
+
+    # the digits below the level of the cell must be zero
+    spans = np.asarray(level_span, dtype=np.int64)[np.minimum(levels, max_level)]
+    valid &= (index % spans) == 0
+
+    return valid
+
+def _rowcol_to_digits(row, col, level=0):
+    '''
+    Split global row, column indices at a level into per-level row, column indices.
+
+    Parameters
+    ----------
+    row : numpy array
+        Global row index of the cells at the level.
+    col : numpy array
+        Global column index of the cells at the level.
+    level : int
+        The level of the row, column indices.
+
+    Returns
+    ----------
+    row_digits, col_digits : numpy arrays
+        Integer arrays (level + 1, n). Row 0 holds the L0 row, column index; the
+        others hold the index within the parent cell for that level.
+    '''
+    row = np.asarray(row, dtype=np.int64).ravel()
+    col = np.asarray(col, dtype=np.int64).ravel()
+
+    row_digits = np.empty((level + 1, row.shape[0]), dtype=np.int64)
+    col_digits = np.empty((level + 1, col.shape[0]), dtype=np.int64)
+
+    for lv in range(level, 0, -1):
+        rr = levels_specs[lv - 1]['refine_ratio']
+        row, row_digits[lv] = np.divmod(row, rr)
+        col, col_digits[lv] = np.divmod(col, rr)
+
+    row_digits[0] = row
+    col_digits[0] = col
+
+    return row_digits, col_digits
+
+def _digits_to_rowcol(row_digits, col_digits, level=None):
+    '''
+    Combine per-level row, column indices into global row, column indices.
+
+    Parameters
+    ----------
+    row_digits : numpy array
+        Integer array (depth + 1, n) of row indices, as returned by _rowcol_to_digits.
+    col_digits : numpy array
+        Integer array (depth + 1, n) of column indices, as returned by _rowcol_to_digits.
+    level : int, optional
+        The level of the returned indices; the finer levels of the digits are ignored.
+        Defaults to depth.
+
+    Returns
+    ----------
+    row, col : numpy arrays
+        Global row, column index of the cells at the level.
+    '''
+    if level is None:
+        level = row_digits.shape[0] - 1
+
+    row = row_digits[0].astype(np.int64)
+    col = col_digits[0].astype(np.int64)
+
+    for lv in range(1, level + 1):
+        rr = levels_specs[lv - 1]['refine_ratio']
+        row = row * rr + row_digits[lv]
+        col = col * rr + col_digits[lv]
+
+    return row, col
+
+def _digits_to_grid_ids(row_digits, col_digits, levels=None):
+    '''
+    Format per-level row, column indices into GEMS grid ID strings.
+
+    The IDs are written as ASCII bytes into a single (n, id_length) buffer, so no
+    per-cell string formatting is done in Python.
+
+    Parameters
+    ----------
+    row_digits : numpy array
+        Integer array (depth + 1, n) of row indices. Row 0 holds the L0 row index; the
+        others hold the row index within the parent cell.
+    col_digits : numpy array
+        Integer array (depth + 1, n) of column indices, laid out as row_digits.
+    levels : numpy array, optional
+        Level of each cell, for arrays with cells of mixed levels. When None, all the
+        cells are at level depth.
+
+    Returns
+    ----------
+    grid_ids : numpy array
+        Unicode array of the n grid IDs, formatted as LX.RRRCCC.RC.RC...
+    '''
+    depth = row_digits.shape[0] - 1
+
+    if levels is not None:
+        levels = np.asarray(levels)
+        grid_ids = np.empty(levels.shape[0], dtype=f'U{9 + 3 * depth}')
+
+        for lv in np.unique(levels):
+            sel = levels == lv
+            grid_ids[sel] = _digits_to_grid_ids(row_digits[:lv + 1, sel], col_digits[:lv + 1, sel])
+
+        return grid_ids
+
+    n = row_digits.shape[1]
+
+    # 'LX.RRRCCC' plus '.RC' for every level after L0
+    id_length = 9 + 3 * depth
+    zero = ord('0')
+
+    buffer = np.empty((n, id_length), dtype=np.uint8)
+    buffer[:, 0] = ord('L')
+    buffer[:, 1] = zero + depth
+    buffer[:, 2] = ord('.')
+
+    for i, scale in enumerate([100, 10, 1]):
+        buffer[:, 3 + i] = zero + (row_digits[0] // scale) % 10
+        buffer[:, 6 + i] = zero + (col_digits[0] // scale) % 10
+
+    for lv in range(1, depth + 1):
+        pos = 9 + 3 * (lv - 1)
+        buffer[:, pos] = ord('.')
+        buffer[:, pos + 1] = zero + row_digits[lv]
+        buffer[:, pos + 2] = zero + col_digits[lv]
+
+    return buffer.view(f'S{id_length}').ravel().astype(f'U{id_length}')
+
+def _grid_ids_to_digits(grid_ids):
+    '''
+    Parse GEMS grid ID strings into per-level row, column indices.
+
+    The IDs are parsed as a fixed width byte buffer, and checked against the same
+    rules as validate_grid_ids (format, element count and index ranges).
+
+    Parameters
+    ----------
+    grid_ids : list or numpy array
+        GEMS grid IDs to parse. May contain cells of different levels.
+
+    Returns
+    ----------
+    levels, row_digits, col_digits, valid : numpy arrays
+        Level of each cell; integer arrays (depth + 1, n) of row and column indices,
+        zero past the level of each cell; boolean array of IDs that are valid.
+    '''
+    try:
+        encoded = np.asarray(grid_ids, dtype='S').ravel()
+    except (UnicodeEncodeError, TypeError, ValueError):
+        encoded = np.array([gid.encode('ascii', 'replace') if isinstance(gid, str) else b''
+                            for gid in grid_ids], dtype='S')
+
+    n = encoded.shape[0]
+    width = max(encoded.dtype.itemsize, 9 + 3 * max_level)
+    buffer = np.zeros((n, width), dtype=np.uint8)
+    if n:
+        raw = encoded.view(np.uint8).reshape(n, encoded.dtype.itemsize)
+        buffer[:, :raw.shape[1]] = raw
+
+    # one row per character position, so each position is read contiguously
+    chars = np.ascontiguousarray(buffer.T).astype(np.int16)
+    digits = chars - ord('0')
+    is_digit = (digits >= 0) & (digits <= 9)
+
+    levels = digits[1]
+    valid = (chars[0] == ord('L')) & (levels >= 0) & (levels <= max_level) & (chars[2] == ord('.'))
+    levels = np.where(valid, levels, 0)
+
+    # the IDs must end exactly where the level says they end
+    lengths = (chars != 0).sum(axis=0)
+    valid &= lengths == 9 + 3 * levels
+    valid &= is_digit[3:9].all(axis=0)
+
+    depth = int(levels[valid].max()) if valid.any() else 0
+
+    row_digits = np.zeros((depth + 1, n), dtype=np.int64)
+    col_digits = np.zeros((depth + 1, n), dtype=np.int64)
+
+    row_digits[0] = digits[3] * 100 + digits[4] * 10 + digits[5]
+    col_digits[0] = digits[6] * 100 + digits[7] * 10 + digits[8]
+    valid &= (row_digits[0] < levels_specs[0]['n_row']) & (col_digits[0] < levels_specs[0]['n_col'])
+
+    for lv in range(1, depth + 1):
+        pos = 9 + 3 * (lv - 1)
+        rr = levels_specs[lv - 1]['refine_ratio']
+        in_level = levels >= lv
+
+        level_ok = (chars[pos] == ord('.')) & is_digit[pos + 1] & is_digit[pos + 2] & \
+            (digits[pos + 1] < rr) & (digits[pos + 2] < rr)
+        valid &= ~in_level | level_ok
+
+        row_digits[lv] = np.where(in_level, digits[pos + 1], 0)
+        col_digits[lv] = np.where(in_level, digits[pos + 2], 0)
+
+    row_digits[:, ~valid] = 0
+    col_digits[:, ~valid] = 0
+
+    # the characters are int16, but levels are int64 everywhere else
+    return levels.astype(np.int64), row_digits, col_digits, valid
+
+def _valid_digits_mask(row_digits, col_digits):
+    '''
+    Determine which cells have every row, column digit within the range of its level.
+
+    A digit out of range would carry into the next digit when packed, and give a different,
+    valid cell, so digits are checked before they are packed.
+
+    Parameters
+    ----------
+    row_digits, col_digits : numpy array
+        Integer arrays (depth + 1, n) of row, column indices, as in _digits_to_ints.
+
+    Returns
+    ----------
+    valid : numpy array
+        Boolean array; True where all the digits of the cell are in range.
+    '''
+    n_rows = [levels_specs[0]['n_row']] + [levels_specs[lv - 1]['refine_ratio'] for lv in range(1, max_level + 1)]
+    n_cols = [levels_specs[0]['n_col']] + n_rows[1:]
+
+    valid = np.ones(row_digits.shape[1], dtype=bool)
+    for lv in range(row_digits.shape[0]):
+        valid &= (row_digits[lv] >= 0) & (row_digits[lv] < n_rows[lv]) & \
+            (col_digits[lv] >= 0) & (col_digits[lv] < n_cols[lv])
+
+    return valid
+
+def _digits_to_ints(row_digits, col_digits, levels=None):
+    '''
+    Pack per-level row, column indices into 64-bit integers.
+
+    Parameters
+    ----------
+    row_digits : numpy array
+        Integer array (depth + 1, n) of row indices, zero past the level of each cell.
+    col_digits : numpy array
+        Integer array (depth + 1, n) of column indices, zero past the level of each cell.
+    levels : numpy array, optional
+        Level of each cell. When None, all the cells are at level depth.
+
+    Returns
+    ----------
+    packed : numpy array
+        int64 array of packed grid IDs.
+    '''
+    depth = row_digits.shape[0] - 1
+
+    index = row_digits[0].astype(np.int64) * levels_specs[0]['n_col'] + col_digits[0]
+    for lv in range(1, depth + 1):
+        rr = levels_specs[lv - 1]['refine_ratio']
+        index = index * (rr * rr) + row_digits[lv] * rr + col_digits[lv]
+
+    index = index * level_span[depth]
+
+    if levels is None:
+        levels = depth
+
+    return (index << level_bits) | np.asarray(levels, dtype=np.int64)
+
+def _ints_to_digits(packed, depth=None):
+    '''
+    Unpack 64-bit integer grid IDs into per-level row, column indices.
+
+    Parameters
+    ----------
+    packed : numpy array
+        int64 array of packed grid IDs.
+    depth : int, optional
+        Number of levels to unpack. Defaults to the finest level in packed.
+
+    Returns
+    ----------
+    levels, row_digits, col_digits : numpy arrays
+        Level of each cell, and integer arrays (depth + 1, n) of row and column indices.
+    '''
+    packed = np.asarray(packed, dtype=np.int64).ravel()
+    levels = packed & level_mask
+
+    if depth is None:
+        depth = int(levels.max()) if levels.shape[0] else 0
+
+    index = (packed >> level_bits) // level_span[depth]
+
+    row_digits = np.empty((depth + 1, packed.shape[0]), dtype=np.int64)
+    col_digits = np.empty((depth + 1, packed.shape[0]), dtype=np.int64)
+
+    for lv in range(depth, 0, -1):
+        rr = levels_specs[lv - 1]['refine_ratio']
+        index, digit = np.divmod(index, rr * rr)
+        row_digits[lv], col_digits[lv] = np.divmod(digit, rr)
+
+    row_digits[0], col_digits[0] = np.divmod(index, levels_specs[0]['n_col'])
+
+    return levels, row_digits, col_digits
+
+def _level_ratio(from_level, to_level):
+    '''
+    Number of cells at to_level along one side of a cell at from_level (to_level finer).
+    '''
+    return levels_specs[to_level]['n_col'] // levels_specs[from_level]['n_col']
+
+def _grid_ids_to_rowcol(grid_ids, level=None):
+    '''
+    Determine the global row, column index of grid IDs.
+
+    Parameters
+    ----------
+    grid_ids : list or numpy array
+        GEMS grid IDs, as strings or packed integers. Cells may be from different levels.
+    level : int, optional
+        Level of the returned row, column indices. For cells finer than level, this is
+        the index of the ancestor at level; for cells coarser than level, the index of
+        the upper left descendant at level. Defaults to the level of each cell.
+
+    Returns
+    ----------
+    levels, row, col, valid : numpy arrays
+        The level of the returned indices, global row, column indices, and a boolean
+        array of which grid IDs are valid.
+    '''
+    if is_packed(grid_ids):
+        valid = _valid_packed_mask(grid_ids)
+        levels, row_digits, col_digits = _ints_to_digits(np.where(valid, grid_ids, 0))
+    else:
+        levels, row_digits, col_digits, valid = _grid_ids_to_digits(grid_ids)
+
+    # digits past the level of each cell are zero, so indices at depth are
+    #   the upper left descendant of every cell
+    depth = row_digits.shape[0] - 1
+    row, col = _digits_to_rowcol(row_digits, col_digits)
+
+    if level is None:
+        ratio = np.array([_level_ratio(lv, depth) for lv in range(depth + 1)], dtype=np.int64)[levels]
+        return levels, row // ratio, col // ratio, valid
+
+    if level <= depth:
+        ratio = _level_ratio(level, depth)
+        row, col = row // ratio, col // ratio
+    else:
+        ratio = _level_ratio(depth, level)
+        row, col = row * ratio, col * ratio
+
+    return np.full(row.shape[0], level, dtype=np.int64), row, col, valid
+
+def _rowcol_to_grid_ids(row, col, level=0, packed=False):
+    '''
+    Convert global row, column indices at a level into grid IDs.
+
+    Parameters
+    ----------
+    row : numpy array
+        Global row index of the cells at the level.
+    col : numpy array
+        Global column index of the cells at the level.
+    level : int
+        The level of the cells.
+    packed : boolean
+        Return packed 64-bit integer grid IDs instead of strings. Default is False.
+
+    Returns
+    ----------
+    grid_ids : numpy array
+        Grid IDs of the cells.
+    '''
+    row_digits, col_digits = _rowcol_to_digits(row, col, level=level)
+
+    if packed:
+        return _digits_to_ints(row_digits, col_digits)
+
+    return _digits_to_grid_ids(row_digits, col_digits)
+
+def _compact_packed(packed):
+    '''
+    Compact packed grid IDs: replace every complete set of siblings with the parent, repeatedly.
+
+    Parameters
+    ----------
+    packed : numpy array
+        Valid packed grid IDs.
+
+    Returns
+    ----------
+    packed : numpy array
+        Sorted packed grid IDs of the compacted cells.
+    '''
+    packed = np.unique(np.asarray(packed, dtype=np.int64))
+
+    # cells within a cell that is also in the set are redundant. sorted, a cell's
+    #   descendants directly follow it, up to the end of its index range
+    index = packed >> level_bits
+    end = index + np.asarray(level_span, dtype=np.int64)[packed & level_mask]
+    covered = np.zeros(packed.shape[0], dtype=bool)
+    covered[1:] = index[1:] < np.maximum.accumulate(end)[:-1]
+    packed = packed[~covered]
+
+    for lv in range(max_level, 0, -1):
+        at_level = (packed & level_mask) == lv
+        if not at_level.any():
+            continue
+
+        # siblings share a parent; a parent with all level_radix[lv] children is complete
+        span = level_span[lv - 1]
+        cell_parents = (((packed[at_level] >> level_bits) // span * span) << level_bits) | (lv - 1)
+        parents, counts = np.unique(cell_parents, return_counts=True)
+        complete = parents[counts == level_radix[lv]]
+        if complete.shape[0] == 0:
+            continue
+
+        in_complete = np.zeros(packed.shape[0], dtype=bool)
+        in_complete[at_level] = np.isin(cell_parents, complete)
+
+        packed = np.sort(np.concatenate([packed[~in_complete], complete]))
+
+    return packed
+
+def _uncompact_packed(packed, level, chunk_size=None):
+    '''
+    Generate the descendants at a level of packed grid IDs, in chunks of at most chunk_size cells.
+
+    The descendants of a cell at a level are a contiguous range of indices, so each
+    chunk is built from the counts of descendants per cell, without enumerating the
+    intermediate levels.
+
+    Parameters
+    ----------
+    packed : numpy array
+        Valid packed grid IDs, none finer than level.
+    level : int
+        Level of the descendants.
+    chunk_size : int, optional
+        Maximum number of cells per chunk. Defaults to all the cells in one chunk.
+
+    Yields
+    ----------
+    packed : numpy array
+        Packed grid IDs of the next chunk of descendants, in the order of the cells.
+    '''
+    packed = np.asarray(packed, dtype=np.int64)
+    index = packed >> level_bits
+    step = level_span[level]
+
+    counts = np.asarray(level_span, dtype=np.int64)[packed & level_mask] // step
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    total = int(ends[-1]) if ends.shape[0] else 0
+
+    if chunk_size is None:
+        chunk_size = max(total, 1)
+
+    for first in range(0, total, chunk_size):
+        position = np.arange(first, min(first + chunk_size, total), dtype=np.int64)
+        cell = np.searchsorted(ends, position, side='right')
+
+        yield ((index[cell] + (position - starts[cell]) * step) << level_bits) | level
+
+def _as_grid_id_list(grid_ids):
+    '''
+    Convert packed grid IDs to a list of grid ID strings; any other input is returned as is.
+
+    Parameters
+    ----------
+    grid_ids : list or numpy array
+        Grid IDs, as strings or packed integers.
+
+    Returns
+    ----------
+    grid_ids, packed : list, boolean
+        The grid IDs and whether they were supplied in packed form.
+    '''
+    if not is_packed(grid_ids):
+        return grid_ids, False
+
+    levels, row_digits, col_digits = _ints_to_digits(grid_ids)
+
+    return _digits_to_grid_ids(row_digits, col_digits, levels=levels).tolist(), True
+
+def grid_ids_to_ints(grid_ids):
+    '''
+    Convert GEMS grid ID strings to packed 64-bit integers.
+
+    Parameters
+    ----------
+    grid_ids : list or numpy array
+        GEMS grid IDs to convert. Cells may be from different levels.
+
+    Returns
+    -------
+    packed : dict
+        int64 numpy array of packed grid IDs, in the same order as grid_ids.
+    '''
+    if not isinstance(grid_ids, (list, np.ndarray)):
+        return format_response(['Input grid IDs should be list or numpy array'], False)
+
+    levels, row_digits, col_digits, valid = _grid_ids_to_digits(grid_ids)
+
+    if not valid.all():
+        return format_response(['Grid IDs contain improperly formatted IDs'], False)
+
+    return format_response(_digits_to_ints(row_digits, col_digits, levels=levels), True)
+
+def ints_to_grid_ids(packed):
+    '''
+    Convert packed 64-bit integer grid IDs to GEMS grid ID strings.
+
+    Parameters
+    ----------
+    packed : numpy array
+        Integer array of packed grid IDs. Cells may be from different levels.
+
+    Returns
+    -------
+    grid_ids : dict
+        Unicode numpy array of grid IDs, in the same order as packed.
+    '''
+    if not is_packed(packed) or not _valid_packed_mask(packed).all():
+        return format_response(['Packed grid IDs contain invalid values'], False)
+
+    levels, row_digits, col_digits = _ints_to_digits(packed)
+
+    return format_response(_digits_to_grid_ids(row_digits, col_digits, levels=levels), True)
@@ -0,0 +1,509 @@
+'''
+Scanline polygon fill of the GEMS grid.
+
+A cell belongs to a polygon when its center is within the polygon. Rather than testing
+every cell of the polygon's bounding box, the polygon edges are intersected with the
+horizontal line through the cell centers of each row (the scanline). Sorted along the
+row, the crossings pair up into the column runs inside the polygon, so the cost scales
+with the perimeter of the polygon plus the number of cells returned. Lines are walked
+through the grid in the same cell units, one crossed cell edge at a time.
+
+© Regents of the University of Minnesota. All rights reserved.
+This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
+'''
+import numpy as np
+import shapely
+
+from gemsgrid.constants import levels_specs, mult_fac, cell_scale_factors
+from gemsgrid.dggs.utils import shift_range_ease, shift_range_grid_xy
+
+def _polygon_edges(polygon_ease, level=0):
+    '''
+    Edges of all the rings of a (Multi)Polygon, in cell units of the level.
+
+    Parameters
+    ----------
+    polygon_ease : shapely Polygon or MultiPolygon
+        Polygon in EASE Grid v2 coordinates.
+    level : int
+        GEMS grid level.
+
+    Returns
+    ----------
+    x0, y0, x1, y1 : numpy arrays
+        Start and end of every edge, as GEMS grid coordinates scaled to the level, so
+        the cell at row, col spans [col, col + 1) x [row, row + 1).
+    '''
+    rings = shapely.get_rings(shapely.get_parts(polygon_ease))
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+
+    x = np.asarray(shift_range_ease(coords[:, 0], 'x')) * mult_fac[level]
+    y = np.asarray(shift_range_ease(coords[:, 1], 'y')) * mult_fac[level]
+
+    # consecutive vertices of the same ring make an edge (rings are closed)
+    same_ring = ring_index[:-1] == ring_index[1:]
+
+    return x[:-1][same_ring], y[:-1][same_ring], x[1:][same_ring], y[1:][same_ring]
+
+def _line_segments(line_ease, level=0):
+    '''
+    Segments of a (Multi)LineString, in cell units of the level, as _polygon_edges.
+    '''
+    coords, part_index = shapely.get_coordinates(shapely.get_parts(line_ease), return_index=True)
+
+    x = np.asarray(shift_range_ease(coords[:, 0], 'x')) * mult_fac[level]
+    y = np.asarray(shift_range_ease(coords[:, 1], 'y')) * mult_fac[level]
+
+    same_part = part_index[:-1] == part_index[1:]
+
+    return x[:-1][same_part], y[:-1][same_part], x[1:][same_part], y[1:][same_part]
+
+def line_to_rowcol(line_ease, level=0):
+    '''
+    Determine the cells crossed by a line, in the order the line crosses them.
+
+    Each segment is walked through the grid as in Amanatides & Woo (1987): from the cell
+    of its start, every crossing of a column edge moves one column, and every crossing of
+    a row edge one row, in the order of the crossings along the segment. The crossings
+    are computed for all the segments at once, so the cost is proportional to the number
+    of cells crossed. Where a segment goes exactly through a cell corner, the column step
+    is taken first.
+
+    Parameters
+    ----------
+    line_ease : shapely LineString or MultiLineString
+        Line in EASE Grid v2 coordinates.
+    level : int
+        GEMS grid level of the cells.
+
+    Returns
+    ----------
+    row, col : numpy arrays
+        int64 arrays of the global row, column index of the cells, each cell once, in
+        the order the line first crosses them. Cells outside the grid are dropped.
+    '''
+    x0, y0, x1, y1 = _line_segments(line_ease, level=level)
+    n_segments = x0.shape[0]
+
+    col_0, row_0 = np.floor(x0).astype(np.int64), np.floor(y0).astype(np.int64)
+    col_1, row_1 = np.floor(x1).astype(np.int64), np.floor(y1).astype(np.int64)
+
+    def crossings(start, end, v0, v1):
+        # the cell edges between the start and end cell, and where the segment crosses them
+        n_cross = np.abs(end - start)
+        segment = np.repeat(np.arange(n_segments), n_cross)
+        k = np.arange(segment.shape[0], dtype=np.int64) - (np.cumsum(n_cross) - n_cross)[segment]
+
+        step = np.sign(end - start)[segment]
+        edge = np.where(step > 0, start[segment] + 1 + k, start[segment] - k)
+        t = (edge - v0[segment]) / (v1[segment] - v0[segment])
+
+        return segment, t, step
+
+    seg_x, t_x, step_x = crossings(col_0, col_1, x0, x1)
+    seg_y, t_y, step_y = crossings(row_0, row_1, y0, y1)
+
+    # the cell of the start of each segment, then one step per crossing
+    segment = np.concatenate([np.arange(n_segments), seg_x, seg_y])
+    t = np.concatenate([np.full(n_segments, -1.0), t_x, t_y])
+    kind = np.concatenate([np.zeros(n_segments), np.ones(seg_x.shape[0]), np.full(seg_y.shape[0], 2)])
+    d_col = np.concatenate([col_0, step_x, np.zeros(seg_y.shape[0], dtype=np.int64)])
+    d_row = np.concatenate([row_0, np.zeros(seg_x.shape[0], dtype=np.int64), step_y])
+
+    order = np.lexsort((kind, t, segment))
+    segment, d_col, d_row = segment[order], d_col[order], d_row[order]
+
+    # cumulative steps within each segment
+    first = np.searchsorted(segment, segment)
+    col = np.cumsum(d_col)
+    col = col - col[first] + d_col[first]
+    row = np.cumsum(d_row)
+    row = row - row[first] + d_row[first]
+
+    keep = (row >= 0) & (row < levels_specs[level]['n_row']) & (col >= 0) & (col < levels_specs[level]['n_col'])
+    row, col = row[keep], col[keep]
+
+    # each cell once, in the order of its first crossing
+    _, index = np.unique(row * levels_specs[level]['n_col'] + col, return_index=True)
+    index = np.sort(index)
+
+    return row[index], col[index]
+
+def polygon_to_rowcol_runs(polygon_ease, level=0):
+    '''
+    Determine the runs of cells, row by row, whose centers are within a polygon.
+
+    Parameters
+    ----------
+    polygon_ease : shapely Polygon or MultiPolygon
+        Polygon in EASE Grid v2 coordinates.
+    level : int
+        GEMS grid level of the cells.
+
+    Returns
+    ----------
+    row, col_start, col_end : numpy arrays
+        int64 arrays; the cells of run i are row[i], columns col_start[i] to col_end[i] - 1.
+        Runs are sorted by row, then column.
+    '''
+    x0, y0, x1, y1 = _polygon_edges(polygon_ease, level=level)
+
+    # an edge crosses the scanlines (row + 0.5) within [min(y0, y1), max(y0, y1)). the half
+    #   open range counts a vertex shared by two edges once, and skips horizontal edges
+    first_row = np.ceil(np.minimum(y0, y1) - 0.5).astype(np.int64)
+    last_row = np.ceil(np.maximum(y0, y1) - 0.5).astype(np.int64)
+    n_rows = np.maximum(last_row - first_row, 0)
+
+    edge = np.repeat(np.arange(n_rows.shape[0]), n_rows)
+    starts = np.cumsum(n_rows) - n_rows
+    row = first_row[edge] + np.arange(edge.shape[0], dtype=np.int64) - starts[edge]
+
+    x0, y0, x1, y1 = x0[edge], y0[edge], x1[edge], y1[edge]
+    x_cross = x0 + (row + 0.5 - y0) * (x1 - x0) / (y1 - y0)
+
+    # along each scanline, crossings alternate between entering and leaving the polygon
+    order = np.lexsort((x_cross, row))
+    row = row[order][0::2]
+    x_cross = x_cross[order]
+
+    # columns whose center (col + 0.5) is strictly between the crossings
+    col_start = np.floor(x_cross[0::2] - 0.5).astype(np.int64) + 1
+    col_end = np.ceil(x_cross[1::2] - 0.5).astype(np.int64)
+
+    col_start = np.clip(col_start, 0, levels_specs[level]['n_col'])
+    col_end = np.clip(col_end, 0, levels_specs[level]['n_col'])
+
+    keep = (col_end > col_start) & (row >= 0) & (row < levels_specs[level]['n_row'])
+
+    return row[keep], col_start[keep], col_end[keep]
+
+def runs_to_rowcol(row, col_start, col_end):
+    '''
+    Expand runs of cells into the global row, column index of every cell.
+
+    Parameters
+    ----------
+    row, col_start, col_end : numpy arrays
+        Runs of cells, as returned by polygon_to_rowcol_runs.
+
+    Returns
+    ----------
+    row, col : numpy arrays
+        int64 arrays of the global row, column index of the cells.
+    '''
+    counts = np.asarray(col_end, dtype=np.int64) - col_start
+    starts = np.cumsum(counts) - counts
+
+    run = np.repeat(np.arange(counts.shape[0]), counts)
+    col = np.asarray(col_start, dtype=np.int64)[run] + np.arange(run.shape[0], dtype=np.int64) - starts[run]
+
+    return np.asarray(row, dtype=np.int64)[run], col
+
+def _rowcol_to_boxes(row, col, level):
+    '''
+    Polygons, in EASE Grid v2 coordinates, of cells from their global row, column index.
+    '''
+    scale = cell_scale_factors[level]
+
+    return shapely.box(shift_range_grid_xy(col * scale, 'x'), shift_range_grid_xy((row + 1) * scale, 'y'),
+                       shift_range_grid_xy((col + 1) * scale, 'x'), shift_range_grid_xy(row * scale, 'y'))
+
+def _subdivide(polygon_ease, level=0):
+    '''
+    Subdivide the grid from Level 0 down to a level, keeping only the cells on the polygon boundary.
+
+    Parameters
+    ----------
+    polygon_ease : shapely Polygon or MultiPolygon
+        Prepared polygon in EASE Grid v2 coordinates.
+    level : int
+        GEMS grid level to subdivide to.
+
+    Returns
+    ----------
+    covered, candidates : tuples
+        (levels, row, col) of the cells coarser than level that are covered by the polygon,
+        and (row, col) of the cells at level that may intersect the polygon: the children
+        of the boundary cells at the level above.
+    '''
+    # Level 0 cells of the polygon's bounding box
+    min_x, min_y, max_x, max_y = polygon_ease.bounds
+    col_0, col_1 = np.clip([np.floor(shift_range_ease(min_x, 'x')), np.ceil(shift_range_ease(max_x, 'x'))],
+                           0, levels_specs[0]['n_col']).astype(np.int64)
+    row_0, row_1 = np.clip([np.floor(shift_range_ease(max_y, 'y')), np.ceil(shift_range_ease(min_y, 'y'))],
+                           0, levels_specs[0]['n_row']).astype(np.int64)
+
+    row, col = np.meshgrid(np.arange(row_0, row_1, dtype=np.int64),
+                           np.arange(col_0, col_1, dtype=np.int64), indexing='ij')
+    row = row.ravel()
+    col = col.ravel()
+
+    out_levels, out_row, out_col = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)], \
+        [np.empty(0, dtype=np.int64)]
+
+    for lv in range(level):
+        boxes = _rowcol_to_boxes(row, col, lv)
+
+        covered = shapely.covered_by(boxes, polygon_ease)
+        out_levels.append(np.full(covered.sum(), lv, dtype=np.int64))
+        out_row.append(row[covered])
+        out_col.append(col[covered])
+
+        boundary = ~covered & shapely.intersects(boxes, polygon_ease)
+        row, col = row[boundary], col[boundary]
+
+        rr = levels_specs[lv]['refine_ratio']
+        offset = np.arange(rr, dtype=np.int64)
+        row = (row[:, None, None] * rr + offset[None, :, None]).repeat(rr, axis=2).ravel()
+        col = (col[:, None, None] * rr + offset[None, None, :]).repeat(rr, axis=1).ravel()
+
+    covered = (np.concatenate(out_levels), np.concatenate(out_row), np.concatenate(out_col))
+
+    return covered, (row, col)
+
+def _expand_rowcol(levels, row, col, level):
+    '''
+    Global row, column index at a level of all the descendants of coarser cells.
+    '''
+    ratio = np.array([levels_specs[level]['n_col'] // levels_specs[lv]['n_col'] for lv in range(level + 1)],
+                     dtype=np.int64)[levels]
+    counts = ratio * ratio
+    starts = np.cumsum(counts) - counts
+    cell = np.repeat(np.arange(counts.shape[0]), counts)
+    d_row, d_col = np.divmod(np.arange(cell.shape[0], dtype=np.int64) - starts[cell], ratio[cell])
+
+    return row[cell] * ratio[cell] + d_row, col[cell] * ratio[cell] + d_col
+
+def polygon_to_compact_rowcol(polygon_ease, level=0):
+    '''
+    Determine the cells of a polygon at a level, with fully covered areas as coarser cells.
+
+    Cells are subdivided from Level 0 down. A cell covered by the polygon is kept at its
+    own level, a cell outside the polygon is dropped, and only the cells on the boundary
+    of the polygon are subdivided. At the target level, a cell is kept when its center is
+    within the polygon, as in polygon_to_rowcol_runs. The descendants at the target level
+    of the returned cells are exactly the cells of polygon_to_rowcol_runs.
+
+    Parameters
+    ----------
+    polygon_ease : shapely Polygon or MultiPolygon
+        Polygon in EASE Grid v2 coordinates.
+    level : int
+        GEMS grid level of the finest cells.
+
+    Returns
+    ----------
+    levels, row, col : numpy arrays
+        int64 arrays of the level and global row, column index (at that level) of the cells.
+    '''
+    shapely.prepare(polygon_ease)
+
+    # the centers of all the descendants of a covered cell are within the polygon
+    (levels, row, col), (cand_row, cand_col) = _subdivide(polygon_ease, level=level)
+
+    scale = cell_scale_factors[level]
+    x = shift_range_grid_xy((cand_col + 0.5) * scale, 'x')
+    y = shift_range_grid_xy((cand_row + 0.5) * scale, 'y')
+    within = shapely.contains_xy(polygon_ease, x, y)
+
+    return (np.concatenate([levels, np.full(within.sum(), level, dtype=np.int64)]),
+            np.concatenate([row, cand_row[within]]), np.concatenate([col, cand_col[within]]))
+
+coverage_predicates = ('intersects', 'contains', 'fraction')
+
+def polygon_to_rowcol_coverage(polygon_ease, level=0, predicate='intersects'):
+    '''
+    Determine the cells of a level that intersect, or are contained by, a polygon.
+
+    Cells covered by the polygon are found at the coarsest level possible, and have a
+    fraction of 1 without any further geometry operation. Only the cells on the boundary
+    of the polygon are tested (predicate) or clipped (fraction) at the level.
+
+    Parameters
+    ----------
+    polygon_ease : shapely Polygon or MultiPolygon
+        Polygon in EASE Grid v2 coordinates.
+    level : int
+        GEMS grid level of the cells.
+    predicate : str
+        'intersects' for the cells that intersect the polygon, 'contains' for the cells
+        completely within the polygon, or 'fraction' for the cells that overlap the
+        polygon, with the share of their area within the polygon. Default is 'intersects'.
+
+    Returns
+    ----------
+    row, col, fraction : numpy arrays
+        Global row, column index of the cells, in row major order, and the fraction of each
+        cell's area within the polygon (None unless predicate is 'fraction').
+    '''
+    shapely.prepare(polygon_ease)
+
+    (levels, row, col), (cand_row, cand_col) = _subdivide(polygon_ease, level=level)
+
+    # the covered coarser cells, at the level
+    row, col = _expand_rowcol(levels, row, col, level)
+    fraction = np.ones(row.shape[0], dtype=np.float64)
+
+    boxes = _rowcol_to_boxes(cand_row, cand_col, level)
+    if predicate == 'intersects':
+        keep = shapely.intersects(boxes, polygon_ease)
+    elif predicate == 'contains':
+        keep = shapely.covered_by(boxes, polygon_ease)
+    else:
+        # covered candidates need no clipping
+        cand_fraction = np.ones(cand_row.shape[0], dtype=np.float64)
+        covered = shapely.covered_by(boxes, polygon_ease)
+        partial = ~covered & shapely.intersects(boxes, polygon_ease)
+        cand_fraction[partial] = shapely.area(shapely.intersection(boxes[partial], polygon_ease)) / \
+            shapely.area(boxes[partial])
+        keep = covered | (partial & (cand_fraction > 0))
+        fraction = np.concatenate([fraction, cand_fraction[keep]])
+
+    row = np.concatenate([row, cand_row[keep]])
+    col = np.concatenate([col, cand_col[keep]])
+
+    order = np.lexsort((col, row))
+    if predicate != 'fraction':
+        return row[order], col[order], None
+
+    return row[order], col[order], fraction[order]
+
+def _split_runs(row, col_start, col_end, width):
+    '''
+    Split runs of cells at every multiple of width columns.
+    '''
+    first = col_start // width
+    n_blocks = (col_end - 1) // width - first + 1
+    starts = np.cumsum(n_blocks) - n_blocks
+
+    run = np.repeat(np.arange(n_blocks.shape[0]), n_blocks)
+    block = first[run] + np.arange(run.shape[0], dtype=np.int64) - starts[run]
+
+    return row[run], np.maximum(col_start[run], block * width), np.minimum(col_end[run], (block + 1) * width)
+
+def chunk_runs(row, col_start, col_end, chunk_size=None):
+    '''
+    Expand runs of cells into chunks of at most chunk_size cells, splitting runs as needed.
+
+    Parameters
+    ----------
+    row, col_start, col_end : numpy arrays
+        Runs of cells, as returned by polygon_to_rowcol_runs.
+    chunk_size : int, optional
+        The maximum number of cells of a chunk. Default is None, for a single chunk.
+
+    Yields
+    ----------
+    row, col : numpy arrays
+        Global row, column index of the cells of each chunk, in the order of the runs.
+    '''
+    counts = col_end - col_start
+    ends = np.cumsum(counts)
+    total = int(ends[-1]) if ends.shape[0] else 0
+    chunk_size = chunk_size or max(total, 1)
+
+    for start in range(0, total, chunk_size):
+        stop = min(start + chunk_size, total)
+        # the runs holding the first and last cells of the chunk
+        first = np.searchsorted(ends, start, side='right')
+        last = np.searchsorted(ends, stop, side='left') + 1
+
+        chunk_start = col_start[first:last].copy()
+        chunk_end = col_end[first:last].copy()
+        chunk_start[0] += start - (ends[first] - counts[first])
+        chunk_end[-1] -= ends[last - 1] - stop
+
+        yield runs_to_rowcol(row[first:last], chunk_start, chunk_end)
+
+def polygon_to_rowcol_tiles(polygon_ease, level=0, tile_level=0, predicate='centroid', chunk_size=None):
+    '''
+    Determine the cells of a polygon one tile at a time, in chunks of bounded size.
+
+    The tiles are the cells of tile_level that overlap the polygon, visited in row major
+    order; the cells of each tile are in row major order too. Only the cells of one tile
+    are held in memory at a time (one chunk, for tiles within the polygon), so a
+    generator can stream the fill of very large polygons, and be stopped early.
+
+    With the 'centroid' predicate, the scanline runs of the whole polygon are cut at the
+    tile edges, and the cells are the same as those of polygon_to_rowcol_runs. With the
+    other predicates, tiles covered by the polygon are filled without any geometry
+    operation, and the polygon is clipped to each tile on its boundary before
+    polygon_to_rowcol_coverage. Both cells and fractions are unchanged by the clipping,
+    as a cell of a tile overlaps the polygon only where it overlaps the clipped polygon.
+
+    Parameters
+    ----------
+    polygon_ease : shapely Polygon or MultiPolygon
+        Polygon in EASE Grid v2 coordinates.
+    level : int
+        GEMS grid level of the cells.
+    tile_level : int
+        GEMS grid level of the tiles, at most level. Default is 0.
+    predicate : str
+        'centroid' for the cells whose center is within the polygon, or one of the
+        predicates of polygon_to_rowcol_coverage. Default is 'centroid'.
+    chunk_size : int, optional
+        Maximum number of cells per chunk. Default is None, one chunk per tile.
+
+    Yields
+    ----------
+    row, col, fraction : numpy arrays
+        Global row, column index of the cells of a chunk, and the fraction of each cell's
+        area within the polygon (None unless predicate is 'fraction').
+    '''
+    ratio = levels_specs[level]['n_col'] // levels_specs[tile_level]['n_col']
+
+    if predicate == 'centroid':
+        all_row, all_start, all_end = polygon_to_rowcol_runs(polygon_ease, level=level)
+
+        # runs are sorted by row, and cut at the tile edges one row of tiles at a time
+        band_ends = np.cumsum(np.bincount(all_row // ratio)) if all_row.shape[0] else np.empty(0, dtype=np.int64)
+        for band_start, band_end in zip(np.r_[0, band_ends[:-1]], band_ends):
+            row, col_start, col_end = _split_runs(all_row[band_start:band_end], all_start[band_start:band_end],
+                                                  all_end[band_start:band_end], ratio)
+
+            order = np.lexsort((col_start, row, col_start // ratio))
+            row, col_start, col_end = row[order], col_start[order], col_end[order]
+
+            splits = np.flatnonzero(np.diff(col_start // ratio)) + 1
+            for runs in zip(np.split(row, splits), np.split(col_start, splits), np.split(col_end, splits)):
+                for chunk_row, chunk_col in chunk_runs(*runs, chunk_size=chunk_size):
+                    yield chunk_row, chunk_col, None
+        return
+
+    shapely.prepare(polygon_ease)
+
+    (levels, row, col), (cand_row, cand_col) = _subdivide(polygon_ease, level=tile_level)
+    row, col = _expand_rowcol(levels, row, col, tile_level)
+
+    boxes = _rowcol_to_boxes(cand_row, cand_col, tile_level)
+    covered = shapely.covered_by(boxes, polygon_ease)
+    boundary = ~covered & shapely.intersects(boxes, polygon_ease)
+
+    tile_row = np.concatenate([row, cand_row[covered], cand_row[boundary]])
+    tile_col = np.concatenate([col, cand_col[covered], cand_col[boundary]])
+    tile_boxes = np.concatenate([np.full(row.shape[0] + covered.sum(), None, dtype=object), boxes[boundary]])
+
+    for i in np.lexsort((tile_col, tile_row)):
+        r, c = tile_row[i], tile_col[i]
+
+        if tile_boxes[i] is None:
+            # whole tile, one run per row
+            tile_runs = (np.arange(r * ratio, (r + 1) * ratio, dtype=np.int64),
+                         np.full(ratio, c * ratio, dtype=np.int64), np.full(ratio, (c + 1) * ratio, dtype=np.int64))
+            for chunk_row, chunk_col in chunk_runs(*tile_runs, chunk_size=chunk_size):
+                yield chunk_row, chunk_col, (np.ones(chunk_row.shape[0]) if predicate == 'fraction' else None)
+            continue
+
+        clipped = shapely.intersection(polygon_ease, tile_boxes[i])
+        cell_row, cell_col, fraction = polygon_to_rowcol_coverage(clipped, level=level, predicate=predicate)
+
+        # cells of the neighbouring tiles touching the tile edge
+        keep = (cell_row // ratio == r) & (cell_col // ratio == c)
+        cell_row, cell_col = cell_row[keep], cell_col[keep]
+        fraction = fraction[keep] if fraction is not None else None
+
+        step = chunk_size or max(cell_row.shape[0], 1)
+        for start in range(0, cell_row.shape[0], step):
+            yield (cell_row[start:start + step], cell_col[start:start + step],
+                   fraction[start:start + step] if fraction is not None else None)
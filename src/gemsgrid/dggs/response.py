@@ -0,0 +1,28 @@
+'''
+Module for formatting responses for API.
+
+© Regents of the University of Minnesota. All rights reserved.
+This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
+'''
+
+def format_response(data, success):
+    '''
+    Format the library repsonse for return to API
+    Args:
+         data: list
+            Contains data, or the error message
+        success :(boolean)
+            Indicatication of function success or failure.
+    Returns:
+        response : dict
+            The formatted response to return to the API.
+    '''
+    if success:
+        response =  {'success' : success,
+                    'result' : {'data' :data}}
+
+    else:
+        response =  {'success' : success,
+                    'result' : {'error_message':data}}
+
+    return response
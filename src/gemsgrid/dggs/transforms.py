@@ -4,13 +4,354 @@ Funtions for geographic transformations on to, and off of the GEMS Grid.
 © Regents of the University of Minnesota. All rights reserved.
 This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
 '''
-from geopandas import GeoSeries
+import threading
+from functools import lru_cache
+
+import numpy as np
+from geopandas import GeoSeries, points_from_xy
+from pyproj import Transformer
+import shapely
 from shapely.geometry import Point
 
-from gemsgrid.constants import grid_spec, levels_specs, ease_crs, geo_crs, cell_scale_factors
+from gemsgrid.constants import levels_specs, ease_crs, geo_crs, cell_scale_factors, \
+    ease_proj_spec
 
 from gemsgrid.dggs.utils import shift_range_ease, shift_range_grid_xy
 
+# pyproj Transformers are expensive to build and are not safe to share between threads.
+#   each thread keeps its own cache of transformers, keyed by (source_crs, target_crs)
+_transformer_cache = threading.local()
+
+def get_transformer(source_crs = geo_crs, target_crs = ease_crs):
+    '''
+    Get a cached coordinate transformer between two coordinate reference systems.
+
+    Transformers are built once per thread and (source_crs, target_crs) pair, and
+    always use x, y (lon, lat) axis order.
+
+    Parameters
+    ----------
+    source_crs : int, str or pyproj CRS
+        The source coordinate reference system. Default is geo_crs.
+    target_crs : int, str or pyproj CRS
+        The target coordinate reference system. Default is ease_crs.
+
+    Returns
+    -------
+    transformer : pyproj Transformer
+        Transformer from source_crs to target_crs, owned by the calling thread.
+    '''
+    cache = getattr(_transformer_cache, 'transformers', None)
+    if cache is None:
+        cache = _transformer_cache.transformers = {}
+
+    key = (source_crs, target_crs)
+    transformer = cache.get(key)
+    if transformer is None:
+        transformer = Transformer.from_crs(source_crs, target_crs, always_xy=True)
+        cache[key] = transformer
+
+    return transformer
+
+# EASE Grid v2 is a cylindrical equal area projection: x is linear in longitude, and y
+#   depends only on latitude, through the authalic latitude. The closed form below follows
+#   Snyder (1987), Map Projections - A Working Manual, eq. 3-12, 3-16, 3-18 and 10-15.
+_a = ease_proj_spec['a']
+_e2 = ease_proj_spec['f'] * (2 - ease_proj_spec['f'])
+_e = np.sqrt(_e2)
+_lon_0 = ease_proj_spec['lon_0']
+_k0 = np.cos(np.radians(ease_proj_spec['lat_ts'])) / \
+    np.sqrt(1 - _e2 * np.sin(np.radians(ease_proj_spec['lat_ts'])) ** 2)
+
+def _authalic_q(sin_lat):
+    return (1 - _e2) * (sin_lat / (1 - _e2 * sin_lat ** 2) + np.arctanh(_e * sin_lat) / _e)
+
+_qp = _authalic_q(1.0)
+_authalic_coefs = (_e2 / 3 + 31 * _e2 ** 2 / 180 + 517 * _e2 ** 3 / 5040,
+                   23 * _e2 ** 2 / 360 + 251 * _e2 ** 3 / 3780,
+                   761 * _e2 ** 3 / 45360)
+
+def lon_lat_to_ease(lon, lat):
+    '''
+    Closed form conversion of geographic (WGS84) coordinates to EASE Grid v2 coordinates.
+
+    Agrees with PROJ (EPSG:4326 -> EPSG:6933) to within 1e-6 m.
+
+    Parameters
+    ----------
+    lon, lat : float or numpy array
+        Longitude, latitude in decimal degrees.
+
+    Returns
+    -------
+    x_ease, y_ease : numpy array
+        EASE Grid v2 x, y coordinates in meters.
+    '''
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+
+    x_ease = _a * _k0 * np.radians(lon - _lon_0)
+    y_ease = _a * _authalic_q(np.sin(np.radians(lat))) / (2 * _k0)
+
+    return x_ease, y_ease
+
+def ease_to_lon_lat(x_ease, y_ease):
+    '''
+    Closed form conversion of EASE Grid v2 coordinates to geographic (WGS84) coordinates.
+
+    Round trips with lon_lat_to_ease to within 1e-8 degrees, and agrees with PROJ
+    (EPSG:6933 -> EPSG:4326) to within 2e-6 degrees; the difference is the truncation
+    error of PROJ's inverse series, which is largest near the poles. y values beyond
+    the poles return nan.
+
+    Parameters
+    ----------
+    x_ease, y_ease : float or numpy array
+        EASE Grid v2 x, y coordinates in meters.
+
+    Returns
+    -------
+    lon, lat : numpy array
+        Longitude, latitude in decimal degrees.
+    '''
+    x_ease = np.asarray(x_ease, dtype=np.float64)
+    y_ease = np.asarray(y_ease, dtype=np.float64)
+
+    # sine of the authalic latitude. values a rounding error past the poles are the poles
+    sin_beta = 2 * _k0 * y_ease / (_a * _qp)
+    sin_beta = np.where(np.abs(sin_beta) <= 1 + 1e-12, np.clip(sin_beta, -1, 1), np.nan)
+    beta = np.arcsin(sin_beta)
+
+    # sin(4b), sin(6b) from sin(2b), cos(2b)
+    sin_2b = np.sin(2 * beta)
+    cos_2b = np.cos(2 * beta)
+    lat = beta + sin_2b * (_authalic_coefs[0] + 2 * _authalic_coefs[1] * cos_2b +
+                           _authalic_coefs[2] * (3 - 4 * sin_2b ** 2))
+
+    # a single Newton step removes the truncation error of the series (~1e-8 degrees)
+    sin_lat = np.sin(lat)
+    esin_lat = 1 - _e2 * sin_lat ** 2
+    cos_lat_2 = 1 - sin_lat ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = esin_lat ** 2 / (2 * np.sqrt(cos_lat_2)) * \
+            (_qp * sin_beta / (1 - _e2) - sin_lat / esin_lat - np.arctanh(_e * sin_lat) / _e)
+    lat = np.where(cos_lat_2 > 1e-16, lat + step, lat)
+
+    lon = np.degrees(x_ease / (_a * _k0)) + _lon_0
+
+    return lon, np.degrees(lat)
+
+def project_coords(x, y, source_crs = geo_crs, target_crs = ease_crs, use_proj = False):
+    '''
+    Transform coordinate arrays between coordinate reference systems.
+
+    Transformations between geo_crs and ease_crs use the closed form EASE Grid v2
+    projection, unless use_proj is set. All other pairs use the cached PROJ transformer.
+
+    Parameters
+    ----------
+    x, y : numpy array
+        x (longitude), y (latitude) coordinates in source_crs.
+    source_crs : int, str or pyproj CRS
+        The source coordinate reference system. Default is geo_crs.
+    target_crs : int, str or pyproj CRS
+        The target coordinate reference system. Default is ease_crs.
+    use_proj : bool
+        Use PROJ for all transformations. Default is False.
+
+    Returns
+    -------
+    x, y : numpy array
+        Transformed x, y coordinates in target_crs.
+    '''
+    if not use_proj:
+        if (source_crs == geo_crs) and (target_crs == ease_crs):
+            return lon_lat_to_ease(x, y)
+
+        if (source_crs == ease_crs) and (target_crs == geo_crs):
+            return ease_to_lon_lat(x, y)
+
+    return get_transformer(source_crs, target_crs).transform(x, y)
+
+def project_geometry(geometry, source_crs = geo_crs, target_crs = ease_crs, use_proj = False):
+    '''
+    Transform shapely geometries between coordinate reference systems.
+
+    The coordinates of all the geometries are transformed at once with project_coords,
+    in place of building a GeoSeries and calling to_crs.
+
+    Parameters
+    ----------
+    geometry : shapely geometry or numpy array of shapely geometries
+        Geometries in source_crs.
+    source_crs : int, str or pyproj CRS
+        The source coordinate reference system. Default is geo_crs.
+    target_crs : int, str or pyproj CRS
+        The target coordinate reference system. Default is ease_crs.
+    use_proj : bool
+        Use PROJ for all transformations. Default is False.
+
+    Returns
+    -------
+    geometry : shapely geometry or numpy array of shapely geometries
+        Geometries in target_crs.
+    '''
+    def transform(coords):
+        x, y = project_coords(coords[:, 0], coords[:, 1], source_crs = source_crs, target_crs = target_crs,
+                              use_proj = use_proj)
+        return np.column_stack([x, y])
+
+    return shapely.transform(geometry, transform)
+
+def _axis_coords(index, level, axis, crs, centers):
+    '''
+    Coordinates of the column (x) or row (y) centers or edges of a level, by index.
+    '''
+    grid_coords = (np.asarray(index) + (0.5 if centers else 0.0)) * cell_scale_factors[level]
+
+    coords = np.asarray(shift_range_grid_xy(grid_coords, axis), dtype=np.float64)
+
+    if crs == geo_crs:
+        if axis == 'x':
+            coords, _ = ease_to_lon_lat(coords, 0.0)
+        else:
+            _, coords = ease_to_lon_lat(0.0, coords)
+
+    return coords
+
+# in a cylindrical equal area grid, the latitude (y) of a cell depends only on its row, and
+#   the longitude (x) only on its column. the tables of the coarse levels are small (Level 3
+#   columns: 34,704 values) and are kept; the finer levels are computed for the cells requested
+_table_max_level = 3
+
+def _build_axis_table(level, axis, crs, centers):
+    n_cells = levels_specs[level]['n_col'] if axis == 'x' else levels_specs[level]['n_row']
+
+    coords = _axis_coords(np.arange(n_cells + (0 if centers else 1)), level, axis, crs, centers)
+
+    # the tables are shared, make sure callers can't change them
+    coords.flags.writeable = False
+
+    return coords
+
+@lru_cache(maxsize=None)
+def _axis_table(level, axis, crs, centers):
+    return _build_axis_table(level, axis, crs, centers)
+
+def _lookup_axis(index, level, axis, crs, centers):
+    '''
+    Coordinates of the column (x) or row (y) centers or edges, by index: looked up in the
+    tables for the coarse levels, and computed for the finer levels.
+    '''
+    index, level = np.asarray(index), np.asarray(level)
+
+    if level.ndim == 0:
+        if level <= _table_max_level:
+            return _axis_table(int(level), axis, crs, centers)[index]
+
+        return _axis_coords(index, level, axis, crs, centers)
+
+    index, level = np.broadcast_arrays(index, level)
+
+    coarse = level <= _table_max_level
+    if not coarse.any():
+        return _axis_coords(index, level, axis, crs, centers)
+
+    coords = np.empty(index.shape, dtype=np.float64)
+    for lv in range(_table_max_level + 1):
+        mask = level == lv
+        if mask.any():
+            coords[mask] = _axis_table(lv, axis, crs, centers)[index[mask]]
+
+    if not coarse.all():
+        coords[~coarse] = _axis_coords(index[~coarse], level[~coarse], axis, crs, centers)
+
+    return coords
+
+def grid_axis_table(level, axis, crs = ease_crs, centers = True):
+    '''
+    Lookup table of the row (y) or column (x) coordinates for a level.
+
+    The tables of Levels 0 - 3 are built once and shared, and back rowcol_to_centroids and
+    rowcol_to_bounds. The tables of the finer levels are large (Level 6 columns: 34,704,001
+    values, ~280MB), so are built on each call and not kept.
+
+    Parameters
+    ----------
+    level : int
+        GEMS grid level.
+    axis : str
+        'x' for the column coordinates, or 'y' for the row coordinates.
+    crs : int
+        ease_crs for EASE Grid v2 coordinates (meters), or geo_crs for longitude, latitude.
+        Default is ease_crs.
+    centers : bool
+        Return the coordinates of the cell centers (n_col | n_row values). Otherwise, the
+        coordinates of the cell edges (n_col + 1 | n_row + 1 values), starting from the
+        left (x) or top (y) of the grid. Default is True.
+
+    Returns
+    -------
+    coords : numpy array
+        Read only array of coordinates, indexed by column (x) or row (y).
+    '''
+    if level not in levels_specs or axis not in ('x', 'y') or crs not in (ease_crs, geo_crs):
+        return False
+
+    if level <= _table_max_level:
+        return _axis_table(int(level), axis, crs, bool(centers))
+
+    return _build_axis_table(int(level), axis, crs, bool(centers))
+
+def rowcol_to_centroids(row, col, level, crs = ease_crs):
+    '''
+    Compute the centroid coordinates of cells from their global row, column index.
+
+    Parameters
+    ----------
+    row, col : numpy array
+        Global row, column indices of the cells.
+    level : int or numpy array
+        GEMS grid level of the cells.
+    crs : int
+        ease_crs or geo_crs. Default is ease_crs.
+
+    Returns
+    -------
+    x, y : numpy array
+        Centroid coordinates of the cells.
+    '''
+    row, col, level = np.asarray(row), np.asarray(col), np.asarray(level)
+
+    return (_lookup_axis(col, level, 'x', crs, True),
+            _lookup_axis(row, level, 'y', crs, True))
+
+def rowcol_to_bounds(row, col, level, crs = ease_crs):
+    '''
+    Compute the bounding box of cells from their global row, column index.
+
+    Parameters
+    ----------
+    row, col : numpy array
+        Global row, column indices of the cells.
+    level : int or numpy array
+        GEMS grid level of the cells.
+    crs : int
+        ease_crs or geo_crs. Default is ease_crs.
+
+    Returns
+    -------
+    min_x, min_y, max_x, max_y : numpy array
+        Bounding box coordinates of the cells.
+    '''
+    row, col, level = np.asarray(row), np.asarray(col), np.asarray(level)
+
+    # rows are numbered from the top of the grid, so the bottom edge is the next row
+    return (_lookup_axis(col, level, 'x', crs, False),
+            _lookup_axis(row + 1, level, 'y', crs, False),
+            _lookup_axis(col + 1, level, 'x', crs, False),
+            _lookup_axis(row, level, 'y', crs, False))
+
 def ease_coord_to_grid_xy_coord(x_ease, y_ease):
     '''
     Convert DGGS cell coordinates to EASE Grid v2 coordinates
@@ -102,7 +443,9 @@ def coords_lon_lat_to_coords_ease(coords_lon_lat, source_crs = geo_crs, target_c
     if not isinstance(coords_lon_lat, list):
         return False
 
-    coords_lon_lat = GeoSeries([Point(coord[0], coord[1]) for coord in coords_lon_lat], crs = source_crs)
-    coords_ease = coords_lon_lat.to_crs(target_crs)
+    coords_lon_lat = np.asarray(coords_lon_lat, dtype=np.float64).reshape(-1, 2)
+    x_ease, y_ease = get_transformer(source_crs, target_crs).transform(coords_lon_lat[:, 0],
+                                                                       coords_lon_lat[:, 1])
+    coords_ease = GeoSeries(points_from_xy(x_ease, y_ease), crs = target_crs)
 
     return coords_ease
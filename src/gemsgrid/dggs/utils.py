@@ -9,33 +9,15 @@ from itertools import chain, product, tee
 import numpy as np
 import geopandas as gpd
 
+import shapely
 from shapely import wkt
 from shapely.geometry import Polygon, Point
 
 from gemsgrid.constants import levels_specs, ease_crs, grid_spec
 from gemsgrid.logConfig import logger
 
-def format_response(data, success):
-    '''
-    Format the library repsonse for return to API
-    Args:
-         data: list
-            Contains data, or the error message
-        success :(boolean)
-            Indicatication of function success or failure.
-    Returns:
-        response : dict
-            The formatted response to return to the API.
-    '''
-    if success:
-        response =  {'success' : success,
-                    'result' : {'data' :data}}
-
-    else:
-        response =  {'success' : success,
-                    'result' : {'error_message':data}}
-
-    return response
+from gemsgrid.dggs.response import format_response
+from gemsgrid.dggs.packing import _grid_ids_to_rowcol, _rowcol_to_grid_ids
 
 def boundbox_to_poly(left, bottom, right, top):
     '''
@@ -70,6 +52,59 @@ def boundbox_to_poly(left, bottom, right, top):
 
     return poly
 
+def bounds_to_polygons(left, bottom, right, top):
+    '''
+    Convert arrays of bounding extents to an array of polygons.
+
+    The vertices are ordered as in boundbox_to_poly: upper left, upper right, lower right,
+    lower left.
+
+    Parameters
+    ----------
+    left, bottom, right, top : numpy array
+        Edges of the bounding boxes.
+
+    Returns
+    -------
+    polygons : numpy array
+        Array of shapely Polygons corresponding with the bounding boxes.
+    '''
+    left, bottom, right, top = np.broadcast_arrays(*[np.asarray(edge, dtype=np.float64)
+                                                     for edge in (left, bottom, right, top)])
+
+    ring = np.stack([np.stack([left, top], axis=-1),
+                     np.stack([right, top], axis=-1),
+                     np.stack([right, bottom], axis=-1),
+                     np.stack([left, bottom], axis=-1),
+                     np.stack([left, top], axis=-1)], axis=-2)
+
+    return shapely.polygons(ring)
+
+def load_geometry(geometry):
+    '''
+    Load a geometry from Well Known Text, Well Known Binary, or a shapely geometry.
+
+    Parameters
+    ----------
+    geometry : str, bytes or shapely geometry
+        WKT string, WKB bytes, or a shapely geometry, which is returned as is.
+
+    Returns
+    -------
+    geometry : shapely geometry
+        The geometry; None when the input is none of these.
+    '''
+    if isinstance(geometry, str):
+        return wkt.loads(geometry)
+
+    if isinstance(geometry, (bytes, bytearray, memoryview)):
+        return shapely.from_wkb(bytes(geometry))
+
+    if isinstance(geometry, shapely.Geometry):
+        return geometry
+
+    return None
+
 def get_polygon_corners(polygon, ccw=True):
     '''
     Get the bounds of a polygon
@@ -119,7 +154,7 @@ def enumerate_id_elements(refine_ratio):
 
     return sub_elements
 
-def enumerate_grid_table_rows(x_coords, y_coords, level=0, parent_id = None):
+def enumerate_grid_table_rows(x_coords, y_coords, level=0, parent_id = None, wkt_out = True):
     '''
     Generate grid polygons for cells using x, y cooridnate vectors.
     Parameters
@@ -132,46 +167,42 @@ def enumerate_grid_table_rows(x_coords, y_coords, level=0, parent_id = None):
         The grid level for the corresponding geometries.
     parent_id : String
         Denotes the cell id of the parent cell. Default is None.
+    wkt_out : boolean
+        Return the geometries and centroids as WKT. Otherwise, as numpy arrays of shapely
+        geometries. Default is True.
 
     Returns
     -------
     Relevant child cell characteritics: Row ID, Column ID, Grid ID, Geometry and Centroid
     '''
-    geoms = []
-    r_ind = []
-    c_ind = []
-    grid_ids = []
-    centroid = []
-    if level == 0:
-        neighbors = []
-#         children = []
-
-    x_i = np.arange(1,len(x_coords))
-    y_i = np.arange(1,len(y_coords))
+    x_coords = np.asarray(x_coords, dtype=np.float64)
+    y_coords = np.asarray(y_coords, dtype=np.float64)
 
-    for r,c in product(np.arange(1,len(y_coords), 1), np.arange(1,len(x_coords), 1)):
-        c = int(c)
-        r = int(r)
+    # row major order: every column of the first row, then the next row
+    row, col = np.meshgrid(np.arange(len(y_coords) - 1, dtype=np.int64),
+                           np.arange(len(x_coords) - 1, dtype=np.int64), indexing='ij')
+    row = row.ravel()
+    col = col.ravel()
 
-        poly = boundbox_to_poly(left = x_coords[c-1],
-                                bottom = y_coords[r],
-                                right = x_coords[c],
-                                top = y_coords[r-1])
-        geoms.append(poly.wkt)
-        centroid.append(poly.centroid.wkt)
-        ci = c - 1
-        ri = r -1
+    geoms = bounds_to_polygons(left = x_coords[col], bottom = y_coords[row + 1],
+                               right = x_coords[col + 1], top = y_coords[row])
+    centroid = shapely.centroid(geoms)
 
-        r_ind.append(ri)
-        c_ind.append(ci)
+    if wkt_out:
+        geoms = shapely.to_wkt(geoms, rounding_precision=-1).tolist()
+        centroid = shapely.to_wkt(centroid, rounding_precision=-1).tolist()
 
-        if level == 0:
-            grid_id = 'L0.{:03d}{:03d}'.format(ri, ci)
+    r_ind = row.tolist()
+    c_ind = col.tolist()
 
-        else:
-            grid_id = '{}.{:d}{:d}'.format(parent_id, ri, ci)
+    # the child row, column index within the parent is offset by the global row, column
+    #   index of the parent's upper left child
+    if level > 0:
+        _, p_row, p_col, _ = _grid_ids_to_rowcol([parent_id], level=level)
+        row = row + p_row[0]
+        col = col + p_col[0]
 
-        grid_ids.append(grid_id)
+    grid_ids = _rowcol_to_grid_ids(row, col, level=level).tolist()
 
     return r_ind, c_ind, grid_ids, geoms, centroid
 
@@ -266,7 +297,6 @@ def calc_grid_coord_vectors(min_x, min_y, max_x, max_y, level=0, levels_specs =
     #    the refine_ratio for levels is associuated with the partent in the dict
     else:
         level = level -1
-        level = str(level)
         x_col = levels_specs[level]['refine_ratio'] + 1
         y_row = levels_specs[level]['refine_ratio'] + 1
 
@@ -13,12 +13,13 @@ import numpy as np
 import rasterio
 from geopandas import GeoSeries
 from itertools import chain, product
-from pyproj import Transformer
 from shapely.geometry import Point
 
 from gemsgrid.constants import levels_specs, grid_spec, ease_crs, geo_crs
 
-from gemsgrid.dggs.grid_addressing import coords_ease_to_coords_grid, _grid_xy_to_grid_id
+from gemsgrid.dggs.grid_addressing import coords_ease_to_coords_grid, _grid_xy_to_rowcol
+from gemsgrid.dggs.packing import _grid_ids_to_rowcol, _level_ratio
+from gemsgrid.dggs.transforms import get_transformer
 from gemsgrid.dggs.utils import shift_range_grid_multiple, pairwise_circle, flatten, \
     add_nodes, epsilon_check
 
@@ -27,11 +28,15 @@ from gemsgrid.dggs.utils import shift_range_grid_multiple, pairwise_circle, flat
 # Helper functions
 #
 ######
-# define the pyproj Transforms necessary. need both a
+# the pyproj Transforms necessary. need both a
 #   from WGS84 -> EASE v2 (w2e) and
 #   from EASE v2 -> WGS84 (e2w)
-w2e = Transformer.from_crs(geo_crs, ease_crs, always_xy=True).transform
-e2w = Transformer.from_crs(ease_crs, geo_crs, always_xy=True).transform
+#   transformers come from the per thread cache, so these are safe to call from threads
+def w2e(x, y, **kwargs):
+    return get_transformer(geo_crs, ease_crs).transform(x, y, **kwargs)
+
+def e2w(x, y, **kwargs):
+    return get_transformer(ease_crs, geo_crs).transform(x, y, **kwargs)
 
 
 def grid_id_to_corner_coord(gid, level, shift=False):
@@ -39,8 +44,8 @@ def grid_id_to_corner_coord(gid, level, shift=False):
 
     Parameters
     ----------
-    gid : str
-        Grid ID of the cell.
+    gid : str or int
+        Grid ID of the cell, as a string or a packed integer.
     corner : str
         The type of corner to generate coordinates for
         (upper_left | upper_right | lower_right | lower_left)
@@ -49,85 +54,45 @@ def grid_id_to_corner_coord(gid, level, shift=False):
     corner_x, corner_y : np.array
         EASE grid coordinate (x, y) of the cell' corner. Resolution determined using grid ID.
     """
-    # r_digit = 6
-    # decompse the GEMS grid ID into its level parts. Then remove the first compoenent
-    #   which, is simply represent the Level of the cell.
-    id_elements = gid.split('.')
-    # level = int(id_elements[0][-1])
-    id_elements.pop(0)
-
-    # the gridID contains the index values for number of rows|columns, from a 0,0 orgin
-    #   This is the 'global' position within the larger grid
-    #
-    #  Remember format is Lx.RRRCCC.RC.RC ...; y=R, x=C
-    #
-    #   Those R, C components indicate the location/number of grid cells that
-    #   correspond with the location in gems grid space
-    #
-    #   This can be explicitly exploited such that:
-    #   ([RRR, R, ... R] * [level[0]['x_length], ... level[6]['x_length]]).sum()
-    #   ([CCC, C, ... C] * [level[0]['y_length],... level[6]['y_length]]).sum()
-    #   will give the coordinates to the edge of the pixel. For example:
-    #
-    #   [L6.202482.13.21.00.00.00.00] would decompose into
-    #     x = [482, 3, 2, 0, 0, 0, 0]
-    #     y = [202, 1, 1, 0, 0, 0, 0]
-    #
-    #   To determining the coordinate of the left, top edges at Level 2
-    #     x = 482 * level[0]['x_length] + 3 * [level[1]['x_length] + 2 * [level[`2`]['x_length]
-    #     y = 202 * [level[0]['x_length] + 1 * [level[1]['x_length] + 1 * [level[2]['x_length]
-    #
-    #   and to determin if it is an edge at level 2, all the remaining Level components must be
-    #       zero: [ 0, 0, 0, 0]] summing them all ensure that they are zero
-    #
-    #   if we asked for the Level 1 coordinate, it would be different. x|y coord is calculated
-    #   using the L0, L1 compoents:
-    #   x = 482 * level[0]['x_length] + 3 * [level[1]['x_length] + 2
-    #
-    #   but then we need to check if it is on an L1 edge. this requires all other compontes to be
-    #       zeros:
-    #       [2, 0, 0, 0, 0]
-    #   since it is not a Level 1 edge, if we needed a right, bottom value, we'd have to shfit
-    #       the last L1 index up by one
-
-    # beyond level 0, the row | column index is grid location within the L0 pixes
-    #    This is the relative position within the gloabl position.
-    # spliting these into indexes, which requires converstion from str to ints
-    level_x_i = np.array([int(id[1]) if len(id) != 6 else int(id[3:]) \
-                          for id in id_elements], dtype=int)
-    level_y_i = np.array([int(id[0]) if len(id) != 6 else int(id[0:3]) \
-                          for id in id_elements], dtype=int)
-
-    # remainders of levels are useful for figuring out if on edge on not
-    #   depending on supplied level, we can drop unnecesary levels for
-    #   determining the coodinates, but only need the levels < specified
-    #   level for determing if it is an edge pixel or not
-    if int(level) < 6:
-        level_x_r = level_x_i[int(level) + 1:]
-        level_y_r = level_y_i[int(level) + 1:]
+    if isinstance(gid, (int, np.integer)):
+        gid = np.array([gid], dtype=np.int64)
     else:
-        level_x_r = level_x_i[int(level):]
-        level_y_r = level_y_i[int(level):]
+        gid = [gid]
 
-    level_x_i = level_x_i[:int(level) + 1]
-    level_y_i = level_y_i[:int(level) + 1]
+    level = int(level)
 
-    if (level_x_r.sum() != 0) and shift:
-        # print(f'level_x_r: {level_x_r}; sum: {level_x_r.sum()}')
-        # print('shifting x')
-        level_x_i[-1] += 1
+    # the global row, column index of a cell is the number of rows|columns between
+    #   the 0,0 origin (upper left of the grid) and the upper left corner of the cell.
+    #   y=row, x=col. Multiplying by the cell size of the level gives the coordinate of
+    #   that corner. For example, at its own level:
+    #
+    #   [L6.202482.13.21.00.00.00.00] has row 7287000, col 17382000 at Level 6, so
+    #     x = 17382000 * level[6]['x_length'];  y = 7287000 * level[6]['y_length']
+    #
+    #   for a coarser level, the index of the ancestor is an integer division of the
+    #   cell's index (see grid_ids_to_rowcol). The remainder tells us if the corner of
+    #   the cell sits on an edge of the coarser level; if it does not, and a right,
+    #   bottom value is needed (shift), we move to the next edge.
+    cell_level, row, col, _ = _grid_ids_to_rowcol(gid)
+    cell_level, row, col = int(cell_level[0]), int(row[0]), int(col[0])
+
+    if level >= cell_level:
+        ratio = _level_ratio(cell_level, level)
+        row, row_r = row * ratio, 0
+        col, col_r = col * ratio, 0
+    else:
+        ratio = _level_ratio(level, cell_level)
+        row, row_r = divmod(row, ratio)
+        col, col_r = divmod(col, ratio)
 
-    if (level_y_r.sum() != 0) and shift:
-        # print(f'level_y_r: {level_y_r}; sum: {level_y_r.sum()}')
-        # print('shifting y')
-        level_y_i[-1] += 1
+    if (col_r != 0) and shift:
+        col += 1
 
-    # print (f'level_x_i: {level_x_i}; level_y_i: {level_y_i}')
-    corner_x = np.array([level_x_i[i] * levels_specs[i]['x_length'] \
-                         for i in range(level_x_i.shape[0])]).sum()
+    if (row_r != 0) and shift:
+        row += 1
 
-    corner_y = np.array([level_y_i[i] * levels_specs[i]['y_length'] \
-                         for i in range(level_y_i.shape[0])]).sum()
+    corner_x = col * levels_specs[level]['x_length']
+    corner_y = row * levels_specs[level]['y_length']
 
     return corner_x, corner_y
 
@@ -175,7 +140,7 @@ def gems_grid_bounds(bounds, source_crs, level):
     #   then use
     if source_crs != ease_crs:
         line_segments = [add_nodes(ls[0], ls[1]) for ls in line_segments]
-        tranform_coords = Transformer.from_crs(source_crs, ease_crs, always_xy=True).transform
+        tranform_coords = get_transformer(source_crs, ease_crs).transform
         line_segments = [[tranform_coords(c[0], c[1]) for c in seg] for seg in line_segments]
 
     # may not need to drop the last elements in each list (recall, the last element of
@@ -195,12 +160,20 @@ def gems_grid_bounds(bounds, source_crs, level):
                           crs=ease_crs)
 
     bbox_grid_xy = coords_ease_to_coords_grid(bound_box)
-    bbox_gridID = bbox_grid_xy.apply(lambda x: _grid_xy_to_grid_id(x, 6))
-
-    # if we use upper_right, and lower left coords only, we can apply
-    #   shift or not, to both points.
-    upper_left = grid_id_to_corner_coord(bbox_gridID.iloc[0], level=level)
-    lower_right = grid_id_to_corner_coord(bbox_gridID.iloc[1], level=level, shift=True)
+    x_grid = np.array([pt.x for pt in bbox_grid_xy])
+    y_grid = np.array([pt.y for pt in bbox_grid_xy])
+
+    # the upper left corner is the edge of the cell containing it; the lower right
+    #   is the first cell edge at, or beyond it. Bounds from another crs usually come
+    #   from GEMS cell edges projected out of EASE v2; the lon, lat -> y round trip is
+    #   only good to a couple of millimeters near the poles, so those edges are matched
+    #   to within 1/100 of a Level 6 cell (~1 cm), and a bound on a cell edge is kept
+    tol = 1e-6 if source_crs == ease_crs else 1e-2
+    row_ul, col_ul = _grid_xy_to_rowcol(x_grid[:1], y_grid[:1], level=level, tol=tol)
+    row_lr, col_lr = _grid_xy_to_rowcol(x_grid[1:], y_grid[1:], level=level, ceil=True, tol=tol)
+
+    upper_left = (col_ul[0] * levels_specs[level]['x_length'], row_ul[0] * levels_specs[level]['y_length'])
+    lower_right = (col_lr[0] * levels_specs[level]['x_length'], row_lr[0] * levels_specs[level]['y_length'])
 
     ease_xs = [upper_left[0], lower_right[0]]
     ease_ys = [lower_right[1], upper_left[1]]
@@ -6,9 +6,21 @@ This software is released under an Apache 2.0 license. Further details about the
 '''
 import gemsgrid.processing_tools.disaggregate_vectors as dv
 import gemsgrid.processing_tools.disaggregate_rasters as dr
-from gemsgrid.dggs.checks import check_level
+from gemsgrid.constants import levels_specs
+from gemsgrid.dggs.checks import check_level, check_memory_budget
+from gemsgrid.dggs.estimate import estimate_output_bytes
 from gemsgrid.logConfig import logger
 
+def _check_output_size(n_cells, dtype, memory_budget):
+    """
+    Raise an exception if an output array of n_cells values of dtype is over the memory budget
+    """
+    n_bytes = estimate_output_bytes(n_cells, dtype=dtype)
+    logger.debug("Disaggregated array has {} cells ({} bytes)".format(n_cells, n_bytes))
+    if not check_memory_budget(n_bytes, memory_budget):
+        raise Exception("Disaggregated array of {} cells ({} bytes) is over the memory budget of {} bytes"
+                        .format(n_cells, n_bytes, memory_budget))
+
 def disaggregate (**kwards):
     """
     Disaggregate raster or vector data to GEMS
@@ -56,6 +68,9 @@ def disaggregate (**kwards):
             Describes the path of the input raster file
         source_level: int
             Valid GEMS level of the original data, options are: 0, 1, 2, 3, 4, 5, 6
+        memory_budget: int (optional)
+            Maximum size in bytes of the disaggregated array, which is built in memory; larger
+            outputs are refused before they are produced. Defaults to None (no budget)
         Returns
         -------
         no return
@@ -76,6 +91,8 @@ def disaggregate (**kwards):
         ease_gdf = dv.open_and_project_vector(kwards["invectorpath"])
         logger.debug("STEP 2 of 4: Generate geoproperties")
         dict_geoproperties = dv.generate_raster_geoproperties(ease_gdf, kwards["target_level"], kwards["globalextent"])
+        _check_output_size(dict_geoproperties["n_row"] * dict_geoproperties["n_col"], float,
+                           kwards.get("memory_budget", None))
         logger.debug("STEP 3 of 4: Produce disaggregated array")
         rasterized = dv.rasterize_unmasked(ease_gdf, kwards["var"], dict_geoproperties, kwards["operation"],
                                            kwards.get("vectornodata", -9999))
@@ -88,6 +105,8 @@ def disaggregate (**kwards):
         logger.debug("STEP 2 of 4: Generate geoproperties")
         dict_geoproperties = dv.generate_raster_geoproperties_and_maskarray(ease_gdf, kwards["inmaskpath"],
                                                                             kwards["clip"])
+        _check_output_size(dict_geoproperties["n_row"] * dict_geoproperties["n_col"], float,
+                           kwards.get("memory_budget", None))
         logger.debug("STEP 3 of 4: Produce disaggregated array")
         rasterized = dv.rasterize_masked(ease_gdf, kwards["var"], dict_geoproperties, kwards["operation"],
                                          kwards.get("vectornodata", -9999), kwards.get("categories_dict", None))
@@ -97,6 +116,8 @@ def disaggregate (**kwards):
     elif kwards["input_type"] == "raster_unmasked":
         logger.debug("STEP 1 of 4: Open input file")
         data_dict = dr.open_raster(kwards["inrasterpath"])
+        _check_output_size(data_dict["array"].size * levels_specs[kwards["source_level"]]["refine_ratio"] ** 2,
+                           float, kwards.get("memory_budget", None))
         logger.debug("STEP 2 of 4: Generate geoproperties")
         scaled_transform = dr.scale_transform(data_dict["transform"], kwards["source_level"])
         logger.debug("STEP 3 of 4: Produce disaggregated array")
@@ -106,6 +127,8 @@ def disaggregate (**kwards):
     elif kwards["input_type"] == "raster_masked":
         logger.debug("STEP 1 of 4: Open input file")
         data_dict = dr.open_raster(kwards["inrasterpath"])
+        _check_output_size(data_dict["array"].size * levels_specs[kwards["source_level"]]["refine_ratio"] ** 2,
+                           float, kwards.get("memory_budget", None))
         logger.debug("STEP 2 of 4: Generate geoproperties")
         scaled_transform = dr.scale_transform(data_dict["transform"], kwards["source_level"])
         logger.debug("STEP 3 of 4: Produce disaggregated array")
@@ -0,0 +1,241 @@
+'''
+This module attaches GEMS grid IDs to point observations stored in CSV or Parquet files.
+
+The files are read in fixed size chunks, so memory use is bounded by the chunk size
+rather than the size of the file.
+
+© Regents of the University of Minnesota. All rights reserved.
+This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
+'''
+import os
+import time
+
+import pandas as pd
+
+from gemsgrid.constants import geo_crs, ease_crs
+from gemsgrid.dggs.checks import check_level
+from gemsgrid.dggs.grid_addressing import lon_lat_to_grid_ids
+from gemsgrid.dggs.utils import format_response
+from gemsgrid.logConfig import logger
+
+csv_extensions = ('.csv', '.txt', '.csv.gz', '.csv.bz2', '.csv.zip')
+parquet_extensions = ('.parquet', '.pq')
+
+def _file_format(path, file_format=None):
+    '''
+    Determine the format ('csv' or 'parquet') of a file from its extension.
+    '''
+    if file_format is not None:
+        return file_format.lower()
+
+    path = str(path).lower()
+    if path.endswith(parquet_extensions):
+        return 'parquet'
+    if path.endswith(csv_extensions):
+        return 'csv'
+
+    raise ValueError(f'Unable to determine the format of {path}; options are: csv, parquet')
+
+def _import_pyarrow():
+    '''
+    Import pyarrow, which is only needed for Parquet files.
+    '''
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as err:
+        raise ImportError('Reading and writing Parquet files requires pyarrow (pip install pyarrow)') from err
+
+    return pa, pq
+
+def read_point_chunks(in_path, chunk_size=1000000, columns=None, file_format=None):
+    '''
+    Read a CSV or Parquet file as a sequence of DataFrames of at most chunk_size rows.
+
+    Parameters
+    ----------
+    in_path : str
+        Path of the input CSV or Parquet file.
+    chunk_size : int
+        Maximum number of rows per chunk. Default is 1,000,000.
+    columns : list, optional
+        Columns to read. Default is all the columns.
+    file_format : str, optional
+        'csv' or 'parquet'. Default is determined from the file extension.
+
+    Yields
+    ------
+    chunk : DataFrame
+        The next chunk_size rows of the file.
+    '''
+    file_format = _file_format(in_path, file_format)
+
+    if file_format == 'csv':
+        for chunk in pd.read_csv(in_path, usecols=columns, chunksize=chunk_size):
+            yield chunk
+
+    elif file_format == 'parquet':
+        _, pq = _import_pyarrow()
+        parquet_file = pq.ParquetFile(in_path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+
+    else:
+        raise ValueError(f'File format {file_format} is not supported; options are: csv, parquet')
+
+def stream_grid_ids(in_path, level=0, lon_col='lon', lat_col='lat', id_col='grid_id', chunk_size=1000000,
+                    columns=None, packed=False, source_crs=geo_crs, target_crs=ease_crs, file_format=None,
+                    use_proj=False, workers=None):
+    '''
+    Read lon, lat observations from a CSV or Parquet file in chunks, and attach their GEMS grid IDs.
+
+    Each chunk is indexed with lon_lat_to_grid_ids, so only one chunk is held in memory
+    at a time. The throughput (rows/s) is logged after every chunk.
+
+    Parameters
+    ----------
+    in_path : str
+        Path of the input CSV or Parquet file.
+    level : int or list
+        The level of the grid IDs. When a list of levels, one ID column is added per level,
+        named '{id_col}_L{level}'. Default is 0.
+    lon_col, lat_col : str
+        Names of the longitude, latitude columns. Default is 'lon', 'lat'.
+    id_col : str
+        Name of the grid ID column to add. Default is 'grid_id'.
+    chunk_size : int
+        Maximum number of rows indexed at once. Default is 1,000,000.
+    columns : list, optional
+        Columns of the input to keep in the output. Default is all the columns.
+    packed : boolean
+        Add packed 64-bit integer grid IDs instead of strings. Default is False.
+    file_format : str, optional
+        'csv' or 'parquet'. Default is determined from the file extension.
+    use_proj : boolean
+        Reproject with PROJ instead of the closed form EASE Grid v2 projection. Default is False.
+    workers : int, optional
+        Number of processes each chunk is split across. Default is None, a single process.
+
+    Yields
+    ------
+    chunk : DataFrame
+        The next chunk of the input, with the grid ID column(s) added.
+    '''
+    levels = level if isinstance(level, (list, tuple)) else [level]
+    if (len(levels) == 0) or not all(check_level(lv) for lv in levels):
+        raise ValueError('The specified level is invalid.')
+
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be a positive number of rows.')
+
+    if columns is not None:
+        columns = list(dict.fromkeys(list(columns) + [lon_col, lat_col]))
+
+    n_rows = 0
+    start = time.perf_counter()
+
+    for chunk in read_point_chunks(in_path, chunk_size=chunk_size, columns=columns, file_format=file_format):
+        response = lon_lat_to_grid_ids(lon=chunk[lon_col].to_numpy(dtype=float),
+                                       lat=chunk[lat_col].to_numpy(dtype=float),
+                                       level=level, source_crs=source_crs, target_crs=target_crs,
+                                       packed=packed, use_proj=use_proj, workers=workers)
+        if not response['success']:
+            raise ValueError(f"Rows {n_rows} to {n_rows + len(chunk) - 1} of {in_path}: "
+                             f"{response['result']['error_message']}")
+
+        grid_ids = response['result']['data']
+        if isinstance(level, (list, tuple)):
+            for lv in levels:
+                chunk[f'{id_col}_L{lv}'] = grid_ids[lv]
+        else:
+            chunk[id_col] = grid_ids
+
+        n_rows += len(chunk)
+        elapsed = time.perf_counter() - start
+        logger.info('stream_grid_ids - {:,} rows indexed in {:.1f} s ({:,.0f} rows/s)'.format(
+            n_rows, elapsed, n_rows / max(elapsed, 1e-9)))
+
+        yield chunk
+
+def index_points_file(in_path, out_path, level=0, lon_col='lon', lat_col='lat', id_col='grid_id',
+                      chunk_size=1000000, columns=None, packed=False, source_crs=geo_crs,
+                      target_crs=ease_crs, in_format=None, out_format=None, use_proj=False, workers=None):
+    '''
+    Attach GEMS grid IDs to the lon, lat observations of a CSV or Parquet file, and write the
+    result chunk by chunk to a new CSV or Parquet file.
+
+    Parameters
+    ----------
+    in_path : str
+        Path of the input CSV or Parquet file.
+    out_path : str
+        Path of the output CSV or Parquet file. An existing file is overwritten.
+    level : int or list
+        The level of the grid IDs. When a list of levels, one ID column is written per level.
+        Default is 0.
+    lon_col, lat_col : str
+        Names of the longitude, latitude columns. Default is 'lon', 'lat'.
+    id_col : str
+        Name of the grid ID column to add. Default is 'grid_id'.
+    chunk_size : int
+        Maximum number of rows held in memory at once. Default is 1,000,000.
+    columns : list, optional
+        Columns of the input to keep in the output. Default is all the columns.
+    packed : boolean
+        Write packed 64-bit integer grid IDs instead of strings. Default is False.
+    in_format, out_format : str, optional
+        'csv' or 'parquet'. Default is determined from the file extensions.
+    use_proj : boolean
+        Reproject with PROJ instead of the closed form EASE Grid v2 projection. Default is False.
+    workers : int, optional
+        Number of processes each chunk is split across. Default is None, a single process.
+
+    Returns
+    -------
+    summary : dict
+        The number of rows written, the elapsed seconds, and the throughput (rows/s).
+    '''
+    try:
+        out_format = _file_format(out_path, out_format)
+    except ValueError as err:
+        return format_response([str(err)], False)
+
+    if out_format not in ('csv', 'parquet'):
+        return format_response([f'File format {out_format} is not supported; options are: csv, parquet'], False)
+
+    chunks = stream_grid_ids(in_path, level=level, lon_col=lon_col, lat_col=lat_col, id_col=id_col,
+                             chunk_size=chunk_size, columns=columns, packed=packed, source_crs=source_crs,
+                             target_crs=target_crs, file_format=in_format, use_proj=use_proj,
+                             workers=workers)
+
+    n_rows = 0
+    start = time.perf_counter()
+    writer = None
+
+    try:
+        if out_format == 'csv':
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            for chunk in chunks:
+                chunk.to_csv(out_path, mode='a', header=(n_rows == 0), index=False)
+                n_rows += len(chunk)
+        else:
+            pa, pq = _import_pyarrow()
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(out_path, table.schema)
+                writer.write_table(table)
+                n_rows += len(chunk)
+
+    except ValueError as err:
+        return format_response([str(err)], False)
+
+    finally:
+        if writer is not None:
+            writer.close()
+
+    elapsed = time.perf_counter() - start
+    data = {'rows': n_rows, 'seconds': elapsed, 'rows_per_sec': n_rows / max(elapsed, 1e-9)}
+
+    return format_response(data, True)
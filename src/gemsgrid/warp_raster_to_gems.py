@@ -6,7 +6,8 @@ This software is released under an Apache 2.0 license. Further details about the
 '''
 from gemsgrid.constants import grid_spec, levels_specs, ease_crs
 from gemsgrid.grid_align import gems_grid_bounds
-from gemsgrid.dggs.checks import check_level
+from gemsgrid.dggs.checks import check_level, check_memory_budget
+from gemsgrid.dggs.estimate import estimate_output_bytes
 import rasterio
 from rasterio.crs import CRS
 from rasterio.enums import Resampling
@@ -61,7 +62,7 @@ def generate_raster_geoproperties (dataset, level, globalextent):
     return dst_transform, n_row, n_col
 
 def warp_raster_to_gems(inrasterpath, outrasterpath, level, globalextent, resamplingmethod, nodata=None,
-                        tolerance=0.125, blocksize=256):
+                        tolerance=0.125, blocksize=256, memory_budget=None):
     """
     Project raster file to GEMS grid
         Arguments
@@ -90,6 +91,10 @@ def warp_raster_to_gems(inrasterpath, outrasterpath, level, globalextent, resamp
         blocksize: int (optional)
             Sets the tile width and height in pixels. Options are: 256, 512, 1024, 2048, 4096.
             Defaults to 256
+        memory_budget: int (optional)
+            Maximum size in bytes of the warped raster to read into memory at once.
+            Larger rasters are warped and written block by block instead.
+            Defaults to None (no budget)
         Returns
             -------
             no return
@@ -120,8 +125,14 @@ def warp_raster_to_gems(inrasterpath, outrasterpath, level, globalextent, resamp
         }
         logger.debug("VRT options are the following: ")
         logger.debug(vrt_options)
+        n_bytes = estimate_output_bytes(n_row * n_col * src.count, dtype=src.dtypes[0])
+        logger.debug("Warped raster is {} bytes".format(n_bytes))
         with WarpedVRT(src, **vrt_options) as vrt:
-            vrt.read()
+            if check_memory_budget(n_bytes, memory_budget):
+                vrt.read()
+            else:
+                logger.debug("Warped raster is over the memory budget of {} bytes, warping block by block"
+                             .format(memory_budget))
             rio_shutil.copy(vrt, outrasterpath, driver="COG", compress="lzw", blocksize=blocksize,
                             overviews=None)
             logger.debug("Raster warped and saved")
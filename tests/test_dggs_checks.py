@@ -169,3 +169,9 @@ class TestCheckGid(TestDict):
     def test_validate_grid_ids_invalid(self):
         results = validate_grid_ids(self._bad_gid)
         assert(not results[0]), 'validate_grid_ids faile to detect invalid grid IDS'
+
+class TestCheckMemoryBudget(object):
+    def test_check_memory_budget(self):
+        assert(check_memory_budget(100, 100) and check_memory_budget(10**12)), \
+            'check_memory_budget failed for an output within the budget'
+        assert(not check_memory_budget(101, 100)), 'check_memory_budget failed to detect an output over the budget'
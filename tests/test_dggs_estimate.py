@@ -0,0 +1,55 @@
+'''
+Test for the GEMS Grid DGGS cell count and memory estimates.
+
+© Regents of the University of Minnesota. All rights reserved.
+This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
+'''
+
+import pytest
+import numpy as np
+import shapely
+import geopandas as gpd
+
+from gemsgrid.constants import levels_specs, ease_crs
+from gemsgrid.dggs.grid_addressing import ease_polygon_to_grid_ids
+from gemsgrid.dggs.estimate import estimate_cells, estimate_output_bytes
+
+class TestEstimateCells(object):
+
+    @pytest.fixture(autouse=True)
+    def _set_polygon(self):
+        self._polygon = shapely.Point(1e5, 1e6).buffer(40000).difference(shapely.Point(1e5, 1e6).buffer(10000))
+
+    def test_estimate_cells(self):
+        for predicate in ['centroid', 'intersects', 'contains']:
+            n_cells = len(ease_polygon_to_grid_ids(self._polygon.wkt, level = 3, predicate = predicate,
+                                                   packed = True)['result']['data'])
+            for method in ['area', 'runs']:
+                estimate = estimate_cells(self._polygon, level = 3, predicate = predicate, method = method)
+                assert abs(estimate - n_cells) < 0.02 * n_cells, \
+                    'estimate_cells is off for {} with the {} method'.format(predicate, method)
+
+    def test_estimate_cells_runs_exact(self):
+        '''At a level where the polygon spans few rows, the runs count is the centroid fill'''
+        n_cells = len(ease_polygon_to_grid_ids(self._polygon.wkt, level = 2, packed = True)['result']['data'])
+        assert estimate_cells(self._polygon.wkt, level = 2, method = 'runs') == n_cells, \
+            'estimate_cells did not count the cells of the polygon exactly'
+
+    def test_estimate_cells_grid(self):
+        assert estimate_cells(level = 5) == levels_specs[5]['n_row'] * levels_specs[5]['n_col'], \
+            'estimate_cells did not return the number of cells of the grid'
+
+        gdf = gpd.GeoDataFrame(geometry = [self._polygon, self._polygon, None], crs = ease_crs).to_crs(4326)
+        assert np.isclose(estimate_cells(gdf, level = 3), 2 * estimate_cells(self._polygon, level = 3), rtol = 1e-3), \
+            'estimate_cells did not sum the estimates of a GeoDataFrame'
+
+class TestEstimateOutputBytes(object):
+
+    def test_estimate_output_bytes(self):
+        assert estimate_output_bytes(10, level = 2, packed = True, fraction = True) == 160, \
+            'estimate_output_bytes is wrong for packed grid IDs and fractions'
+        assert estimate_output_bytes(10, dtype = np.float32) == 40, \
+            'estimate_output_bytes is wrong for raster values'
+        assert estimate_output_bytes(10, level = 6) > estimate_output_bytes(10, level = 2) > \
+            estimate_output_bytes(10, level = 2, packed = True), \
+            'estimate_output_bytes did not account for the length of the grid ID strings'
@@ -16,10 +16,13 @@ from gemsgrid.constants import grid_spec, levels_specs, cell_scale_factors
 
 from gemsgrid.dggs.utils import shift_range_ease, shift_range_grid_xy, shift_range_grid_multiple
 from gemsgrid.dggs.transforms import coords_lon_lat_to_coords_ease, coords_ease_to_coords_grid, \
-    grid_xy_coord_to_ease_coord
+    grid_xy_coord_to_ease_coord, ease_to_lon_lat
 
 from gemsgrid.dggs.grid_addressing import geos_to_grid_ids, grid_ids_to_geos, grid_ids_to_ease,  \
-        _gid_to_coord_ease, _grid_xy_to_grid_id, ease_polygon_to_grid_ids, geo_polygon_to_grid_ids
+        _gid_to_coord_ease, _grid_xy_to_grid_id, ease_polygon_to_grid_ids, geo_polygon_to_grid_ids, \
+        lon_lat_to_grid_ids, _grid_xy_to_rowcol, grid_ids_to_rowcol, rowcol_to_grid_ids, \
+        grid_ids_to_polygons, grid_table
+from gemsgrid.dggs.packing import grid_ids_to_ints
 
 '''
 Each of the grid_id, centroids, and geos sets below corresponds with
@@ -65,6 +68,107 @@ class TestGeosToGridIds(TestDict):
                 assert (valid == result['result']['data']), \
                     'geo_to_grid did not return expected grid IDs for level {}'.format(lv)
 
+    def test_geos_to_grid_ids_grid_edges(self):
+        coords = [(180., 0.), (-180., 0.), (0., 85.0445), (0., -85.0445), (180., -85.0445), (-180., 85.0445)]
+        valid = [(203, 963), (203, 0), (0, 482), (405, 482), (405, 963), (0, 0)]
+        result = geos_to_grid_ids(coords, level = 0)
+        assert result['result']['data'] == ['L0.{:03d}{:03d}'.format(row, col) for row, col in valid], \
+            'geo_to_grid did not return the edge cells of the grid'
+
+        result = geos_to_grid_ids(coords, level = 6, packed = True)
+        assert np.array_equal(result['result']['data'], grid_ids_to_ints(geos_to_grid_ids(coords, level = 6)['result']['data'])['result']['data']), \
+            'geo_to_grid did not return the same packed and string edge cells of the grid'
+
+class TestGeosToGridIdsPacked(TestDict):
+    def test_geos_to_grid_ids_packed(self):
+        for lv,_ in self._test_dict.items():
+            valid = grid_ids_to_ints(self._test_dict[lv]['grid_ids'])['result']['data']
+            result = geos_to_grid_ids(coords_lon_lat = self._test_dict[lv]['geos'], level = lv, packed = True)
+            assert (np.array_equal(valid, result['result']['data'])), \
+                'geo_to_grid did not return expected packed grid IDs for level {}'.format(lv)
+
+    def test_geos_to_grid_ids_multi_level(self):
+        coords = self._test_dict[6]['geos']
+        result = geos_to_grid_ids(coords_lon_lat = coords, level = [0, 6])
+        assert (result['result']['data'][6] == self._test_dict[6]['grid_ids']), \
+            'geo_to_grid did not return expected grid IDs for level 6 of multiple levels'
+        assert (result['result']['data'][0] == geos_to_grid_ids(coords, level = 0)['result']['data']), \
+            'geo_to_grid did not return expected grid IDs for level 0 of multiple levels'
+
+class TestLonLatToGridIds(TestDict):
+    def test_lon_lat_to_grid_ids(self):
+        '''
+        The array version must return the same grid IDs as geos_to_grid_ids, for all levels
+        '''
+        for lv,_ in self._test_dict.items():
+            valid = self._test_dict[lv]['grid_ids']
+            coords = np.array(self._test_dict[lv]['geos'])
+            result = lon_lat_to_grid_ids(lon = coords[:, 0], lat = coords[:, 1], level = lv)
+            assert result['success'], 'lon_lat_to_grid_ids failed for valid coordinates'
+            assert isinstance(result['result']['data'], np.ndarray), \
+                'lon_lat_to_grid_ids did not return a numpy array'
+            assert (valid == result['result']['data'].tolist()), \
+                'lon_lat_to_grid_ids did not return expected grid IDs for level {}'.format(lv)
+
+    def test_lon_lat_to_grid_ids_dedupe(self):
+        coords = np.array(self._test_dict[6]['geos'] * 3)
+        valid = self._test_dict[6]['grid_ids'] * 3
+        for dedupe in [True, False]:
+            result = lon_lat_to_grid_ids(lon = coords[:, 0], lat = coords[:, 1], level = 6,
+                                         dedupe = dedupe)
+            assert (valid == result['result']['data'].tolist()), \
+                'lon_lat_to_grid_ids did not preserve input order with dedupe={}'.format(dedupe)
+
+    def test_lon_lat_to_grid_ids_multi_level(self):
+        coords = np.array(self._test_dict[6]['geos'])
+        levels = list(self._test_dict.keys())
+        for packed in [False, True]:
+            result = lon_lat_to_grid_ids(lon = coords[:, 0], lat = coords[:, 1], level = levels,
+                                         packed = packed)
+            assert (sorted(result['result']['data'].keys()) == sorted(levels)), \
+                'lon_lat_to_grid_ids did not return grid IDs for every requested level'
+            for lv in levels:
+                valid = lon_lat_to_grid_ids(lon = coords[:, 0], lat = coords[:, 1], level = lv,
+                                            packed = packed)
+                assert np.array_equal(result['result']['data'][lv], valid['result']['data']), \
+                    'lon_lat_to_grid_ids multi level IDs differ from level {} (packed={})'.format(lv, packed)
+
+    def test_lon_lat_to_grid_ids_workers(self):
+        coords = np.array([geo for lv in self._test_dict for geo in self._test_dict[lv]['geos']])
+        for packed in [False, True]:
+            for level in [6, [0, 3, 6]]:
+                valid = lon_lat_to_grid_ids(lon = coords[:, 0], lat = coords[:, 1], level = level,
+                                            packed = packed)['result']['data']
+                result = lon_lat_to_grid_ids(lon = coords[:, 0], lat = coords[:, 1], level = level,
+                                             packed = packed, workers = 3)['result']['data']
+                if isinstance(level, list):
+                    assert all(np.array_equal(valid[lv], result[lv]) for lv in level), \
+                        'lon_lat_to_grid_ids with workers differs from a single process (packed={})'.format(packed)
+                else:
+                    assert np.array_equal(valid, result), \
+                        'lon_lat_to_grid_ids with workers differs from a single process (packed={})'.format(packed)
+
+    def test_lon_lat_to_grid_ids_workers_grid_edges(self):
+        lon = np.array([180., -180., 180. - 1e-9, -180. + 1e-9, 0., 0., 180., -180., 180. - 1e-9, 0.])
+        lat = np.array([0., 0., 0., 0., 85.0445, -85.0445, 85.0445, -85.0445, -85.0445 + 1e-9, 85.0445 - 1e-9])
+        for packed in [False, True]:
+            for level in [2, 6]:
+                valid = lon_lat_to_grid_ids(lon = lon, lat = lat, level = level, packed = packed)['result']['data']
+                result = lon_lat_to_grid_ids(lon = lon, lat = lat, level = level, packed = packed,
+                                             workers = 2)['result']['data']
+                assert np.array_equal(valid, result), \
+                    'lon_lat_to_grid_ids with workers differs from a single process at the grid edges (packed={})'.format(packed)
+
+    def test_lon_lat_to_grid_ids_invalid(self):
+        result = lon_lat_to_grid_ids(lon = np.array([0.0, 189.0]), lat = np.array([0.0, 0.0]))
+        assert (not result['success']), 'lon_lat_to_grid_ids failed to detect invalid coordinates'
+
+        result = lon_lat_to_grid_ids(lon = np.array([0.0]), lat = np.array([0.0]), level = 7)
+        assert (not result['success']), 'lon_lat_to_grid_ids failed to detect invalid level'
+
+        result = lon_lat_to_grid_ids(lon = np.array([0.0]), lat = np.array([0.0]), level = [0, 7])
+        assert (not result['success']), 'lon_lat_to_grid_ids failed to detect invalid level in list'
+
 class TestGridIdsToGeos(TestDict):
     def test_grid_ids_to_geos(self):
         '''
@@ -135,6 +239,162 @@ class Test_GridXYToGridId(TestDict,ValidGems):
         for r in results:
             assert isinstance(r, str), '_grid_xy_to_grid_id failed to return str'
 
+class Test_GridXYToRowCol(ValidGems):
+    def test__grid_xy_to_rowcol_valid(self):
+        test = np.array(self._valid_gems)
+        row, col = _grid_xy_to_rowcol(test[:, 0], test[:, 1], level = 0)
+        assert (np.array_equal(row, np.floor(test[:, 1])) and np.array_equal(col, np.floor(test[:, 0]))), \
+            '_grid_xy_to_rowcol returned incorrect L0 row, column indices'
+
+    def test__grid_xy_to_rowcol_edges(self):
+        '''Coordinates within noise of a cell edge belong to the cell right/below the edge'''
+        edge = 36000 * 12 + 7
+        x = (edge + np.array([-1e-9, 0., 1e-9])) / 36000.
+        y = np.array([0., -1e-9, 1e-12])
+        row, col = _grid_xy_to_rowcol(x, y, level = 6)
+        assert (col == edge).all(), '_grid_xy_to_rowcol failed to snap coordinates to cell edge'
+        assert (row == 0).all(), '_grid_xy_to_rowcol failed to clamp negative coordinates'
+
+    def test__grid_xy_to_rowcol_upper_edges(self):
+        '''Coordinates just inside the right/bottom edge of a cell belong to the cell'''
+        edge = 36000 * 12 + 7
+        x = (edge - np.array([1e-3, 4e-3, 1e-4])) / 36000.
+        row, col = _grid_xy_to_rowcol(x, x, level = 6)
+        assert (col == edge - 1).all() and (row == edge - 1).all(), \
+            '_grid_xy_to_rowcol moved coordinates inside a cell to the next cell'
+
+        # the same points, 1 - 4 mm inside the cell, from longitude, latitude
+        lon, lat = ease_to_lon_lat(shift_range_grid_xy(x, 'x'), shift_range_grid_xy(x, 'y'))
+        results = lon_lat_to_grid_ids(lon, lat, level = 6, dedupe = False, packed = True)['result']['data']
+        valid = rowcol_to_grid_ids(np.full(3, edge - 1), np.full(3, edge - 1), level = 6, packed = True)
+        assert np.array_equal(results, valid['result']['data']), \
+            'lon_lat_to_grid_ids moved points inside a cell to the next cell'
+
+    def test__grid_xy_to_rowcol_grid_edges(self):
+        '''Coordinates on, or past, the right/bottom edge of the grid belong to the last column|row'''
+        n_col, n_row = levels_specs[0]['n_col'], levels_specs[0]['n_row']
+        x = np.array([n_col, n_col + 1e-9, np.inf, 0.])
+        y = np.array([n_row, n_row + 1e-9, np.inf, -np.inf])
+        for lv in [0, 6]:
+            row, col = _grid_xy_to_rowcol(x, y, level = lv)
+            assert (col[:3] == levels_specs[lv]['n_col'] - 1).all() and (row[:3] == levels_specs[lv]['n_row'] - 1).all(), \
+                '_grid_xy_to_rowcol failed to clamp coordinates to the last column|row of level {}'.format(lv)
+            assert (col[3], row[3]) == (0, 0), '_grid_xy_to_rowcol failed to clamp coordinates to the first column|row'
+
+            row, col = _grid_xy_to_rowcol(x, y, level = lv, ceil = True)
+            assert (col[:3] == levels_specs[lv]['n_col']).all() and (row[:3] == levels_specs[lv]['n_row']).all(), \
+                '_grid_xy_to_rowcol failed to clamp edges to the right|bottom edge of level {}'.format(lv)
+
+        with pytest.raises(ValueError):
+            _grid_xy_to_rowcol(np.array([np.nan]), np.array([0.]))
+
+    def test__grid_xy_to_rowcol_nesting(self):
+        rng = np.random.default_rng(0)
+        x = rng.uniform(0, levels_specs[0]['n_col'], 10000)
+        y = rng.uniform(0, levels_specs[0]['n_row'], 10000)
+        row_6, col_6 = _grid_xy_to_rowcol(x, y, level = 6)
+        for lv in range(6):
+            ratio = levels_specs[6]['n_col'] // levels_specs[lv]['n_col']
+            row, col = _grid_xy_to_rowcol(x, y, level = lv)
+            assert (np.array_equal(row, row_6 // ratio) and np.array_equal(col, col_6 // ratio)), \
+                '_grid_xy_to_rowcol is not consistent between level {} and level 6'.format(lv)
+
+class TestGridIdsToRowCol(object):
+
+    @pytest.fixture(autouse=True)
+    def _set_ids(self):
+        self._ids = ['L0.202481', 'L1.202482.13', 'L2.203481.20.01', 'L6.202482.13.21.00.00.00.00']
+        self._rowcol = {'level': [0, 1, 2, 6],
+                        'row': [202, 809, 2442, 7287000],
+                        'col': [481, 1931, 5773, 17382000]}
+
+    def test_grid_ids_to_rowcol(self):
+
+        results = grid_ids_to_rowcol(self._ids)['result']['data']
+        for key, valid in self._rowcol.items():
+            assert np.array_equal(results[key], valid), \
+                'grid_ids_to_rowcol failed to return the {} of each grid ID'.format(key)
+
+    def test_grid_ids_to_rowcol_level(self):
+
+        results = grid_ids_to_rowcol(self._ids, level=0)['result']['data']
+        assert (np.array_equal(results['row'], [202, 202, 203, 202]) and
+                np.array_equal(results['col'], [481, 482, 481, 482])), \
+            'grid_ids_to_rowcol failed to return the Level 0 ancestor indices'
+
+    def test_grid_ids_to_rowcol_dtypes(self):
+
+        for grid_ids in [self._ids, grid_ids_to_ints(self._ids)['result']['data']]:
+            for level in [None, 0, 6]:
+                results = grid_ids_to_rowcol(grid_ids, level=level)['result']['data']
+                assert all(results[key].dtype == np.int64 for key in ['level', 'row', 'col']), \
+                    'grid_ids_to_rowcol failed to return int64 arrays for level={}'.format(level)
+
+    def test_grid_ids_to_rowcol_invalid(self):
+
+        results = grid_ids_to_rowcol(['L0.202481', 'L1.202482.43'])
+        assert results['success'] == False, 'grid_ids_to_rowcol failed to reject an invalid grid ID'
+
+    def test_rowcol_to_grid_ids_round_trip(self):
+
+        for lv, row, col, gid in zip(self._rowcol['level'], self._rowcol['row'],
+                                     self._rowcol['col'], self._ids):
+            results = rowcol_to_grid_ids(np.array([row]), np.array([col]), level=lv)
+            assert results['result']['data'].tolist() == [gid], \
+                'rowcol_to_grid_ids failed to return {}'.format(gid)
+
+        packed = rowcol_to_grid_ids(np.array([7287000]), np.array([17382000]), level=6, packed=True)
+        assert np.array_equal(packed['result']['data'], grid_ids_to_ints(self._ids[-1:])['result']['data']), \
+            'rowcol_to_grid_ids failed to return packed grid IDs'
+
+    def test_rowcol_to_grid_ids_invalid(self):
+
+        results = rowcol_to_grid_ids(np.array([406]), np.array([0]), level=0)
+        assert results['success'] == False, 'rowcol_to_grid_ids failed to reject an out of range row'
+
+        results = rowcol_to_grid_ids(np.array([0.5]), np.array([0]), level=0)
+        assert results['success'] == False, 'rowcol_to_grid_ids failed to reject non integer indices'
+
+class TestGridIdsToPolygons(TestDict):
+    def test_grid_ids_to_polygons(self):
+        for lv in self._test_dict:
+            results = grid_ids_to_polygons(self._test_dict[lv]['grid_ids'])['result']['data']
+            valid = np.array(self._test_dict[lv]['centroids'])
+            assert (np.allclose(results.centroid.x, valid[:, 0], atol=1e-3) and
+                    np.allclose(results.centroid.y, valid[:, 1], atol=1e-3)), \
+                'grid_ids_to_polygons returned polygons off the level {} centroids'.format(lv)
+            assert np.allclose(results.area, levels_specs[lv]['x_length'] * levels_specs[lv]['y_length']), \
+                'grid_ids_to_polygons returned polygons of the wrong size for level {}'.format(lv)
+
+    def test_grid_ids_to_polygons_coords(self):
+        results = grid_ids_to_polygons(grid_ids_to_ints(['L0.000000'])['result']['data'], coords=True)
+        bounds = [results['result']['data'][key][0] for key in ['min_x', 'min_y', 'max_x', 'max_y']]
+        assert np.allclose(bounds, [grid_spec['ease']['min_x'], grid_spec['ease']['max_y'] - levels_specs[0]['y_length'],
+                                    grid_spec['ease']['min_x'] + levels_specs[0]['x_length'], grid_spec['ease']['max_y']]), \
+            'grid_ids_to_polygons returned the wrong bounds for packed grid IDs'
+
+    def test_grid_ids_to_polygons_invalid(self):
+        results = grid_ids_to_polygons(['L0.000000', 'L1.202482.43'])
+        assert (not results['success']), 'grid_ids_to_polygons failed to reject an invalid grid ID'
+
+class TestGridTable(object):
+    def test_grid_table(self):
+        results = grid_table(level=2, bounds=(-1000., -1000., 1000., 1000.))
+        table = results['result']['data']
+        assert (len(table) == 4) and (table['grid_id'].tolist() == ['L2.202481.33.22', 'L2.202482.30.20',
+                                                                     'L2.203481.03.02', 'L2.203482.00.00']), \
+            'grid_table failed to return the cells within the bounds'
+        polygons = grid_ids_to_polygons(table['grid_id'].tolist())['result']['data']
+        assert all(table.geometry.geom_equals(polygons)), 'grid_table polygons differ from grid_ids_to_polygons'
+
+    def test_grid_table_level_0(self):
+        table = grid_table(level=0, packed=True, geometry=False)['result']['data']
+        assert len(table) == levels_specs[0]['n_row'] * levels_specs[0]['n_col'], \
+            'grid_table failed to return every cell of the grid'
+
+    def test_grid_table_invalid(self):
+        assert (not grid_table(level=7)['success']), 'grid_table failed to detect invalid level'
+
 class TestPolygonsToGridIds(object):
 
     @pytest.fixture(autouse=True)
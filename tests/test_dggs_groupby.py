@@ -0,0 +1,114 @@
+'''
+Test for the GEMS Grid DGGS group by aggregation.
+
+© Regents of the University of Minnesota. All rights reserved.
+This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
+'''
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from gemsgrid.dggs import groupby
+from gemsgrid.dggs.groupby import group_aggregate, aggregation_methods, external_aggregate, mergeable_methods
+
+class TestGroupAggregate(object):
+
+    @pytest.fixture(autouse=True)
+    def _set_values(self):
+        rng = np.random.default_rng(0)
+        self._keys = rng.integers(0, 50, 2000) * 1000
+        self._values = rng.integers(0, 6, 2000).astype(float)
+        self._values[rng.random(2000) < 0.1] = np.nan
+
+    def _expected(self, method):
+        grouped = pd.DataFrame({'key': self._keys, 'value': self._values}).groupby('key').value
+        if method == 'mode':
+            return grouped.apply(lambda x: x.mode()[0])
+
+        return grouped.aggregate(method)
+
+    def test_group_aggregate(self):
+        methods = [method for method in aggregation_methods if method != 'mad']
+        keys, stats = group_aggregate(self._keys, self._values, methods)
+
+        for method in methods:
+            expected = self._expected(method)
+            assert np.array_equal(keys, expected.index.values), 'group_aggregate failed to sort the keys'
+            assert np.allclose(stats[method], expected.values, equal_nan=True), \
+                'group_aggregate failed for {}'.format(method)
+
+    def test_group_aggregate_mode_pairs(self, monkeypatch):
+        # the mode from sorted (group, value) pairs rather than a table of counts
+        monkeypatch.setattr(groupby, 'max_mode_table', 1)
+        _, stats = group_aggregate(self._keys, self._values, ['mode'])
+        assert np.array_equal(stats['mode'], self._expected('mode').values), \
+            'group_aggregate failed for the mode of sorted pairs'
+
+    def test_group_aggregate_columns(self):
+        values = np.column_stack([self._values, np.arange(2000)])
+        _, stats = group_aggregate(self._keys, values, ['mean', 'last'])
+
+        assert stats['mean'].shape == (50, 2), 'group_aggregate failed to aggregate several columns'
+        assert np.allclose(stats['mean'][:, 0], self._expected('mean').values), \
+            'group_aggregate failed to aggregate several columns'
+        assert np.array_equal(stats['last'][:, 1], [np.flatnonzero(self._keys == key)[-1] for key in range(0, 50000, 1000)]), \
+            'group_aggregate failed to keep the order of the values'
+
+class TestExternalAggregate(object):
+
+    @pytest.fixture(autouse=True)
+    def _set_values(self):
+        rng = np.random.default_rng(0)
+        self._keys = rng.integers(0, 500, 20000)
+        self._values = rng.normal(5, 2, 20000)
+        self._values[rng.random(20000) < 0.1] = np.nan
+
+    def _chunks(self, size=1500):
+        return ((self._keys[i:i + size], self._values[i:i + size]) for i in range(0, 20000, size))
+
+    def test_external_aggregate(self, tmp_path):
+        keys, expected = group_aggregate(self._keys, self._values, mergeable_methods)
+
+        # a small buffer, for many runs of several blocks each
+        results = list(external_aggregate(self._chunks(), mergeable_methods, scratch_dir=tmp_path, buffer_size=100))
+        assert len(results) > 1, 'external_aggregate failed to merge the runs a block at a time'
+        assert np.array_equal(np.concatenate([result[0] for result in results]), keys), \
+            'external_aggregate failed to merge the keys'
+
+        for method in mergeable_methods:
+            assert np.allclose(np.concatenate([result[1][method] for result in results]), expected[method],
+                               equal_nan=True), 'external_aggregate failed for {}'.format(method)
+
+        assert not any(tmp_path.iterdir()), 'external_aggregate failed to remove the temporary files'
+
+    def test_external_aggregate_many_runs(self, tmp_path, monkeypatch):
+        '''More runs than are merged at once are merged in passes'''
+        merged = []
+        merge_runs = groupby._merge_runs
+        def _merge_runs(paths, dtype, block_size):
+            merged.append((len(paths), block_size))
+            return merge_runs(paths, dtype, block_size)
+        monkeypatch.setattr(groupby, '_merge_runs', _merge_runs)
+
+        keys, expected = group_aggregate(self._keys, self._values, mergeable_methods)
+
+        # one run per chunk, 200 runs
+        results = list(external_aggregate(self._chunks(size=100), mergeable_methods, scratch_dir=tmp_path,
+                                          buffer_size=50))
+        assert len(merged) > 1 and all(n_runs <= groupby.max_merge_runs for n_runs, _ in merged), \
+            'external_aggregate failed to merge the runs in passes'
+        assert all(block_size >= groupby.min_block_size for _, block_size in merged), \
+            'external_aggregate read blocks smaller than the minimum block size'
+
+        assert np.array_equal(np.concatenate([result[0] for result in results]), keys), \
+            'external_aggregate failed to merge the keys of many runs'
+        for method in mergeable_methods:
+            assert np.allclose(np.concatenate([result[1][method] for result in results]), expected[method],
+                               equal_nan=True), 'external_aggregate failed for {} of many runs'.format(method)
+
+        assert not any(tmp_path.iterdir()), 'external_aggregate failed to remove the temporary files'
+
+    def test_external_aggregate_invalid(self):
+        with pytest.raises(ValueError):
+            next(external_aggregate(self._chunks(), ['median']))
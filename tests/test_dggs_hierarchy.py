@@ -6,12 +6,16 @@ This software is released under an Apache 2.0 license. Further details about the
 '''
 # from tests.config import dumb_test, test_dict
 import pytest
+import numpy as np
 from pytest import approx
 
 from tests.conftest import TestDict
 
 from gemsgrid.dggs.hierarchy import _child_to_parent, children_to_parents, \
-    grid_aggregate, _parent_to_children, parents_to_children
+    grid_aggregate, _parent_to_children, parents_to_children, gen_child_geometries, gen_children_table, \
+    compact_cells, uncompact_cells, children_window, gen_children, gen_grid_aggregate
+from gemsgrid.dggs.packing import grid_ids_to_ints, ints_to_grid_ids
+from gemsgrid.dggs.grid_addressing import grid_ids_to_polygons
 
 class TestParentChildRelations(TestDict):
     valid_children = [
@@ -51,18 +55,60 @@ class TestParentChildRelations(TestDict):
             results['result']['data'] == self._test_dict[0]['grid_ids']
         ), 'children_to_parents failed to return correct parent IDs for children'
 
+    def test_children_to_parents_packed(self):
+        for lv in range(6):
+            children = self._test_dict[6]['grid_ids']
+            valid = children_to_parents(children, level = lv)['result']['data']
+
+            results = children_to_parents(grid_ids_to_ints(children)['result']['data'], level = lv)
+            results = ints_to_grid_ids(results['result']['data'])['result']['data'].tolist()
+            assert(
+                results == valid
+            ), 'children_to_parents failed to return correct packed parent IDs for level {}'.format(lv)
+
+    def test_children_to_parents_arrays(self):
+        for lv in [0, 3]:
+            valid = children_to_parents(self._test_dict[6]['grid_ids'], level = lv)['result']['data']
+            for dtype in ['U', 'S']:
+                results = children_to_parents(np.array(self._test_dict[6]['grid_ids'], dtype = dtype), level = lv)
+                results = results['result']['data']
+                assert(
+                    isinstance(results, np.ndarray) and results.dtype.kind == dtype and
+                    results.astype('U').tolist() == valid
+                ), 'children_to_parents failed to return parent IDs for a {} array at level {}'.format(dtype, lv)
+
+        results = children_to_parents(np.array(self._test_dict[2]['grid_ids']), level = 3)
+        assert(not results['success']), 'children_to_parents failed to detect a parent level finer than the children'
+
     def test_children_to_parents_gridid(self):
         results = children_to_parents(self._test_dict[0]['grid_ids'])
         assert(
             not results['success']
         ), 'children to parents failed to detect incorrect grid ID'
 
+    def test_children_to_parents_same_level(self):
+        children = self._test_dict[3]['grid_ids']
+        results = children_to_parents(children, level = 3)
+        assert(
+            not results['success']
+        ), 'children_to_parents failed to detect a parent level equal to the level of the children'
+
+        results = children_to_parents(grid_ids_to_ints(children)['result']['data'], level = 3)
+        assert(
+            not results['success']
+        ), 'children_to_parents failed to detect a packed parent level equal to the level of the children'
+
     def test_children_to_parents_types(self):
         results = children_to_parents([123456, 1.123456])
         assert(
             not results['success']
         ), 'childred_to_parents failed to identfy wrong input type'
 
+        results = children_to_parents('L0.000000')
+        assert(
+            not results['success']
+        ), 'childred_to_parents failed to identfy wrong input type'
+
     def test__parent_to_children_ids(self, valid = valid_children):
         results = _parent_to_children(self._test_dict[0]['grid_ids'][0])
         assert(
@@ -79,6 +125,14 @@ class TestParentChildRelations(TestDict):
             results['result']['data'] == valid
         ), 'parents_to_children failed to return corresponding children grid IDs'
 
+    def test_parents_to_children_packed(self, valid = valid_children):
+        parents = grid_ids_to_ints(self._test_dict[0]['grid_ids'][0:2])['result']['data']
+        results = parents_to_children(parents)['result']['data']
+        results = [ints_to_grid_ids(r)['result']['data'].tolist() for r in results]
+        assert(
+            results == valid
+        ), 'parents_to_children failed to return corresponding packed children grid IDs'
+
     def test_parents_to_children_invalid(self, valid = valid_children):
         results = parents_to_children(self._test_dict[0]['grid_ids'][0])
         assert(
@@ -124,9 +178,134 @@ class TestGridAggregate:
             assert(results['result']['data'] == approx(valid[method])), \
                 'Grid aggregation failed for {}'.format(method)
 
-# seems a test for gen_child_geometries was never written originally
-#   probably needs rectified at some point
-# def test_gen_child_geometries():
+    def test_grid_aggregate_methods(self, valid = valid_agg):
+        packed = grid_ids_to_ints(self.test_set)['result']['data']
+        values = np.column_stack([self.test_vals, self.test_vals])
+        results = grid_aggregate(packed, values, level = 2, method = ['mean', 'mode'])['result']['data']
+
+        assert np.array_equal(results['grid_ids'], grid_ids_to_ints(valid['mean']['grid_ids'])['result']['data']), \
+            'Grid aggregation failed to return packed parents'
+        for method in ['mean', 'mode']:
+            assert results['values'][method] == approx(np.tile(valid[method]['values'], (1, 2))), \
+                'Grid aggregation failed for several columns and methods'
+
+        results = grid_aggregate(self.test_set, ['a'] * 9, level = 2)
+        assert not results['success'], 'Grid aggregation failed to reject non numeric values'
+
+    def test_gen_grid_aggregate(self, valid = valid_agg):
+        chunks = [(self.test_set[:4], self.test_vals[:4]), (self.test_set[4:], self.test_vals[4:])]
+        results = list(gen_grid_aggregate(chunks, level = 2, method = ['mean', 'var', 'count']))
+
+        assert len(results) == 1 and results[0]['grid_ids'] == valid['mean']['grid_ids'], \
+            'Streaming grid aggregation failed to return the parents'
+        for method in ['mean', 'var', 'count']:
+            assert results[0]['values'][method] == approx(valid[method]['values']), \
+                'Streaming grid aggregation failed for {}'.format(method)
+
+def test_children_window():
+    results = children_window(['L0.202482', 'L1.000481.23'], level=2)
+    window = results['result']['data']
+    for start, stop in (('row_start', 'row_stop'), ('col_start', 'col_stop')):
+        assert (window[stop] - window[start]).tolist() == [12, 3], 'children_window failed to size the windows'
+
+    table = gen_children_table(['L0.202482'], child_level=2, geometry=False)['result']['data']
+    assert (window['row_start'][0], window['row_stop'][0] - 1, window['col_start'][0], window['col_stop'][0] - 1) == \
+        (table['row'].min(), table['row'].max(), table['col'].min(), table['col'].max()), \
+        'children_window failed to return the rows, columns of the children'
+
+    assert not children_window(['L1.000481.23'], level=1)['success'], \
+        'children_window failed to reject parents finer than the level'
+
+def test_gen_children():
+    children = sum(parents_to_children(['L0.202482'], level=2)['result']['data'], [])
+
+    chunks = list(gen_children('L0.202482', level=2, chunk_size=50))
+    assert [len(chunk) for chunk in chunks] == [50, 50, 44], 'gen_children failed to return chunks'
+    assert sorted(sum(chunks, [])) == sorted(children), 'gen_children failed to return the children'
+
+    row_major = gen_children_table(['L0.202482'], child_level=2, geometry=False)['result']['data']['grid_id']
+    packed = grid_ids_to_ints(['L0.202482'])['result']['data'][0]
+    chunks = np.concatenate(list(gen_children(packed, level=2, packed=True)))
+    assert ints_to_grid_ids(chunks)['result']['data'].tolist() == row_major.tolist(), \
+        'gen_children failed to return packed children in row major order'
+
+    # the first chunk of the children of an L0 cell at L6 is generated without the others
+    assert len(next(gen_children('L0.202482', level=6, packed=True, chunk_size=1000))) == 1000
+
+    with pytest.raises(ValueError):
+        next(gen_children('L1.000481.23', level=1))
+
+def test_gen_child_geometries():
+
+    parent = 'POLYGON ((0 0, 0 9, 9 9, 9 0, 0 0))'
+    r_ind, c_ind, grid_ids, geoms, centroid = gen_child_geometries(parent, 'L1.202482.13', child_level=2)
+
+    assert grid_ids == _parent_to_children('L1.202482.13', level=2), \
+        'gen_child_geometries failed to return the children of the parent cell'
+    assert (len(geoms) == 9) and (len(centroid) == 9), \
+        'gen_child_geometries failed to return a geometry for each child'
+
+    packed = gen_child_geometries(parent, grid_ids_to_ints(['L1.202482.13'])['result']['data'][0],
+                                  child_level=2)[2]
+    assert np.array_equal(packed, grid_ids_to_ints(grid_ids)['result']['data']), \
+        'gen_child_geometries failed to return packed child grid IDs'
+
+def test_gen_children_table():
+
+    parents = ['L1.202482.13', 'L0.000000']
+    table = gen_children_table(parents, child_level=2)['result']['data']
+
+    assert sorted(table['grid_id']) == sorted(sum(parents_to_children(parents, level=2)['result']['data'], [])), \
+        'gen_children_table failed to return the children of the parent cells'
+    assert table['parent_id'].tolist() == [parents[0]] * 9 + [parents[1]] * 144, \
+        'gen_children_table failed to return the parent of each child'
+
+    r_ind, c_ind, _, geoms, _ = gen_child_geometries(grid_ids_to_polygons([parents[0]])['result']['data'][0],
+                                                     parents[0], child_level=2, wkt_geom=False, wkt_out=False)
+    assert (table['r_ind'][:9].tolist() == r_ind) and (table['c_ind'][:9].tolist() == c_ind), \
+        'gen_children_table row, column indices differ from gen_child_geometries'
+    assert all(a.equals_exact(b, 1e-6) for a, b in zip(table.geometry[:9], geoms)), \
+        'gen_children_table geometries differ from gen_child_geometries'
+
+    packed = gen_children_table(grid_ids_to_ints(parents)['result']['data'], child_level=2, geometry=False)
+    assert np.array_equal(packed['result']['data']['grid_id'].to_numpy(),
+                          grid_ids_to_ints(table['grid_id'].tolist())['result']['data']), \
+        'gen_children_table failed to return packed child grid IDs'
+
+    assert not gen_children_table(parents, child_level=1)['success'], \
+        'gen_children_table failed to reject parents finer than the child level'
+
+class TestCompactCells(object):
+
+    @pytest.fixture(autouse=True)
+    def _set_cells(self):
+        # all the children of L0.202482, and part of the children of L0.202481
+        self._children = parents_to_children(['L0.202482'], level=1)['result']['data'][0]
+        self._partial = parents_to_children(['L0.202481'], level=1)['result']['data'][0][:5]
+
+    def test_compact_cells(self):
+        results = compact_cells(self._partial + self._children[::-1])
+        assert results['result']['data'] == self._partial + ['L0.202482'], \
+            'compact_cells failed to replace complete siblings with the parent'
+
+    def test_compact_cells_repeatedly(self):
+        grid_ids = sum(parents_to_children(self._children, level=2)['result']['data'], [])
+        results = compact_cells(grid_ids_to_ints(grid_ids + ['L2.202482.00.00'])['result']['data'])
+        assert np.array_equal(results['result']['data'], grid_ids_to_ints(['L0.202482'])['result']['data']), \
+            'compact_cells failed to compact packed grid IDs over several levels'
+
+    def test_uncompact_cells(self):
+        results = uncompact_cells(['L0.202482'] + self._partial, level=1)
+        assert results['result']['data'] == self._children + self._partial, \
+            'uncompact_cells failed to expand the cells to the level'
+
+        chunks = uncompact_cells(grid_ids_to_ints(['L0.202482'])['result']['data'], level=2, lazy=True, chunk_size=50)
+        chunks = list(chunks['result']['data'])
+        assert [len(chunk) for chunk in chunks] == [50, 50, 44], 'uncompact_cells failed to return chunks'
+        assert ints_to_grid_ids(np.concatenate(chunks))['result']['data'].tolist() == \
+            sorted(sum(parents_to_children(self._children, level=2)['result']['data'], [])), \
+            'uncompact_cells failed to expand packed cells lazily'
 
-#     results =
-#     assert()
+    def test_uncompact_cells_invalid(self):
+        results = uncompact_cells(self._partial, level=0)
+        assert not results['success'], 'uncompact_cells failed to reject cells finer than the level'
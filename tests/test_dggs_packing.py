@@ -0,0 +1,69 @@
+'''
+Tests for GEMS Grid packed integer grid IDs.
+
+© Regents of the University of Minnesota. All rights reserved.
+This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
+'''
+import numpy as np
+
+from tests.conftest import TestDict
+
+from gemsgrid.constants import levels_specs
+from gemsgrid.dggs.checks import check_packed_ids, validate_grid_ids
+from gemsgrid.dggs.packing import grid_ids_to_ints, ints_to_grid_ids, is_packed, level_span, _valid_digits_mask
+
+class TestGridIdsToInts(TestDict):
+    def test_grid_ids_to_ints_round_trip(self):
+        for lv in levels_specs.keys():
+            valid = self._test_dict[lv]['grid_ids']
+            packed = grid_ids_to_ints(valid)
+            assert packed['success'], 'grid_ids_to_ints failed for valid grid IDs'
+            assert is_packed(packed['result']['data']), 'grid_ids_to_ints did not return an integer array'
+
+            results = ints_to_grid_ids(packed['result']['data'])
+            assert results['result']['data'].tolist() == valid, \
+                'ints_to_grid_ids did not return the original grid IDs for level {}'.format(lv)
+
+    def test_grid_ids_to_ints_mixed_levels(self):
+        valid = [self._test_dict[lv]['grid_ids'][5] for lv in levels_specs.keys()]
+        packed = grid_ids_to_ints(valid)['result']['data']
+        results = ints_to_grid_ids(packed)['result']['data'].tolist()
+        assert results == valid, 'packing did not round trip grid IDs of mixed levels'
+
+    def test_grid_ids_to_ints_sort_order(self):
+        '''A parent sorts before its children, and children are a contiguous range'''
+        test = ['L2.202482.13.00', 'L1.202482.13', 'L1.202482.12', 'L0.202482']
+        packed = np.sort(grid_ids_to_ints(test)['result']['data'])
+        results = ints_to_grid_ids(packed)['result']['data'].tolist()
+        assert results == ['L0.202482', 'L1.202482.12', 'L1.202482.13', 'L2.202482.13.00'], \
+            'packed grid IDs did not sort hierarchically'
+
+        first, last = grid_ids_to_ints(['L1.202482.00', 'L1.202482.33'])['result']['data']
+        assert ((last >> 3) - (first >> 3)) == 15 * level_span[1], \
+            'children of a cell are not a contiguous range of packed IDs'
+
+    def test_grid_ids_to_ints_invalid(self):
+        for bad in [['L0.406000'], ['L1.000000.40'], ['L0.000000.00'], ['l0.000000'], [123456]]:
+            results = grid_ids_to_ints(bad)
+            assert not results['success'], 'grid_ids_to_ints failed to detect {}'.format(bad)
+
+    def test_valid_digits_mask(self):
+        # L0 column 964 is past the grid, and would pack as the first cell of the next row
+        row_digits = np.array([[203, 203, 203], [0, 0, 4]])
+        col_digits = np.array([[963, 964, 963], [3, 0, 0]])
+        assert _valid_digits_mask(row_digits, col_digits).tolist() == [True, False, False], \
+            '_valid_digits_mask failed to detect digits out of range'
+
+class TestIntsToGridIds:
+    def test_ints_to_grid_ids_invalid(self):
+        for bad in [np.array([-1]), np.array([9]), np.array([7]), [0, 1]]:
+            results = ints_to_grid_ids(bad)
+            assert not results['success'], 'ints_to_grid_ids failed to detect {}'.format(bad)
+
+    def test_check_packed_ids(self):
+        assert check_packed_ids(np.array([0, 1, 2], dtype=np.int64)), \
+            'check_packed_ids failed for valid packed IDs'
+        assert not check_packed_ids(np.array([0.0, 1.0])), \
+            'check_packed_ids failed to detect wrong input type'
+        assert not validate_grid_ids(np.array([15]))[0], \
+            'validate_grid_ids failed to detect invalid packed IDs'
@@ -0,0 +1,250 @@
+'''
+Test for the GEMS Grid DGGS scanline polygon fill.
+
+© Regents of the University of Minnesota. All rights reserved.
+This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
+'''
+
+import pytest
+import numpy as np
+import shapely
+import geopandas as gpd
+from shapely.geometry import Point, Polygon, MultiPolygon, LineString, MultiLineString
+
+from gemsgrid.constants import levels_specs, ease_crs
+from gemsgrid.dggs.grid_addressing import grid_table, ease_polygon_to_grid_ids, geodataframe_to_grid_ids, \
+    gen_polygon_grid_ids, ease_line_to_grid_ids, geo_line_to_grid_ids
+from gemsgrid.dggs.polyfill import polygon_to_rowcol_runs, runs_to_rowcol, polygon_to_compact_rowcol, \
+    polygon_to_rowcol_coverage, polygon_to_rowcol_tiles, line_to_rowcol, chunk_runs
+
+class TestPolygon(object):
+
+    @pytest.fixture(autouse=True)
+    def _set_polygon(self):
+        rng = np.random.default_rng(0)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, 15))
+        radius = 60000 * rng.uniform(0.3, 1, 15)
+        star = Polygon(np.c_[radius * np.cos(angles), 1e6 + radius * np.sin(angles)])
+        star = star.difference(Point(0, 1e6).buffer(10000))
+        self._polygon = MultiPolygon([star, Polygon([(2e5, 0), (3e5, 0), (2.5e5, 5e4)])])
+
+class TestPolygonToRowColRuns(TestPolygon):
+
+    def test_polygon_to_rowcol_runs(self):
+        '''The cells of the runs are exactly the cells whose centers are within the polygon'''
+        level = 2
+        row, col = runs_to_rowcol(*polygon_to_rowcol_runs(self._polygon, level = level))
+
+        table = grid_table(level = level, bounds = self._polygon.bounds, geometry = False)['result']['data']
+        within = shapely.within(shapely.points(table['x'], table['y']), self._polygon)
+
+        valid = set(zip(table['row'][within], table['col'][within]))
+        assert set(zip(row.tolist(), col.tolist())) == valid, \
+            'polygon_to_rowcol_runs did not return the cells with centers within the polygon'
+        assert len(row) == len(valid), 'polygon_to_rowcol_runs returned duplicate cells'
+
+    def test_polygon_to_rowcol_runs_order(self):
+        row, col_start, col_end = polygon_to_rowcol_runs(self._polygon, level = 1)
+        assert (np.diff(row) >= 0).all() and (col_end > col_start).all(), \
+            'polygon_to_rowcol_runs did not return sorted, non empty runs'
+
+    def test_polygon_to_rowcol_runs_clipped(self):
+        '''Polygons covering the edge of the grid are clipped to the grid'''
+        polygon = shapely.box(-2e7, -1e7, -1.7e7, 1e7)
+        row, col_start, col_end = polygon_to_rowcol_runs(polygon, level = 0)
+        assert (row.min() == 0) and (row.max() == levels_specs[0]['n_row'] - 1) and (col_start == 0).all(), \
+            'polygon_to_rowcol_runs did not clip the runs to the grid'
+
+    def test_chunk_runs(self):
+        runs = polygon_to_rowcol_runs(self._polygon, level = 2)
+        valid_row, valid_col = runs_to_rowcol(*runs)
+        chunks = list(chunk_runs(*runs, chunk_size = 100))
+        assert len(chunks) == 7 and all(len(row) <= 100 for row, _ in chunks) and \
+            np.array_equal(np.concatenate([row for row, _ in chunks]), valid_row) and \
+            np.array_equal(np.concatenate([col for _, col in chunks]), valid_col), \
+            'chunk_runs did not split the cells of the runs into chunks, in order'
+
+class TestPolygonToCompactRowCol(TestPolygon):
+
+    def test_polygon_to_compact_rowcol(self):
+        '''The descendants of the compact cells are the cells of the full polygon fill'''
+        level = 3
+        levels, row, col = polygon_to_compact_rowcol(self._polygon, level = level)
+        assert (levels < level).any(), 'polygon_to_compact_rowcol did not return any coarser cells'
+
+        cells = set()
+        for lv, r, c in zip(levels.tolist(), row.tolist(), col.tolist()):
+            ratio = levels_specs[level]['n_col'] // levels_specs[lv]['n_col']
+            cells.update((r * ratio + dr, c * ratio + dc) for dr in range(ratio) for dc in range(ratio))
+
+        valid_row, valid_col = runs_to_rowcol(*polygon_to_rowcol_runs(self._polygon, level = level))
+        assert cells == set(zip(valid_row.tolist(), valid_col.tolist())), \
+            'polygon_to_compact_rowcol cells differ from the full polygon fill'
+
+    def test_ease_polygon_to_grid_ids_compact(self):
+        results = ease_polygon_to_grid_ids(self._polygon.wkt, level = 2, compact = True, packed = True)
+        grid_ids = results['result']['data']
+        assert (np.diff(grid_ids) > 0).all(), 'ease_polygon_to_grid_ids compact cells are not in hierarchical order'
+        assert len(set((grid_ids & 7).tolist())) > 1, 'ease_polygon_to_grid_ids did not compact the cells'
+
+class TestPolygonToRowColCoverage(TestPolygon):
+
+    @pytest.fixture(autouse=True)
+    def _set_table(self, _set_polygon):
+        self._level = 2
+        self._table = grid_table(level = self._level, bounds = self._polygon.bounds)['result']['data']
+
+    def test_polygon_to_rowcol_coverage_predicates(self):
+        cells = self._table.geometry.values
+        for predicate, valid in [('intersects', shapely.intersects(cells, self._polygon)),
+                                 ('contains', shapely.covered_by(cells, self._polygon))]:
+            row, col, _ = polygon_to_rowcol_coverage(self._polygon, level = self._level, predicate = predicate)
+            assert (row.tolist() == self._table['row'][valid].tolist() and
+                    col.tolist() == self._table['col'][valid].tolist()), \
+                'polygon_to_rowcol_coverage returned the wrong cells for {}'.format(predicate)
+
+    def test_polygon_to_rowcol_coverage_fraction(self):
+        row, col, fraction = polygon_to_rowcol_coverage(self._polygon, level = self._level, predicate = 'fraction')
+
+        cells = self._table.geometry.values
+        valid = shapely.area(shapely.intersection(cells, self._polygon)) / shapely.area(cells)
+        assert (row.tolist() == self._table['row'][valid > 0].tolist()) and \
+            np.allclose(fraction, valid[valid > 0]), 'polygon_to_rowcol_coverage returned the wrong fractions'
+
+        cell_area = levels_specs[self._level]['x_length'] * levels_specs[self._level]['y_length']
+        assert np.isclose((fraction * cell_area).sum(), self._polygon.area), \
+            'polygon_to_rowcol_coverage fractions do not conserve the polygon area'
+
+    def test_ease_polygon_to_grid_ids_predicate(self):
+        results = ease_polygon_to_grid_ids(self._polygon.wkt, level = self._level, predicate = 'fraction')
+        assert len(results['result']['data']['grid_ids']) == len(results['result']['data']['fraction']), \
+            'ease_polygon_to_grid_ids did not return a fraction for each cell'
+
+        results = ease_polygon_to_grid_ids(self._polygon.wkt, level = self._level, predicate = 'within')
+        assert not results['success'], 'ease_polygon_to_grid_ids failed to reject an invalid predicate'
+
+    def test_ease_polygon_to_grid_ids_geometry(self):
+        '''Shapely geometries and WKB return the same cells as WKT'''
+        valid = ease_polygon_to_grid_ids(self._polygon.wkt, level = self._level, packed = True)['result']['data']
+        for polygon in [self._polygon, self._polygon.wkb]:
+            results = ease_polygon_to_grid_ids(polygon, level = self._level, packed = True)['result']['data']
+            assert np.array_equal(results, valid), 'ease_polygon_to_grid_ids failed for {}'.format(type(polygon))
+
+        results = ease_polygon_to_grid_ids(None, level = self._level)
+        assert not results['success'], 'ease_polygon_to_grid_ids failed to reject a missing polygon'
+
+    def test_ease_polygon_to_grid_ids_memory_budget(self):
+        results = ease_polygon_to_grid_ids(self._polygon.wkt, level = self._level, packed = True,
+                                           memory_budget = 10**6)
+        assert results['success'], 'ease_polygon_to_grid_ids refused a polygon within the memory budget'
+
+        results = ease_polygon_to_grid_ids(self._polygon.wkt, level = 6, memory_budget = 10**6)
+        assert not results['success'], 'ease_polygon_to_grid_ids failed to refuse a polygon over the memory budget'
+
+class TestGeoDataFrameToGridIds(TestPolygon):
+
+    @pytest.fixture(autouse=True)
+    def _set_gdf(self, _set_polygon):
+        polygons = list(self._polygon.geoms) + [None, shapely.box(-5e6, 2e6, -4.9e6, 2.1e6)]
+        self._gdf = gpd.GeoDataFrame({'name': list('abcd')}, geometry=polygons, crs=ease_crs, index=[10, 20, 30, 40])
+
+    def test_geodataframe_to_grid_ids(self):
+        data = geodataframe_to_grid_ids(self._gdf, level = 2)['result']['data']
+        for index, polygon in self._gdf.geometry.dropna().items():
+            valid = ease_polygon_to_grid_ids(polygon.wkt, level = 2)['result']['data']
+            assert data['grid_ids'][data['feature'] == index].tolist() == valid, \
+                'geodataframe_to_grid_ids returned the wrong cells for feature {}'.format(index)
+        assert 30 not in data['feature'], 'geodataframe_to_grid_ids returned cells for a missing geometry'
+
+    def test_geodataframe_to_grid_ids_workers(self):
+        data = geodataframe_to_grid_ids(self._gdf.to_crs(4326), level = 2, predicate = 'fraction', packed = True)
+        parallel = geodataframe_to_grid_ids(self._gdf.to_crs(4326), level = 2, predicate = 'fraction', packed = True,
+                                            workers = 2)
+        for key in ['feature', 'grid_ids', 'fraction']:
+            assert np.array_equal(data['result']['data'][key], parallel['result']['data'][key]), \
+                'geodataframe_to_grid_ids returned different {} with workers'.format(key)
+
+    def test_geodataframe_to_grid_ids_invalid(self):
+        gdf = gpd.GeoDataFrame(geometry=[shapely.Point(0, 0)], crs=ease_crs)
+        assert not geodataframe_to_grid_ids(gdf)['success'], 'geodataframe_to_grid_ids failed to reject a point'
+
+        assert not geodataframe_to_grid_ids(self._gdf, predicate = 'within')['success'], \
+            'geodataframe_to_grid_ids failed to reject an invalid predicate'
+
+class TestPolygonToRowColTiles(TestPolygon):
+
+    def test_polygon_to_rowcol_tiles(self):
+        '''The chunks hold the cells of the full polygon fill, one tile at a time'''
+        level, tile_level, ratio = 3, 1, 9
+        for predicate in ['centroid', 'intersects', 'fraction']:
+            chunks = list(polygon_to_rowcol_tiles(self._polygon, level = level, tile_level = tile_level,
+                                                  predicate = predicate, chunk_size = 40))
+            assert all(len(row) <= 40 and len(set(zip((row // ratio).tolist(), (col // ratio).tolist()))) == 1
+                       for row, col, _ in chunks), 'polygon_to_rowcol_tiles returned a chunk across tiles'
+
+            tiles = [(row[0] // ratio, col[0] // ratio) for row, col, _ in chunks]
+            assert tiles == sorted(tiles), 'polygon_to_rowcol_tiles did not visit the tiles in row major order'
+
+            if predicate == 'centroid':
+                valid_row, valid_col = runs_to_rowcol(*polygon_to_rowcol_runs(self._polygon, level = level))
+            else:
+                valid_row, valid_col, _ = polygon_to_rowcol_coverage(self._polygon, level = level, predicate = predicate)
+            row = np.concatenate([chunk[0] for chunk in chunks])
+            col = np.concatenate([chunk[1] for chunk in chunks])
+            assert sorted(zip(row.tolist(), col.tolist())) == sorted(zip(valid_row.tolist(), valid_col.tolist())), \
+                'polygon_to_rowcol_tiles cells differ from the full polygon fill for {}'.format(predicate)
+
+    def test_gen_polygon_grid_ids(self):
+        chunks = gen_polygon_grid_ids(self._polygon.wkt, level = 2, chunk_size = 20)
+        first = next(chunks)
+        chunks.close()
+        assert 0 < len(first) <= 20, 'gen_polygon_grid_ids did not return chunks of at most chunk_size grid IDs'
+
+        valid = ease_polygon_to_grid_ids(self._polygon.wkt, level = 2)['result']['data']
+        grid_ids = [gid for chunk in gen_polygon_grid_ids(self._polygon, level = 2) for gid in chunk]
+        assert sorted(grid_ids) == sorted(valid), 'gen_polygon_grid_ids did not return the polygon grid IDs'
+
+        with pytest.raises(ValueError):
+            next(gen_polygon_grid_ids(self._polygon, level = 2, tile_level = 3))
+
+class TestLineToRowCol(object):
+
+    @pytest.fixture(autouse=True)
+    def _set_line(self):
+        rng = np.random.default_rng(0)
+        coords = np.c_[rng.uniform(-2e5, 2e5, 8), 1e6 + rng.uniform(-2e5, 2e5, 8)]
+        self._line = MultiLineString([coords[:5], coords[4:]])
+
+    def test_line_to_rowcol(self):
+        '''The cells crossed are exactly the cells that intersect the line'''
+        level = 2
+        row, col = line_to_rowcol(self._line, level = level)
+
+        table = grid_table(level = level, bounds = self._line.bounds)['result']['data']
+        valid = shapely.intersects(table.geometry.values, self._line)
+
+        assert set(zip(row.tolist(), col.tolist())) == set(zip(table['row'][valid], table['col'][valid])), \
+            'line_to_rowcol did not return the cells that intersect the line'
+        assert len(row) == valid.sum(), 'line_to_rowcol returned duplicate cells'
+
+    def test_line_to_rowcol_order(self):
+        '''The cells of a single segment are crossed one edge at a time'''
+        row, col = line_to_rowcol(LineString([(0, 1e6), (3e5, 1.2e6)]), level = 3)
+        assert (np.abs(np.diff(row)) + np.abs(np.diff(col)) == 1).all(), \
+            'line_to_rowcol did not return the cells in the order they are crossed'
+
+    def test_ease_line_to_grid_ids(self):
+        grid_ids = ease_line_to_grid_ids(self._line.wkt, level = 2)['result']['data']
+        row, col = line_to_rowcol(self._line, level = 2)
+        assert len(grid_ids) == len(row), 'ease_line_to_grid_ids did not return a grid ID for each cell'
+
+        results = ease_line_to_grid_ids(Point(0, 0).wkt, level = 2)
+        assert not results['success'], 'ease_line_to_grid_ids failed to reject a point'
+
+    def test_geo_line_to_grid_ids(self):
+        results = geo_line_to_grid_ids('LINESTRING (10 45, 11 46, 12 45)', level = 4, packed = True)
+        assert results['success'] and (results['result']['data'] & 7 == 4).all(), \
+            'geo_line_to_grid_ids did not return level 4 grid IDs'
+
+        results = geo_line_to_grid_ids('LINESTRING (10 45, 11 96)', level = 4)
+        assert not results['success'], 'geo_line_to_grid_ids failed to detect invalid coordinates'
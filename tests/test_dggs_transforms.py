@@ -4,16 +4,21 @@ Tests for GEMS Grid DGGS grid_transform fucntions.
 © Regents of the University of Minnesota. All rights reserved.
 This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
 '''
+import threading
+
 import pytest
 import numpy as np
 from geopandas import GeoSeries
+import shapely
 from shapely.geometry import Point
 
 from tests.conftest import TestDict, ValidGems
 
-from gemsgrid.constants import ease_crs
+from gemsgrid.constants import ease_crs, geo_crs, grid_spec, levels_specs, cell_scale_factors
+from gemsgrid.dggs.utils import shift_range_grid_xy
 
 from gemsgrid.dggs.transforms import *
+from gemsgrid.dggs.transforms import _axis_table
 
 class TestEaseCoordToGridXYCoord(TestDict):
     def results(self):
@@ -112,3 +117,111 @@ class TestCoordLonLatToCoordsEase(TestDict):
             not results
         ), 'coords_lon_lat_to_coords_ease failed to detect incorrect input type'
 
+
+class TestGetTransformer(object):
+
+    def test_get_transformer_cached(self):
+        assert get_transformer(4326, ease_crs) is get_transformer(4326, ease_crs), \
+            'get_transformer failed to reuse the cached transformer'
+        assert get_transformer(4326, ease_crs) is not get_transformer(ease_crs, 4326), \
+            'get_transformer failed to key transformers by source and target crs'
+
+    def test_get_transformer_per_thread(self):
+        transformers = []
+        thread = threading.Thread(target=lambda: transformers.append(get_transformer(4326, ease_crs)))
+        thread.start()
+        thread.join()
+        assert transformers[0] is not get_transformer(4326, ease_crs), \
+            'get_transformer failed to build a separate transformer for each thread'
+
+class TestClosedFormEase(object):
+
+    @pytest.fixture(autouse=True)
+    def _set_coords(self):
+        rng = np.random.default_rng(0)
+        self._lon = np.concatenate([rng.uniform(-180, 180, 10000), [-180.0, 0.0, 180.0, 0.0, 0.0]])
+        self._lat = np.concatenate([rng.uniform(-90, 90, 10000), [-90.0, 0.0, 90.0, 30.0, 85.04456640737216]])
+
+    def test_lon_lat_to_ease(self):
+        x_ease, y_ease = lon_lat_to_ease(self._lon, self._lat)
+        x_proj, y_proj = get_transformer(4326, ease_crs).transform(self._lon, self._lat)
+        assert (np.allclose(x_ease, x_proj, rtol=0, atol=1e-6) and np.allclose(y_ease, y_proj, rtol=0, atol=1e-6)), \
+            'lon_lat_to_ease failed to agree with PROJ to within 1e-6 m'
+
+    def test_ease_to_lon_lat(self):
+        x_ease, y_ease = get_transformer(4326, ease_crs).transform(self._lon, self._lat)
+        lon, lat = ease_to_lon_lat(x_ease, y_ease)
+        lon_proj, lat_proj = get_transformer(ease_crs, 4326).transform(x_ease, y_ease)
+        assert (np.allclose(lon, lon_proj, rtol=0, atol=1e-9) and np.allclose(lat, lat_proj, rtol=0, atol=2e-6)), \
+            'ease_to_lon_lat failed to agree with PROJ'
+        assert np.allclose(lat, self._lat, rtol=0, atol=1e-8), \
+            'ease_to_lon_lat failed to round trip with lon_lat_to_ease to within 1e-8 degrees'
+
+    def test_project_coords_use_proj(self):
+        results = project_coords(self._lon, self._lat, use_proj=True)
+        valid = get_transformer(4326, ease_crs).transform(self._lon, self._lat)
+        assert np.array_equal(results, valid), 'project_coords failed to use PROJ when use_proj is set'
+
+    def test_project_geometry(self):
+        polygons = np.array([Point(10, 45).buffer(1), Point(-120, -30).buffer(2), None], dtype=object)
+        results = project_geometry(polygons)
+        valid = GeoSeries(polygons, crs=4326).to_crs(ease_crs).values.to_numpy()
+        assert (shapely.equals_exact(results[:2], valid[:2], tolerance=1e-6).all() and results[2] is None), \
+            'project_geometry failed to agree with GeoSeries.to_crs'
+
+class TestAxisTables(object):
+
+    def test_grid_axis_table_shape(self):
+        for lv in levels_specs:
+            if lv > 3:
+                break
+            assert (grid_axis_table(lv, 'x').shape[0] == levels_specs[lv]['n_col']) and \
+                (grid_axis_table(lv, 'y', centers=False).shape[0] == levels_specs[lv]['n_row'] + 1), \
+                'grid_axis_table failed to return a value for each column|row of level {}'.format(lv)
+
+    def test_grid_axis_table_edges(self):
+        edges = grid_axis_table(0, 'y', crs=geo_crs, centers=False)
+        assert np.allclose([edges[0], edges[-1]], [grid_spec['geo']['max_y'], grid_spec['geo']['min_y']]), \
+            'grid_axis_table failed to return the geographic edges of the grid'
+        assert not edges.flags.writeable, 'grid_axis_table returned a writeable table'
+
+    def test_grid_axis_table_fine_level(self):
+        _axis_table.cache_clear()
+        table = grid_axis_table(4, 'y')
+        assert table.shape[0] == levels_specs[4]['n_row'] and not table.flags.writeable, \
+            'grid_axis_table failed to return the table of a fine level'
+        assert _axis_table.cache_info().currsize == 0, 'grid_axis_table kept the table of a fine level'
+
+    def test_grid_axis_table_invalid(self):
+        assert not grid_axis_table(7, 'x'), 'grid_axis_table failed to detect an invalid level'
+        assert not grid_axis_table(0, 'z'), 'grid_axis_table failed to detect an invalid axis'
+
+    def test_rowcol_to_centroids(self):
+        row = np.array([0, 100, 405, 1000, 100000])
+        col = np.array([0, 481, 963, 2000, 300000])
+        level = np.array([0, 0, 0, 1, 4])
+        lon, lat = rowcol_to_centroids(row, col, level, crs=geo_crs)
+        scale = cell_scale_factors[level]
+        valid = ease_to_lon_lat(shift_range_grid_xy((col + 0.5) * scale, 'x'),
+                                shift_range_grid_xy((row + 0.5) * scale, 'y'))
+        assert np.allclose(lon, valid[0]) and np.allclose(lat, valid[1]), \
+            'rowcol_to_centroids failed to return the centroids of the cells'
+
+    def test_rowcol_to_bounds(self):
+        min_x, min_y, max_x, max_y = rowcol_to_bounds(np.array([202]), np.array([481]), 0)
+        assert np.allclose([min_x[0], min_y[0], max_x[0], max_y[0]],
+                           [-levels_specs[0]['x_length'], 0, 0, levels_specs[0]['y_length']], atol=1e-6), \
+            'rowcol_to_bounds failed to return the bounding box of the cell'
+
+    def test_rowcol_to_centroids_fine_level(self):
+        # a single fine level cell is computed on its own, without the tables of the level
+        _axis_table.cache_clear()
+        lon, lat = rowcol_to_centroids(np.array([7308000]), np.array([17352000]), 6, crs=geo_crs)
+        assert _axis_table.cache_info().currsize == 0, 'rowcol_to_centroids built the tables of the level'
+        assert np.allclose([lon[0], lat[0]], [0.0001, -0.0001], atol=1e-3), \
+            'rowcol_to_centroids failed to return the centroid of a fine level cell'
+
+        row, col = np.arange(0, 3888, 7), np.arange(0, 3888, 7) * 2
+        assert np.array_equal(rowcol_to_centroids(row, col, 3, crs=geo_crs),
+                              (grid_axis_table(3, 'x', crs=geo_crs)[col], grid_axis_table(3, 'y', crs=geo_crs)[row])), \
+            'rowcol_to_centroids failed to match the tables of the level'
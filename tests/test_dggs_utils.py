@@ -9,7 +9,7 @@ import pytest
 import numpy as np
 
 from geopandas import GeoDataFrame
-from shapely.geometry import Point
+from shapely.geometry import Point, box
 
 from gemsgrid.constants import grid_spec, levels_specs, cell_scale_factors, ease_crs
 
@@ -358,3 +358,10 @@ class TestTrunc:
     ):
         comp = trunc(test, decimals = 5)
         assert(comp == result).all(), 'trunc failed to return expected results.'
+
+class TestLoadGeometry:
+    def test_load_geometry(self):
+        polygon = box(1, 2, 3, 4)
+        for geometry in [polygon, polygon.wkt, polygon.wkb]:
+            assert(load_geometry(geometry).equals(polygon)), 'load_geometry failed to load {}'.format(type(geometry))
+        assert(load_geometry(12) is None), 'load_geometry failed to reject an invalid geometry'
@@ -0,0 +1,92 @@
+'''
+Test for streaming point indexing of CSV and Parquet files.
+
+© Regents of the University of Minnesota. All rights reserved.
+This software is released under an Apache 2.0 license. Further details about the Apache 2.0 license are available in the license.txt file.
+'''
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from tests.conftest import TestDict
+
+from gemsgrid.dggs.grid_addressing import geos_to_grid_ids
+from gemsgrid.processing_tools.index_points import stream_grid_ids, index_points_file
+
+def _points_df(geos):
+    coords = np.array(geos)
+    return pd.DataFrame({'obs': np.arange(coords.shape[0]), 'lon': coords[:, 0], 'lat': coords[:, 1]})
+
+class TestStreamGridIds(TestDict):
+    def test_stream_grid_ids_csv(self, tmp_path):
+        in_path = tmp_path / 'points.csv'
+        _points_df(self._test_dict[6]['geos']).to_csv(in_path, index=False)
+
+        chunks = list(stream_grid_ids(str(in_path), level = 6, chunk_size = 5))
+        assert ([len(chunk) for chunk in chunks] == [5, 5, 5, 1]), \
+            'stream_grid_ids did not read the file in chunks of chunk_size rows'
+
+        result = pd.concat(chunks)
+        assert (result['grid_id'].tolist() == self._test_dict[6]['grid_ids']), \
+            'stream_grid_ids did not return expected grid IDs'
+        assert (result['obs'].tolist() == list(range(16))), 'stream_grid_ids did not keep the input columns'
+
+    def test_stream_grid_ids_multi_level(self, tmp_path):
+        in_path = tmp_path / 'points.csv'
+        _points_df(self._test_dict[6]['geos']).to_csv(in_path, index=False)
+
+        result = pd.concat(stream_grid_ids(str(in_path), level = [0, 6], chunk_size = 7, packed = True))
+        for lv in [0, 6]:
+            valid = geos_to_grid_ids(self._test_dict[6]['geos'], level = lv, packed = True)['result']['data']
+            assert (np.array_equal(result[f'grid_id_L{lv}'].to_numpy(), valid)), \
+                'stream_grid_ids did not return expected packed grid IDs for level {}'.format(lv)
+
+    def test_stream_grid_ids_invalid(self, tmp_path):
+        in_path = tmp_path / 'points.csv'
+        pd.DataFrame({'lon': [0.0, 189.0], 'lat': [0.0, 0.0]}).to_csv(in_path, index=False)
+
+        with pytest.raises(ValueError):
+            list(stream_grid_ids(str(in_path)))
+
+        with pytest.raises(ValueError):
+            list(stream_grid_ids(str(in_path), level = 7))
+
+class TestIndexPointsFile(TestDict):
+    def test_index_points_file_csv(self, tmp_path):
+        in_path = tmp_path / 'points.csv'
+        out_path = tmp_path / 'points_gems.csv'
+        _points_df(self._test_dict[3]['geos']).to_csv(in_path, index=False)
+
+        result = index_points_file(str(in_path), str(out_path), level = 3, chunk_size = 3, columns = ['obs'])
+        assert (result['success'] and result['result']['data']['rows'] == 16), \
+            'index_points_file did not index every row'
+
+        out = pd.read_csv(out_path)
+        assert (out.columns.tolist() == ['obs', 'lon', 'lat', 'grid_id']), \
+            'index_points_file did not write the expected columns'
+        assert (out['grid_id'].tolist() == self._test_dict[3]['grid_ids']), \
+            'index_points_file did not write expected grid IDs'
+
+    def test_index_points_file_parquet(self, tmp_path):
+        pytest.importorskip('pyarrow')
+        in_path = tmp_path / 'points.parquet'
+        out_path = tmp_path / 'points_gems.parquet'
+        _points_df(self._test_dict[6]['geos']).to_parquet(in_path, index=False)
+
+        result = index_points_file(str(in_path), str(out_path), level = 6, chunk_size = 4)
+        assert (result['success']), 'index_points_file failed on a Parquet file'
+
+        out = pd.read_parquet(out_path)
+        assert (out['grid_id'].tolist() == self._test_dict[6]['grid_ids']), \
+            'index_points_file did not write expected grid IDs to Parquet'
+
+    def test_index_points_file_invalid(self, tmp_path):
+        in_path = tmp_path / 'points.csv'
+        pd.DataFrame({'lon': [0.0, 189.0], 'lat': [0.0, 0.0]}).to_csv(in_path, index=False)
+
+        result = index_points_file(str(in_path), str(tmp_path / 'out.csv'))
+        assert (not result['success']), 'index_points_file failed to detect invalid coordinates'
+
+        result = index_points_file(str(in_path), str(tmp_path / 'out.shp'))
+        assert (not result['success']), 'index_points_file failed to detect an unsupported output format'